@@ -0,0 +1,107 @@
+"""
+Micro-benchmark of the sliding window limiters.
+
+Starts N concurrent callers against each limiter and reports throughput,
+p50/p99 wait time and the worst number of acquisitions seen in any window
+(which must never exceed the configured rate). The windows are checked on
+the times the limiters have granted, not on the times the callers woke up at:
+event loop lateness would compress the gap between a late batch and the next
+on-time one.
+
+--loop-load adds a task taking that many milliseconds of CPU per event loop
+iteration, like the request handlers sharing the loop in the app. On an idle
+loop both limiters reach the configured rate. Under load the lock of
+AsyncSlidingWindowLimiter is handed from one sleeping waiter to the next
+once per loop iteration, so it can't grant more than one slot per iteration
+(about 1000/s at 1 ms), while the waiters of AsyncReservationLimiter sleep
+concurrently and all the due ones wake up in the same iteration.
+
+Usage:
+    python -m benchmarks.limiters --callers 2000 --rate 200 --period 0.1 --loop-load 0 1
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from datetime import timedelta
+
+from utils.limiters import AsyncSlidingWindowLimiter, AsyncReservationLimiter
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def max_in_window(timestamps: list[float], period: float) -> int:
+    timestamps = sorted(timestamps)
+    worst, left = 0, 0
+    for right, ts in enumerate(timestamps):
+        while ts - timestamps[left] >= period:
+            left += 1
+        worst = max(worst, right - left + 1)
+    return worst
+
+
+async def acquire_slot(limiter: AsyncSlidingWindowLimiter | AsyncReservationLimiter) -> float:
+    """
+    :return: The time the limiter has granted the call at, as recorded in its window.
+    """
+    if isinstance(limiter, AsyncReservationLimiter):
+        delay = limiter.reserve()
+        slot = limiter.timestamps[-1]
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return slot
+    await limiter.acquire()
+    return limiter.timestamps[-1]  # Appended right before the lock was released, no await since
+
+
+async def loop_load(load: float, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        busy_until = time.perf_counter() + load
+        while time.perf_counter() < busy_until:
+            pass
+        await asyncio.sleep(0)
+
+
+async def run(limiter_cls, callers: int, rate: int, period: float, load: float) -> None:
+    limiter = limiter_cls(rate=rate, period=timedelta(seconds=period))
+    stop = asyncio.Event()
+    load_task = asyncio.create_task(loop_load(load, stop)) if load > 0 else None
+    waits: list[float] = []
+    granted: list[float] = []
+
+    async def caller():
+        started = time.monotonic()
+        granted.append(await acquire_slot(limiter))
+        waits.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(caller() for _ in range(callers)))
+    elapsed = time.monotonic() - started
+    stop.set()
+    if load_task is not None:
+        await load_task
+
+    print(f"{limiter_cls.__name__:>27} (load {load * 1000:.1f} ms): {callers / elapsed:8.1f} acquisitions/s, "
+          f"p50 wait {percentile(waits, 50):.3f}s, p99 wait {percentile(waits, 99):.3f}s, "
+          f"max per window {max_in_window(granted, period - 1e-9)}/{rate}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=2000)
+    parser.add_argument("--rate", type=int, default=200)
+    parser.add_argument("--period", type=float, default=0.1, help="Window duration, seconds.")
+    parser.add_argument("--loop-load", type=float, nargs="+", default=[0, 1],
+                        help="CPU time taken by other tasks per event loop iteration, milliseconds.")
+    args = parser.parse_args()
+
+    for load in args.loop_load:
+        for limiter_cls in (AsyncSlidingWindowLimiter, AsyncReservationLimiter):
+            asyncio.run(run(limiter_cls, args.callers, args.rate, args.period, load / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local stand-ins for Leader-ID, Usedesk and the Telegram Bot API.
+
+Each upstream is a small FastAPI app answering the endpoints the bot calls with
+canned payloads after a configurable latency. Calls are counted per endpoint:
+GET /__stats returns the counters, POST /__reset clears them.
+
+Usage:
+    python -m benchmarks.loadtest.mock_upstreams leader --port 9001 --latency 0.02
+"""
+import argparse
+import asyncio
+import base64
+import time
+import zlib
+
+from collections import Counter
+
+import orjson
+import uvicorn
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+
+BLOCKED_STATUS = 8
+
+
+def create_app(latency: float) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.state.calls = Counter()
+
+    @app.middleware("http")
+    async def count_calls(request: Request, call_next):
+        if request.url.path.startswith("/__"):
+            return await call_next(request)
+        await asyncio.sleep(latency)
+        response = await call_next(request)
+        route = request.scope.get("route")  # Set by the router, counted by the path template
+        path = route.path if route else request.url.path
+        if "method" in request.path_params:  # Bot API calls are counted per method, not per token
+            path = path.replace("{token}", "<token>").replace("{method}", request.path_params["method"])
+        app.state.calls[f"{request.method} {path}"] += 1
+        return response
+
+    @app.get("/__stats")
+    async def stats():
+        return dict(app.state.calls)
+
+    @app.post("/__reset")
+    async def reset():
+        app.state.calls.clear()
+        return {}
+
+    return app
+
+
+def user_id_from_email(email: str) -> int:
+    return zlib.crc32(email.encode()) % 10_000_000 + 1
+
+
+def create_leader_app(latency: float) -> FastAPI:
+    app = create_app(latency)
+
+    @app.post("/auth/login")
+    async def login():
+        payload = base64.urlsafe_b64encode(orjson.dumps({"exp": int(time.time()) + 3600})).decode().rstrip("=")
+        return {"data": {"access_token": f"eyJhbGciOiJIUzI1NiJ9.{payload}.signature"}}
+
+    @app.get("/admin/users")
+    async def search_users(query: str = "", paginationSize: int = 1):
+        if "@" not in query:
+            return {"data": {"_items": []}}
+        return {"data": {"_items": [{"id": user_id_from_email(query), "email": query}]}}
+
+    @app.get("/admin/users/{user_id}")
+    async def get_user(user_id: int):
+        return {"data": {
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "name": "Load Test",
+            "status": BLOCKED_STATUS,
+            "birthday": "2000-01-01T00:00:00",
+            "emailConfirmed": True,
+            "agreement": True,
+            "lastSeen": "2024-01-01T00:00:00",
+            "createdAt": "2020-01-01T00:00:00",
+        }}
+
+    @app.post("/admin/users/refresh-verification-profile")
+    async def refresh_verification_profile():
+        return {"data": {"success": True}}
+
+    @app.post("/admin/users/approve-profile")
+    async def approve_profile():
+        return {"data": {"success": True}}
+
+    return app
+
+
+def create_usedesk_app(latency: float) -> FastAPI:
+    app = create_app(latency)
+
+    @app.post("/create/comment")
+    async def create_comment(request: Request):
+        await request.body()  # Multipart upload with the attachments
+        return {"status": "success", "comment_id": 1}
+
+    @app.post("/update/ticket")
+    async def update_ticket():
+        return {"status": "success"}
+
+    return app
+
+
+def create_telegram_app(latency: float) -> FastAPI:
+    app = create_app(latency)
+    bot_user = {"id": 123456, "is_bot": True, "first_name": "Leader bot", "username": "leader_bot"}
+
+    @app.post("/bot{token}/{method}")
+    async def bot_method(method: str):
+        method = method.lower()
+        if method == "getme":
+            result = bot_user
+        elif method == "sendmessage":
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"},
+                      "from": bot_user, "text": "ok"}
+        else:
+            result = True  # setWebhook, setMyCommands, deleteMessage, ...
+        return {"ok": True, "result": result}
+
+    return app
+
+
+UPSTREAMS = {
+    "leader": create_leader_app,
+    "usedesk": create_usedesk_app,
+    "telegram": create_telegram_app,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("upstream", choices=UPSTREAMS)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=0.02, help="Response delay, seconds")
+    args = parser.parse_args()
+    uvicorn.run(UPSTREAMS[args.upstream](args.latency), host="127.0.0.1", port=args.port, log_level="warning")
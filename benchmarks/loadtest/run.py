@@ -0,0 +1,332 @@
+"""
+End-to-end load test of the app against local upstream stand-ins.
+
+Starts the mock Leader-ID, Usedesk and Telegram Bot API servers (mock_upstreams.py)
+and the app itself (uvicorn main:app) as subprocesses on free local ports, then drives
+a scenario at the given concurrency and reports throughput, p50/p95/p99 latency,
+errors and the number of calls every upstream endpoint received.
+
+Scenarios:
+    reactivate  POST /api/v1/user/reactivate-and-notify, a new ticket and email per request
+    webhook     POST <BOT_WEBHOOK_PATH>, a /help message update per request
+
+The upstream rate limits are lifted by default (<NAME>_RATE_LIMIT), --keep-limits measures
+with the production ones. Background jobs and updates are drained before the upstream
+counters are read.
+
+All the processes share the machine, so the report also has the CPU time each of them
+has spent (Linux only). When the CPUs are saturated, the throughput is about
+CPUs / total CPU time per request whatever the upstream latency, and by Little's law
+the latency grows with the concurrency: p50 ~ concurrency / throughput. E.g. on one CPU
+a reactivation costs ~27 ms of CPU in total (17 in the app making 6 upstream calls, 7 in
+the mocks serving them, 3 in the driver), which gives ~36 req/s and a p50 of ~500 ms
+at concurrency 20 even with --latency 0, while a single request takes ~22 ms.
+
+Exit code 1 if a threshold is crossed: --max-errors and --max-upstream-calls (upstream calls
+per request, deterministic for a scenario) catch regressions anywhere; --min-throughput and
+--max-p99-ms depend on the machine and are off by default.
+
+Usage:
+    python -m benchmarks.loadtest.run --scenario reactivate --requests 2000 --concurrency 50
+    python -m benchmarks.loadtest.run --scenario webhook --output loadtest-webhook.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[2]
+UPSTREAMS = ("leader", "usedesk", "telegram")
+BOT_TOKEN = "123456:load-test-token"
+WEBHOOK_PATH = "/webhook"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """
+    :return: User and system CPU time of the process, None if /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def cpu_usage(pids: dict[str, int]) -> dict[str, float | None]:
+    usage = {name: cpu_seconds(pid) for name, pid in pids.items()}
+    usage["driver"] = time.process_time()
+    return usage
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def app_env(ports: dict[str, int], keep_limits: bool) -> dict[str, str]:
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "BOT_TOKEN": BOT_TOKEN,
+        "BOT_API_SERVER": f"http://127.0.0.1:{ports['telegram']}",
+        "BOT_WEBHOOK_HOST": "http://127.0.0.1",
+        "BOT_WEBHOOK_PATH": WEBHOOK_PATH,
+        "TEAM_TELEGRAM_CHAT_ID": "1",
+        "LEADER_ID_API_HOST": f"http://127.0.0.1:{ports['leader']}",
+        "LEADER_ID_ADMIN_EMAIL": "admin@example.com",
+        "LEADER_ID_ADMIN_PASSWORD": "password",
+        "USEDESK_API_HOST": f"http://127.0.0.1:{ports['usedesk']}",
+        "USEDESK_API_TOKEN": "usedesk-token",
+        "USEDESK_PAVEL_ID": "1",
+        "USEDESK_DENIS_ID": "2",
+        "USEDESK_NIKA_ID": "3",
+        "TELEGRAM_API_HOST": f"http://127.0.0.1:{ports['telegram']}",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    if not os.getenv("REDIS_HOST"):
+        env["JOB_QUEUE_BACKEND"] = "memory"  # The only backend that needs Redis by default
+    if not keep_limits:
+        for upstream in UPSTREAMS:
+            env.setdefault(f"{upstream.upper()}_RATE_LIMIT", "1000000")
+        # Outbound Telegram messages are limited per chat and globally by TelegramDispatcher
+        for limit in ("TELEGRAM_GLOBAL_RATE", "TELEGRAM_CHAT_RATE", "TELEGRAM_GROUP_RATE"):
+            env.setdefault(limit, "1000000")
+    return env
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} is not ready after {timeout}s")
+
+
+@asynccontextmanager
+async def running_stack(latency: float, keep_limits: bool, workers: int):
+    """
+    Starts the upstream mocks and the app, yields the base urls and the pids, stops everything on exit.
+    """
+    ports = {name: free_port() for name in (*UPSTREAMS, "app")}
+    processes = {}
+    try:
+        for name in UPSTREAMS:
+            processes[name] = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.loadtest.mock_upstreams", name,
+                 "--port", str(ports[name]), "--latency", str(latency)],
+                cwd=ROOT)
+        processes["app"] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(ports["app"]),
+             "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT, env=app_env(ports, keep_limits))
+
+        urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+        async with httpx.AsyncClient() as client:
+            for name in UPSTREAMS:
+                await wait_ready(client, f"{urls[name]}/__stats", processes[name])
+            await wait_ready(client, f"{urls['app']}/", processes["app"])
+            for name in UPSTREAMS:
+                await client.post(f"{urls[name]}/__reset")  # Drop the startup calls
+        yield urls, {name: process.pid for name, process in processes.items()}
+    finally:
+        # The app first: on shutdown it still sends the buffered notifications to the Telegram mock
+        for name in sorted(processes, key=lambda name: name != "app"):
+            processes[name].terminate()
+            if name == "app":
+                try:
+                    processes[name].wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    pass
+        for process in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def reactivate_request(i: int) -> tuple[str, dict]:
+    ticket = {"id": str(i), "subject": "Разблокировка профиля", "client_email": f"user{i}@example.com", "status": "1"}
+    return "/api/v1/user/reactivate-and-notify", ticket
+
+
+def webhook_request(i: int) -> tuple[str, dict]:
+    update = {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Load Test"},
+            "text": "/help",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        },
+    }
+    return WEBHOOK_PATH, update
+
+
+SCENARIOS = {
+    "reactivate": reactivate_request,
+    "webhook": webhook_request,
+}
+
+
+async def drive(base_url: str, scenario: str, requests: int, concurrency: int) -> dict:
+    make_request = SCENARIOS[scenario]
+    latencies: list[float] = []
+    statuses: dict[int | str, int] = {}
+    counter = iter(range(1, requests + 1))
+    # Unique ids per run, the app deduplicates webhook updates and job idempotency keys
+    offset = int(time.time() * 1000) % 1_000_000_000
+
+    async def caller(client: httpx.AsyncClient) -> None:
+        for i in counter:
+            path, body = make_request(offset + i)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                status = response.status_code
+            except httpx.HTTPError as exc:
+                status = exc.__class__.__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(caller(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+async def upstream_calls(urls: dict[str, str], settle: float, timeout: float = 60) -> dict:
+    """
+    Waits until no upstream gets new calls for `settle` seconds (the background work is drained).
+    """
+    async with httpx.AsyncClient() as client:
+        previous, deadline = None, time.monotonic() + timeout
+        while True:
+            calls = {name: (await client.get(f"{urls[name]}/__stats")).json() for name in UPSTREAMS}
+            if calls == previous or time.monotonic() > deadline:
+                return calls
+            previous = calls
+            await asyncio.sleep(settle)
+
+
+def print_report(result: dict) -> None:
+    print(f"{result['scenario']}: {result['requests']} requests, concurrency {result['concurrency']}")
+    print(f"  throughput  {result['throughput_rps']} req/s ({result['elapsed_s']} s)")
+    print(f"  latency     p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms")
+    print(f"  statuses    {result['statuses']}")
+    if result["cpu"]["ms_per_request"]:
+        cpu = ", ".join(f"{name} {ms}" for name, ms in result["cpu"]["ms_per_request"].items())
+        print(f"  cpu         ms per request: {cpu} ({result['cpu']['cpus']} CPUs)")
+    print("  upstream calls")
+    for upstream, calls in result["upstream_calls"].items():
+        for endpoint, count in sorted(calls.items()):
+            print(f"    {upstream:<10}{endpoint:<55}{count:>8}")
+
+
+def cpu_report(before: dict, after: dict, requests: int) -> dict:
+    """
+    :return: CPU milliseconds per request of every process and in total, None without /proc.
+             With --workers above 1 the app figure is only the uvicorn supervisor, the workers are its children.
+    """
+    if any(value is None for value in (*before.values(), *after.values())):
+        return {"cpus": os.cpu_count(), "ms_per_request": None}
+    per_request = {name: round((after[name] - before[name]) * 1000 / requests, 2) for name in before}
+    per_request["total"] = round(sum(per_request.values()), 2)
+    return {"cpus": os.cpu_count(), "ms_per_request": per_request}
+
+
+def check_thresholds(result: dict, args: argparse.Namespace) -> list[str]:
+    """
+    :return: Descriptions of the crossed thresholds.
+    """
+    failures = []
+    errors = sum(count for status, count in result["statuses"].items() if not status.startswith("2"))
+    if errors > args.max_errors:
+        failures.append(f"{errors} failed requests > {args.max_errors}")
+    calls = sum(count for endpoints in result["upstream_calls"].values() for count in endpoints.values())
+    calls_per_request = calls / result["requests"]
+    if args.max_upstream_calls is not None and calls_per_request > args.max_upstream_calls:
+        failures.append(f"{calls_per_request:.2f} upstream calls per request > {args.max_upstream_calls}")
+    if args.min_throughput is not None and result["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {result['throughput_rps']} req/s < {args.min_throughput}")
+    if args.max_p99_ms is not None and result["p99_ms"] > args.max_p99_ms:
+        failures.append(f"p99 {result['p99_ms']} ms > {args.max_p99_ms}")
+    return failures
+
+
+async def main(args: argparse.Namespace) -> int:
+    async with running_stack(args.latency, args.keep_limits, args.workers) as (urls, pids):
+        await drive(urls["app"], args.scenario, min(args.warmup, args.requests), args.concurrency)
+        async with httpx.AsyncClient() as client:
+            await upstream_calls(urls, args.settle)
+            for name in UPSTREAMS:
+                await client.post(f"{urls[name]}/__reset")
+
+        cpu_before = cpu_usage(pids)
+        result = {"scenario": args.scenario, "upstream_latency_s": args.latency,
+                  **await drive(urls["app"], args.scenario, args.requests, args.concurrency)}
+        result["upstream_calls"] = await upstream_calls(urls, args.settle)
+        # Includes the background work drained above, it's part of the cost of the requests
+        result["cpu"] = cpu_report(cpu_before, cpu_usage(pids), args.requests)
+
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    failures = check_thresholds(result, args)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="reactivate")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+    parser.add_argument("--latency", type=float, default=0.02, help="Upstream response delay, seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the app")
+    parser.add_argument("--keep-limits", action="store_true", help="Keep the production upstream rate limits")
+    parser.add_argument("--settle", type=float, default=1.0, help="Quiet period meaning the background work is done")
+    parser.add_argument("--max-errors", type=int, default=0, help="Exit with 1 if more requests fail")
+    parser.add_argument("--max-upstream-calls", type=float,
+                        help="Exit with 1 if the upstreams get more calls per request (incl. the background jobs)")
+    parser.add_argument("--min-throughput", type=float, help="Exit with 1 below this throughput, req/s")
+    parser.add_argument("--max-p99-ms", type=float, help="Exit with 1 above this p99 latency, ms")
+    parser.add_argument("--output", help="Write the result as JSON")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,88 @@
+"""
+Concurrency stress benchmark for UserService.
+
+Runs many "tickets" concurrently on one event loop, the same way
+/api/v1/user/reactivate-and-notify does (load_user -> reactivate), against a fake
+Leader-ID client with random latency, and counts cross-talk between requests.
+
+Usage:
+    python -m benchmarks.user_service_concurrency --tickets 500
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from services.leader_service import LeaderServices, UserService
+
+
+class FakeLeaderAPIClient:
+    def __init__(self, max_latency: float):
+        self.max_latency = max_latency
+        self.unlocked: list[int] = []
+
+    async def _latency(self):
+        await asyncio.sleep(random.uniform(0, self.max_latency))
+
+    async def get_user(self, user: str | int, use_cache: bool = True) -> dict:
+        await self._latency()
+        user_id = int(str(user).split("@")[0].removeprefix("user"))
+        return {"data": {"id": user_id,
+                         "email": f"user{user_id}@example.com",
+                         "name": None,
+                         "status": 8,
+                         "birthday": "2000-01-01T00:00:00",
+                         "emailConfirmed": True,
+                         "agreement": True,
+                         "lastSeen": None,
+                         "createdAt": None}}
+
+    async def unlocking_user(self, user: int, check_existence=False) -> dict:
+        await self._latency()
+        self.unlocked.append(user)
+        return {}
+
+    async def approve_user(self, user: int, check_existence=False) -> dict:
+        await self._latency()
+        return {}
+
+
+async def handle_ticket(user_service: UserService, email: str) -> bool:
+    await user_service.load_user(email, use_cache=False)
+    loaded_email = user_service.user.email
+    await user_service.reactivate()
+    return loaded_email == email and user_service.user.email == email
+
+
+async def run(tickets: int, max_latency: float, shared: bool) -> None:
+    api_client = FakeLeaderAPIClient(max_latency)
+    leader_services = LeaderServices(api_client)
+    shared_service = leader_services.create_user_service()
+
+    emails = [f"user{i}@example.com" for i in range(1, tickets + 1)]
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        handle_ticket(shared_service if shared else leader_services.create_user_service(), email)
+        for email in emails
+    ))
+    elapsed = time.perf_counter() - started
+
+    crosstalk = results.count(False)
+    mode = "shared instance" if shared else "per-request"
+    print(f"{mode:>16}: {tickets} tickets in {elapsed:.3f}s, "
+          f"cross-talk: {crosstalk}, unlock calls: {len(api_client.unlocked)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--max-latency", type=float, default=0.05, help="Fake upstream latency, seconds.")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.tickets, args.max_latency, shared=True))
+    asyncio.run(run(args.tickets, args.max_latency, shared=False))
+
+
+if __name__ == "__main__":
+    main()
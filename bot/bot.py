@@ -1,11 +1,15 @@
+import html
+
+import httpx
+
 from aiogram import Router, types
 from aiogram.filters import CommandObject, Command
 
-from utils.api_clients.base_api_client import BaseAPIClient
+from services.leader_service import LeaderServices
 
-router = Router()
+from utils.api_clients.leader_api_client import InvalidTokenException
 
-api_client = BaseAPIClient()
+router = Router()
 
 
 @router.message(Command(commands=["help"]))
@@ -20,21 +24,28 @@ async def help_command(message: types.Message):
 
 
 @router.message(Command(commands=["auth"]))
-async def auth_command(message: types.Message, command: CommandObject):
+async def auth_command(message: types.Message, command: CommandObject, leader_services: LeaderServices):
     token = command.args
 
-    if not token or "eyJ0eXAiOi...Lbs" in token:
-        text = "Необходимы дополнительные аргументы.\n" \
-               "Пример:\n" \
-               "<code>/auth eyJ0eXAiOi...Lbs</code>\n" \
-               "или\n" \
-               "<code>/auth Bearer eyJ0eXAiOi...Lbs</code>"
-
-    else:
-        url = "https://seal-pavel.website/leader/api/v1/token/update"
-        data = {"token": token}
-        res = await api_client.make_request(method="POST", endpoint=url, json=data)
-        text = res.json().get("message", res.text)
-
-    await message.answer(disable_notification=True, text=text)
-    await message.delete()
+    try:
+        if not token or "eyJ0eXAiOi...Lbs" in token:
+            text = "Необходимы дополнительные аргументы.\n" \
+                   "Пример:\n" \
+                   "<code>/auth eyJ0eXAiOi...Lbs</code>\n" \
+                   "или\n" \
+                   "<code>/auth Bearer eyJ0eXAiOi...Lbs</code>"
+
+        else:
+            try:
+                await leader_services.update_token(token)
+                text = "Token successfully set"
+            except InvalidTokenException:
+                text = "Токен недействителен"
+            except httpx.HTTPError as exc:
+                # The reply is HTML, the error text may contain the URL and the response body
+                text = f"Не удалось проверить токен: {html.escape(str(exc))}"
+
+        await message.answer(disable_notification=True, text=text)
+    finally:
+        # The token must not stay in the chat, whatever has happened to the check
+        await message.delete()
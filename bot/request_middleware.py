@@ -0,0 +1,36 @@
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from utils.telegram_dispatcher import TelegramDispatcher
+
+# Methods producing a message in the chat, only they count towards the chat limits
+LIMITED_METHOD_PREFIXES = ("send", "forward", "copy")
+
+
+class OutboundLimitsMiddleware(BaseRequestMiddleware):
+    """
+    aiogram session middleware sending the bot's messages through TelegramDispatcher,
+    so the handlers' replies share the chat and global limits with TelegramAPIClient.
+    """
+
+    def __init__(self, dispatcher: TelegramDispatcher):
+        self.dispatcher = dispatcher
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        return await self.dispatcher.send(chat_id,
+                                          lambda: make_request(bot, method),
+                                          get_retry_after=get_retry_after)
+
+
+def get_retry_after(exc: Exception) -> float | None:
+    return float(exc.retry_after) if isinstance(exc, TelegramRetryAfter) else None
@@ -0,0 +1,119 @@
+import time
+import asyncio
+
+from aiogram import Bot, Dispatcher, types
+
+from utils.cache import create_cache
+from utils.logger import get_logger, request_id_var
+from utils.metrics import TELEGRAM_UPDATES, TELEGRAM_UPDATE_QUEUE_DEPTH, TELEGRAM_UPDATE_SECONDS
+from utils.tracing import inject_context, start_span, use_context
+
+logger = get_logger(__name__)
+
+# Values of the update ids in the dedup cache
+UPDATE_PENDING = "pending"  # Being put into the queue
+UPDATE_ACCEPTED = "accepted"
+UPDATE_PENDING_MARGIN = 30  # Seconds a pending update is remembered beyond the put timeout
+
+
+class UpdateQueueFullException(Exception):
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+        super().__init__(f"Update queue is full, update {update_id} was not accepted.")
+
+
+class UpdateQueue:
+    def __init__(self,
+                 dp: Dispatcher,
+                 bot: Bot,
+                 workers: int = 8,
+                 maxsize: int = 1000,
+                 put_timeout: float = 1.0,
+                 dedup_ttl: float = 24 * 60 * 60):
+        """
+        Bounded queue of incoming Telegram updates, processed by a pool of workers.
+
+        :param workers: Number of updates processed concurrently.
+        :param maxsize: Queue capacity. When it is full, put() waits up to put_timeout and then raises
+                        UpdateQueueFullException, so the webhook answers with an error and Telegram redelivers later.
+        :param dedup_ttl: How long (in seconds) a processed update_id is remembered to drop redelivered updates.
+        """
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.queue: asyncio.Queue[types.Update] = asyncio.Queue(maxsize=maxsize)
+        TELEGRAM_UPDATE_QUEUE_DEPTH.set_function(self.queue.qsize)
+        self.seen_updates = create_cache("telegram_update", maxsize=maxsize * 10, ttl=dedup_ttl)
+        self.tasks: list[asyncio.Task] = []
+        self.is_accepting = False
+
+    async def start(self) -> None:
+        self.is_accepting = True
+        self.tasks = [asyncio.create_task(self._worker(), name=f"update-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stops accepting updates and waits (up to timeout) for the queued ones to be processed.
+        """
+        self.is_accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Update queue was not drained in %ss, %s updates dropped.", timeout, self.queue.qsize())
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def put(self, update: types.Update) -> bool:
+        """
+        :return: False if the update is a duplicate and was dropped.
+        :raises UpdateQueueFullException: The update wasn't accepted, Telegram should redeliver it later.
+        """
+        key = str(update.update_id)
+        # Reserved before the put: a redelivery arriving while the put waits must not be queued a second time
+        # (for a short time: if the process dies in the middle, the redeliveries must not be rejected for long)
+        if not await self.seen_updates.add(key, UPDATE_PENDING, ttl=self.put_timeout + UPDATE_PENDING_MARGIN):
+            if await self.seen_updates.get(key) == UPDATE_PENDING:
+                # The first delivery may still be rejected, this one is asked to come back later instead of dropped
+                TELEGRAM_UPDATES.labels("rejected").inc()
+                raise UpdateQueueFullException(update.update_id)
+            logger.info("Duplicate update %s dropped.", update.update_id)
+            TELEGRAM_UPDATES.labels("duplicate").inc()
+            return False
+
+        try:
+            if not self.is_accepting:
+                raise UpdateQueueFullException(update.update_id)
+            # The trace context goes along, so the handler spans join the webhook request trace
+            await asyncio.wait_for(self.queue.put((update, inject_context())), self.put_timeout)
+        except BaseException as exc:  # Cancelled webhook requests too
+            # Forget the update, otherwise the redelivery would be dropped too
+            await self.seen_updates.delete(key)
+            TELEGRAM_UPDATES.labels("rejected").inc()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise UpdateQueueFullException(update.update_id) from None
+            raise
+
+        await self.seen_updates.set(key, UPDATE_ACCEPTED)
+        TELEGRAM_UPDATES.labels("accepted").inc()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            update, trace_context = await self.queue.get()
+            started = time.perf_counter()
+            request_id_var.set(f"update-{update.update_id}")
+            try:
+                with use_context(trace_context), start_span("telegram update", update_id=update.update_id):
+                    await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception("Error while processing update %s: %s", update.update_id, e)
+            finally:
+                TELEGRAM_UPDATE_SECONDS.observe(time.perf_counter() - started)
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "maxsize": self.queue.maxsize, "workers": len(self.tasks)}
@@ -3,12 +3,13 @@ from fastapi import Request, Depends
 from models.ticket import TicketRequest
 
 from utils.logger import get_logger
+from utils.tracing import traced
 
 logger = get_logger(__name__)
 
 
 def usedesk_service_dependency(request: Request):
-    logger.debug(f"logger in usedesk_service_dependency")
+    logger.debug("logger in usedesk_service_dependency")
     return request.app.state.usedesk_service
 
 
@@ -16,7 +17,7 @@ def usedesk_service_dependency(request: Request):
 
 
 def telegram_service_dependency(request: Request):
-    logger.debug(f"logger in telegram_service_dependency")
+    logger.debug("logger in telegram_service_dependency")
     return request.app.state.telegram_service
 
 
@@ -25,21 +26,39 @@ def telegram_service_dependency(request: Request):
 
 # TODO: Сделать типа load_ticket (usedesk_service.py)
 async def ticket_request_dependency(ticket_request: TicketRequest):
-    logger.debug(f"logger in ticket_request_dependency")
+    logger.debug("logger in ticket_request_dependency")
     return ticket_request
 
 
 # TODO: Нельзя использовать зависимость в во всех ручках. Для нее сейчас требуются конкретно данные из тикета Usedesk.
+@traced()
 async def user_service_dependency(request: Request, ticket_request: TicketRequest = Depends(ticket_request_dependency)):
-    logger.debug(f"logger in user_service_dependency")
-    logger.debug(f"{ticket_request=}")
-    user_service = request.app.state.leader_services.user_service
-    await user_service.load_user(ticket_request.client_email)
+    logger.debug("logger in user_service_dependency")
+    logger.debug("ticket_request=%r", ticket_request)
+    user_service = request.app.state.leader_services.create_user_service()
+    await user_service.load_user(ticket_request.client_email, use_cache=False)
     return user_service
 
 
 # -------------------
 
 def event_service_dependency(request: Request):
-    logger.debug(f"logger in event_service_dependency")
+    logger.debug("logger in event_service_dependency")
     return request.app.state.leader_services.event_service
+
+
+# -------------------
+
+def job_queue_dependency(request: Request):
+    logger.debug("logger in job_queue_dependency")
+    return request.app.state.job_queue
+
+
+def reactivation_service_dependency(request: Request):
+    logger.debug("logger in reactivation_service_dependency")
+    return request.app.state.reactivation_service
+
+
+def blocked_users_scan_dependency(request: Request):
+    logger.debug("logger in blocked_users_scan_dependency")
+    return request.app.state.blocked_users_scan
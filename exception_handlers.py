@@ -3,11 +3,12 @@ import httpx
 
 from fastapi import HTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.requests import Request
 
-from utils.api_clients.leader_api_client import UserNotFoundException, CaptchaNotSetException
+from utils.api_clients.leader_api_client import UserNotFoundException, CaptchaNotSetException, InvalidTokenException
 from utils.api_clients.telegram_api_client import TelegramAPIClient
+from utils.circuit_breaker import CircuitOpenException
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -17,8 +18,8 @@ TEAM_TELEGRAM_CHAT_ID = os.getenv('TEAM_TELEGRAM_CHAT_ID')
 
 async def fastapi_http_exception_handler(request: Request, exc: HTTPException):
     logger.error(
-        f"HTTPException: status code {exc.status_code}, detail: {exc.detail}, path: {request.url.path}")
-    return JSONResponse(
+        "HTTPException: status code %s, detail: %s, path: %s", exc.status_code, exc.detail, request.url.path)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"message": exc.detail}
     )
@@ -26,7 +27,8 @@ async def fastapi_http_exception_handler(request: Request, exc: HTTPException):
 
 async def httpx_http_status_error_handler(request: Request, exc: httpx.HTTPStatusError):
     logger.error(
-        f"httpx.HTTPStatusError: status code {exc.response.status_code}, detail: {exc.response.text}, path: {request.url.path}")
+        "httpx.HTTPStatusError: status code %s, detail: %s, path: %s",
+        exc.response.status_code, exc.response.text, request.url.path)
 
     if exc.response.status_code == 401:
         telegram_api_client: TelegramAPIClient = request.app.state.telegram_api_client
@@ -34,7 +36,7 @@ async def httpx_http_status_error_handler(request: Request, exc: httpx.HTTPStatu
                 "Обновите, пожалуйста, токен командой <code>/auth </code>")
         await telegram_api_client.send_message(text=text, chat_id=TEAM_TELEGRAM_CHAT_ID)
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.response.status_code,
         content={"message": exc.response.text}
     )
@@ -42,8 +44,9 @@ async def httpx_http_status_error_handler(request: Request, exc: httpx.HTTPStatu
 
 async def httpx_request_error_handler(request: Request, exc: httpx.RequestError):
     logger.error(
-        f"httpx.RequestError: Internal server error occurred while making a request: {exc}, path: {request.url.path}")
-    return JSONResponse(
+        "httpx.RequestError: Internal server error occurred while making a request: %s, path: %s",
+        exc, request.url.path)
+    return ORJSONResponse(
         status_code=500,
         content={"message": "Internal server error occurred while making a request."}
     )
@@ -52,12 +55,12 @@ async def httpx_request_error_handler(request: Request, exc: httpx.RequestError)
 async def generic_exception_handler(request: Request, exc: Exception):
     if isinstance(exc, RequestValidationError):
         logger.debug(
-            f"Validation exception: {exc}, path: {request.url.path}")
+            "Validation exception: %s, path: %s", exc, request.url.path)
     else:
         logger.error(
-            f"Unhandled exception: {exc}, path: {request.url.path}")
+            "Unhandled exception: %s, path: %s", exc, request.url.path)
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"message": "Internal Server Error"}
     )
@@ -65,8 +68,8 @@ async def generic_exception_handler(request: Request, exc: Exception):
 
 async def user_not_found_exception_handler(request: Request, exc: UserNotFoundException):
     logger.info(
-        f"UserNotFoundException: {str(exc)}, path: {request.url.path}")
-    return JSONResponse(
+        "UserNotFoundException: %s, path: %s", exc, request.url.path)
+    return ORJSONResponse(
         status_code=404,
         content={"message": str(exc)}
     )
@@ -74,8 +77,27 @@ async def user_not_found_exception_handler(request: Request, exc: UserNotFoundEx
 
 async def captcha_not_set_exception_handler(request: Request, exc: CaptchaNotSetException):
     logger.error(
-        f"CaptchaNotSetException: Captcha error, detail: {exc.message}, path: {request.url.path}")
-    return JSONResponse(
+        "CaptchaNotSetException: Captcha error, detail: %s, path: %s", exc.message, request.url.path)
+    return ORJSONResponse(
         status_code=422,
         content={"message": "Captcha is required", "server_response": exc.message}
     )
+
+
+async def invalid_token_exception_handler(request: Request, exc: InvalidTokenException):
+    logger.info(
+        "InvalidTokenException: %s, path: %s", exc, request.url.path)
+    return ORJSONResponse(
+        status_code=400,
+        content={"message": "Token is invalid"}
+    )
+
+
+async def circuit_open_exception_handler(request: Request, exc: CircuitOpenException):
+    logger.warning(
+        "CircuitOpenException: %s, path: %s", exc, request.url.path)
+    return ORJSONResponse(
+        status_code=503,
+        content={"message": str(exc)},
+        headers={"Retry-After": str(max(int(exc.retry_after), 1))}
+    )
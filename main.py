@@ -2,30 +2,46 @@ import os
 
 import httpx
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
 
 import exception_handlers as eh
 
 from routers.leader.user_router import router as leader_user_router
 from routers.leader.token_router import router as leader_token_router
 
-from utils.api_clients.leader_api_client import LeaderAPIClient, UserNotFoundException, CaptchaNotSetException
+from utils.api_clients.leader_api_client import (LeaderAPIClient, UserNotFoundException, CaptchaNotSetException,
+                                                 InvalidTokenException)
 from utils.api_clients.usedesk_api_client import UsedeskAPIClient
 from utils.api_clients.telegram_api_client import TelegramAPIClient
-from utils.logger import get_logger
+from utils.checkpoint import create_checkpoint_store
+from utils.circuit_breaker import CircuitOpenException
+from utils.job_queue import create_job_queue
+from utils.logger import get_logger, CorrelationIdMiddleware
+from utils.metrics import MetricsMiddleware, collect_app_state, render_metrics
+from utils.redis_client import get_redis
+from utils.telegram_dispatcher import TelegramDispatcher
+from utils.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
 
 from services.leader_service import LeaderServices
 from services.usedesk_service import UsedeskService
 from services.telegram_service import TelegramService
+from services.reactivation_jobs import register_reactivation_jobs
+from services.reactivation_service import ReactivationService
+from services.blocked_users_scan import BlockedUsersScanService
+from services.usedesk_ingestion import UsedeskIngestionService
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.redis import RedisStorage
 
-from redis.asyncio import Redis
-
 from bot.bot import router
+from bot.request_middleware import OutboundLimitsMiddleware
+from bot.update_queue import UpdateQueue, UpdateQueueFullException
 
 from dotenv import load_dotenv
 
@@ -35,6 +51,15 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 BOT_WEBHOOK_HOST = os.getenv('BOT_WEBHOOK_HOST')
 BOT_WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH')
 BOT_WEBHOOK_URL = f"{BOT_WEBHOOK_HOST}{BOT_WEBHOOK_PATH}"
+BOT_API_SERVER = os.getenv('BOT_API_SERVER')
+
+BOT_UPDATE_WORKERS = int(os.getenv('BOT_UPDATE_WORKERS', 8))
+BOT_UPDATE_QUEUE_SIZE = int(os.getenv('BOT_UPDATE_QUEUE_SIZE', 1000))
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+REACTIVATION_BATCH_CONCURRENCY = int(os.getenv('REACTIVATION_BATCH_CONCURRENCY', 10))
+BLOCKED_SCAN_INTERVAL = float(os.getenv('BLOCKED_SCAN_INTERVAL', 0))  # Seconds between scans, 0 disables them
+USEDESK_INGEST_INTERVAL = float(os.getenv('USEDESK_INGEST_INTERVAL', 0))  # Seconds between polls, 0 disables them
 
 TEAM_TELEGRAM_CHAT_ID = os.getenv('TEAM_TELEGRAM_CHAT_ID')
 
@@ -44,11 +69,15 @@ ADMIN_EMAIL = os.getenv('LEADER_ID_ADMIN_EMAIL')
 ADMIN_PASSWORD = os.getenv('LEADER_ID_ADMIN_PASSWORD')
 TOKEN = os.getenv('LEADER_ID_BEARER_TOKEN')
 
-REDIS_HOST = os.getenv('REDIS_HOST')
-
 logger = get_logger(__name__)
 
-app = FastAPI()
+setup_tracing()
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(CorrelationIdMiddleware)
 
 app.add_exception_handler(HTTPException, eh.fastapi_http_exception_handler)
 app.add_exception_handler(httpx.HTTPStatusError, eh.httpx_http_status_error_handler)
@@ -57,15 +86,23 @@ app.add_exception_handler(RequestValidationError, eh.generic_exception_handler)
 app.add_exception_handler(Exception, eh.generic_exception_handler)
 app.add_exception_handler(UserNotFoundException, eh.user_not_found_exception_handler)
 app.add_exception_handler(CaptchaNotSetException, eh.captcha_not_set_exception_handler)
+app.add_exception_handler(InvalidTokenException, eh.invalid_token_exception_handler)
+app.add_exception_handler(CircuitOpenException, eh.circuit_open_exception_handler)
 
 app.include_router(leader_user_router, prefix="/api/v1", tags=["Leader-ID"])
 app.include_router(leader_token_router, prefix="/api/v1", tags=["Leader-ID"])
 
-bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
-r = Redis(host=REDIS_HOST)
-storage = RedisStorage(r)
+# Local Bot API server or a mock (benchmarks/loadtest), api.telegram.org by default
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_SERVER)) if BOT_API_SERVER else None
+bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML, session=bot_session)
+# Outbound message limits of the bot, shared by the handlers' replies and TelegramAPIClient
+telegram_dispatcher = TelegramDispatcher()
+bot.session.middleware(OutboundLimitsMiddleware(telegram_dispatcher))
+redis = get_redis()
+storage = RedisStorage(redis) if redis is not None else MemoryStorage()
 dp = Dispatcher(storage=storage)
 dp.include_router(router)
+update_queue = UpdateQueue(dp, bot, workers=BOT_UPDATE_WORKERS, maxsize=BOT_UPDATE_QUEUE_SIZE)
 
 
 async def set_commands(bot: Bot):
@@ -80,40 +117,87 @@ async def set_commands(bot: Bot):
 async def startup():
     """
     Webhook registration and API clients initialization.
+    All API clients are registered in app.state.api_clients and closed together on shutdown.
     """
-    try:
-        logger.info(f"Webhook URL: {BOT_WEBHOOK_URL}")
-        await bot.set_webhook(BOT_WEBHOOK_URL)
-        await set_commands(bot)
+    await update_queue.start()
 
+    app.state.api_clients = []
+    try:
         # Initialize and authenticate Telegram API client
-        app.state.telegram_api_client = TelegramAPIClient()
+        app.state.telegram_api_client = TelegramAPIClient(dispatcher=telegram_dispatcher)
+        app.state.api_clients.append(app.state.telegram_api_client)
         app.state.telegram_service = TelegramService(app.state.telegram_api_client, TEAM_TELEGRAM_CHAT_ID)
         await app.state.telegram_service.authenticate(BOT_TOKEN)
 
         # Initialize and authenticate Usedesk API client
         app.state.usedesk_api_client = UsedeskAPIClient()
+        app.state.api_clients.append(app.state.usedesk_api_client)
         app.state.usedesk_service = UsedeskService(app.state.usedesk_api_client)
         await app.state.usedesk_service.authenticate(USEDESK_API_TOKEN)
+        await app.state.usedesk_service.preload_attachments()
+
+        # Background jobs: Usedesk reply and team notification after reactivation
+        app.state.job_queue = create_job_queue("reactivation", workers=JOB_WORKERS)
+        register_reactivation_jobs(app.state.job_queue, app.state.usedesk_service, app.state.telegram_service)
+        await app.state.job_queue.start()
 
         # Initialize and authenticate Leader-ID API client.
         try:
             app.state.leader_api_client = LeaderAPIClient()
+            app.state.api_clients.append(app.state.leader_api_client)
             app.state.leader_services = LeaderServices(app.state.leader_api_client)
+            dp["leader_services"] = app.state.leader_services  # Injected into the bot handlers
+            app.state.reactivation_service = ReactivationService(app.state.leader_services,
+                                                                 app.state.job_queue,
+                                                                 concurrency=REACTIVATION_BATCH_CONCURRENCY)
+            app.state.blocked_users_scan = BlockedUsersScanService(app.state.leader_services,
+                                                                   create_checkpoint_store(),
+                                                                   app.state.usedesk_service)
+            app.state.usedesk_ingestion = UsedeskIngestionService(app.state.usedesk_service,
+                                                                  app.state.reactivation_service,
+                                                                  create_checkpoint_store())
             await app.state.leader_services.authenticate(ADMIN_EMAIL, ADMIN_PASSWORD)
 
         except CaptchaNotSetException as exc:
-            logger.error(f"Authentication error: {exc}")
+            logger.error("Authentication error: %s", exc)
 
     except Exception as e:
-        logger.error(f"Error at startup: {e}")
+        logger.error("Error at startup: %s", e)
+
+    if BLOCKED_SCAN_INTERVAL > 0 and hasattr(app.state, "blocked_users_scan"):
+        # Started even if the login has failed: a failed run is repeated after the interval
+        telegram_service = getattr(app.state, "telegram_service", None)
+        app.state.blocked_users_scan.start_schedule(
+            BLOCKED_SCAN_INTERVAL,
+            notify=telegram_service.send_team_message if telegram_service else None)
+
+    if USEDESK_INGEST_INTERVAL > 0 and hasattr(app.state, "usedesk_ingestion"):
+        await app.state.usedesk_ingestion.start(USEDESK_INGEST_INTERVAL)
+
+    try:
+        logger.info("Webhook URL: %s", BOT_WEBHOOK_URL)
+        await bot.set_webhook(BOT_WEBHOOK_URL)
+        await set_commands(bot)
+    except Exception as e:
+        logger.error("Webhook registration error: %s", e)
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    await app.state.leader_api_client.close()
-    await app.state.usedesk_api_client.close()
-    await app.state.telegram_api_client.close()
+    await update_queue.stop()
+    if hasattr(app.state, "blocked_users_scan"):
+        await app.state.blocked_users_scan.stop_schedule()  # Resumed from the checkpoint after the restart
+    if hasattr(app.state, "usedesk_ingestion"):
+        await app.state.usedesk_ingestion.stop()  # Before the job queue: it enqueues the replies
+    if hasattr(app.state, "job_queue"):
+        await app.state.job_queue.stop()
+    if hasattr(app.state, "telegram_service"):
+        await app.state.telegram_service.close()  # Flushes the notification digest
+
+    for api_client in getattr(app.state, "api_clients", []):
+        await api_client.close()
+    await bot.session.close()
+    shutdown_tracing()
 
 
 @app.get("/")
@@ -121,11 +205,28 @@ async def root():
     return {"message": "Hello World!"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics.
+    """
+    collect_app_state(app.state)
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.post(BOT_WEBHOOK_PATH)
 async def receive_update(request: Request):
     """
     Processing incoming updates from a webhook.
+    The update is only queued here, so Telegram gets the answer without waiting for the handlers.
     """
-    update = types.Update(**await request.json())
-    await dp.feed_update(bot, update)
+    # Validated straight from the raw bytes and bound to the bot,
+    # otherwise Dispatcher.feed_update makes another dump/validate round trip to bind it
+    update = types.Update.model_validate_json(await request.body(), context={"bot": bot})
+    try:
+        await update_queue.put(update)
+    except UpdateQueueFullException as exc:
+        logger.warning(str(exc))
+        raise HTTPException(status_code=503, detail="Too many updates in progress")
     return {"ok": True}
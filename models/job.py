@@ -0,0 +1,15 @@
+import uuid
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    kind: str
+    payload: dict
+    idempotency_key: str
+    attempts: int = 0
+    trace_context: dict = Field(default_factory=dict)  # W3C trace context of the enqueuing request
+    request_id: str | None = None  # Log correlation id of the enqueuing request
+
+    _raw: bytes | None = PrivateAttr(default=None)  # Serialized form, as stored by the queue backend
@@ -1,17 +1,28 @@
-from fastapi import APIRouter, Depends, Request
+import logging
+
+import orjson
+
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
 from models.ticket import TicketRequest
 
 from utils.logger import get_logger
 
 from services.leader_service import UserService
-from services.usedesk_service import UsedeskService
-from services.telegram_service import TelegramService
+from services.reactivation_jobs import enqueue_reactivation_side_effects
+from services.reactivation_service import ReactivationService, REACTIVATION_BATCH_MAX_SIZE
+from services.blocked_users_scan import BlockedUsersScanService, BlockedScanInProgressException, format_report
+
+from utils.job_queue import BaseJobQueue
 
-from dependencies import (usedesk_service_dependency,
-                          user_service_dependency,
-                          telegram_service_dependency,
-                          ticket_request_dependency)
+from dependencies import (user_service_dependency,
+                          ticket_request_dependency,
+                          job_queue_dependency,
+                          reactivation_service_dependency,
+                          blocked_users_scan_dependency)
 
 logger = get_logger(__name__)
 
@@ -22,28 +33,90 @@ router = APIRouter()
 async def reactivate_and_notify_user(request: Request,
                                      ticket_request: TicketRequest = Depends(ticket_request_dependency),
                                      user_service: UserService = Depends(user_service_dependency),
-                                     usedesk_service: UsedeskService = Depends(usedesk_service_dependency),
-                                     telegram_service: TelegramService = Depends(telegram_service_dependency),
+                                     job_queue: BaseJobQueue = Depends(job_queue_dependency),
                                      ):
-    request_body = await request.json()
-    logger.debug(f"-> Received request body: {request_body=}")
-    logger.debug(f"-> Received request ticket body: {ticket_request=}")
-
-    user_id = user_service.user.id
-    user_birthday = user_service.user.birthday
-    notify_text = f'🔓 <a href="https://admin.leader-id.ru/users/{user_id}">{user_id}</a> ({user_birthday.year})'
+    if logger.isEnabledFor(logging.DEBUG):  # The body parsed by FastAPI is cached by Request.json()
+        logger.debug("-> Received request body: request_body=%r", await request.json())
+    logger.debug("-> Received request ticket body: ticket_request=%r", ticket_request)
 
     is_reactivate, reactivate_message = await user_service.reactivate()
     if is_reactivate:
-        await usedesk_service.reply_to_reactivated_user(ticket_request, user_birthday)
-        await telegram_service.user_reactivation_notification(notify_text)
+        # The Usedesk reply and the Telegram notification are sent in the background with retries
+        await enqueue_reactivation_side_effects(job_queue, ticket_request, user_service.user)
 
     return {"message": reactivate_message}
 
 
+@router.post("/user/reactivate-and-notify/batch")
+async def reactivate_and_notify_users(ticket_requests: Annotated[list[TicketRequest],
+                                                                Body(max_length=REACTIVATION_BATCH_MAX_SIZE)],
+                                      reactivation_service: ReactivationService = Depends(
+                                          reactivation_service_dependency),
+                                      ):
+    """
+    Reactivates the users of several tickets concurrently.
+    The response is NDJSON: one result line per ticket, sent as soon as the ticket is processed.
+    At most REACTIVATION_BATCH_MAX_SIZE tickets, a bigger batch is rejected with 422 before any is processed.
+    """
+    logger.debug("-> Received batch of %s tickets", len(ticket_requests))
+
+    async def results():
+        async for result in reactivation_service.process_batch(ticket_requests):
+            yield orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.post("/user/blocked-scan")
+async def scan_blocked_users(report_format: Literal["ndjson", "csv"] = "ndjson",
+                             resume: bool = True,
+                             dry_run: bool = False,
+                             blocked_users_scan: BlockedUsersScanService = Depends(blocked_users_scan_dependency),
+                             ):
+    """
+    Reactivates all blocked Leader-ID users (or only lists them with dry_run).
+    The report is streamed as NDJSON or CSV: one row per blocked user with the category of their Usedesk notification.
+    Closing the connection stops the scan, the next one resumes after the last finished page.
+    """
+    try:
+        results = await blocked_users_scan.start_scan(resume=resume, dry_run=dry_run)
+    except BlockedScanInProgressException as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+    media_type = "application/x-ndjson" if report_format == "ndjson" else "text/csv"
+    return StreamingResponse(format_report(results, report_format), media_type=media_type)
+
+
 @router.get("/debug/state")
 async def get_app_state(request: Request):
-    return {
-        "usedesk_service_initialized": "usedesk_service" in request.app.state,
-        "telegram_service_initialized": "telegram_service" in request.app.state,
+    state = {
+        "usedesk_service_initialized": hasattr(request.app.state, "usedesk_service"),
+        "telegram_service_initialized": hasattr(request.app.state, "telegram_service"),
     }
+    if hasattr(request.app.state, "leader_api_client"):
+        state["leader_user_cache"] = request.app.state.leader_api_client.cache_stats()
+    if hasattr(request.app.state, "usedesk_service"):
+        state["usedesk_templates"] = request.app.state.usedesk_service.templates.stats()
+    if hasattr(request.app.state, "job_queue"):
+        state["job_queue"] = await request.app.state.job_queue.stats()
+    if getattr(request.app.state, "telegram_service", None) and request.app.state.telegram_service.digest:
+        state["telegram_digest"] = await request.app.state.telegram_service.digest.stats()
+    if hasattr(request.app.state, "telegram_api_client"):
+        state["telegram_outbound"] = request.app.state.telegram_api_client.dispatcher.stats()
+    if hasattr(request.app.state, "blocked_users_scan"):
+        state["blocked_users_scan"] = request.app.state.blocked_users_scan.progress
+    if hasattr(request.app.state, "usedesk_ingestion"):
+        state["usedesk_ingestion"] = request.app.state.usedesk_ingestion.stats()
+    return state
+
+
+@router.get("/debug/circuit-breakers")
+async def get_circuit_breakers(request: Request):
+    return {api_client.name: api_client.circuit_breaker.state_info()
+            for api_client in getattr(request.app.state, "api_clients", [])}
+
+
+@router.get("/debug/http-pools")
+async def get_http_pools(request: Request):
+    return {api_client.name: api_client.pool_stats()
+            for api_client in getattr(request.app.state, "api_clients", [])}
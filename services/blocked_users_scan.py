@@ -0,0 +1,285 @@
+import io
+import os
+import csv
+import time
+import asyncio
+
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+import orjson
+
+from services.leader_service import LeaderServices, BLOCKED_STATUSES
+from services.usedesk_service import UsedeskService
+
+from utils.checkpoint import MemoryCheckpointStore, RedisCheckpointStore
+from utils.concurrency import bounded_as_completed
+from utils.logger import get_logger
+from utils.metrics import BLOCKED_SCAN_USERS
+from utils.templates import TemplateNotFoundException
+
+logger = get_logger(__name__)
+
+BLOCKED_SCAN_CONCURRENCY = int(os.getenv("BLOCKED_SCAN_CONCURRENCY", 5))
+BLOCKED_SCAN_PAGE_SIZE = int(os.getenv("BLOCKED_SCAN_PAGE_SIZE", 100))
+BLOCKED_SCAN_LOCK_TTL = float(os.getenv("BLOCKED_SCAN_LOCK_TTL", 600))  # Refreshed after every page
+BLOCKED_SCAN_REPORT_DIR = os.getenv("BLOCKED_SCAN_REPORT_DIR")
+
+BLOCKED_SCAN_KEY = "blocked_users_scan"
+UNKNOWN_CATEGORY = "unknown"  # No birthday in the profile
+REPORT_FIELDS = ("page", "user_id", "email", "status", "birthday", "category", "result", "message")
+
+
+class BlockedUsersScanService:
+    def __init__(self,
+                 leader_services: LeaderServices,
+                 checkpoint_store: MemoryCheckpointStore | RedisCheckpointStore,
+                 usedesk_service: UsedeskService | None = None,
+                 concurrency: int = BLOCKED_SCAN_CONCURRENCY,
+                 page_size: int = BLOCKED_SCAN_PAGE_SIZE,
+                 lock_ttl: float = BLOCKED_SCAN_LOCK_TTL):
+        """
+        Walks through all Leader-ID users and reactivates the blocked ones, without waiting for their tickets.
+
+        The last finished page is checkpointed with its user ids, an interrupted scan resumes from that page
+        and skips the users processed there. /admin/users is paged by offset, so the users added or deleted
+        before the checkpoint between two runs shift the pages: up to a page of deleted users is covered
+        by the overlap, users pushed out of the checkpointed page by new ones are processed again
+        (harmless, a reactivated user isn't blocked anymore), any others are picked up by the next full pass.
+        A lock in the checkpoint store keeps the replicas from scanning at the same time.
+
+        :param usedesk_service: Picks the notification kind for the report category, "unknown" without it.
+        :param concurrency: Maximum number of users of a page processed at the same time.
+                            Leader-ID calls are additionally throttled by the shared LeaderAPIClient limiter.
+        :param lock_ttl: The lock of a crashed scan expires after this many seconds.
+        """
+        self.leader_services = leader_services
+        self.checkpoint_store = checkpoint_store
+        self.usedesk_service = usedesk_service
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.lock_ttl = lock_ttl
+
+        self.progress: dict = {}  # Counters of the current (or the last) scan of this process
+        self.schedule_task: asyncio.Task | None = None
+
+    async def start_scan(self, resume: bool = True, dry_run: bool = False) -> AsyncIterator[dict]:
+        """
+        Returns the scan results: one row (REPORT_FIELDS) per blocked user, in the order they are processed.
+        The scan lock is taken when the iteration starts and released when the iterator is exhausted or closed,
+        so an iterator which is never started (e.g. the report client is gone before the first chunk) holds nothing.
+
+        :param resume: Continue from the checkpointed page, otherwise start from the first one.
+        :param dry_run: Only report the blocked users. Dry runs have their own checkpoint.
+        :raises BlockedScanInProgressException: Another scan holds the lock (also raised by the iterator
+                                                if another scan takes the lock first).
+        """
+        key = f"{BLOCKED_SCAN_KEY}:dry_run" if dry_run else BLOCKED_SCAN_KEY
+        if await self.checkpoint_store.is_locked(key):
+            raise BlockedScanInProgressException()
+        return self._scan(key, resume, dry_run)
+
+    async def _scan(self, key: str, resume: bool, dry_run: bool) -> AsyncIterator[dict]:
+        lock_token = await self.checkpoint_store.acquire_lock(key, self.lock_ttl)
+        if lock_token is None:
+            raise BlockedScanInProgressException()
+        try:
+            checkpoint = await self.checkpoint_store.get(key) if resume else None
+            start_page = checkpoint["page"] if checkpoint else 1
+            done_user_ids = set(checkpoint.get("user_ids", ())) if checkpoint else set()
+            self.progress = {"dry_run": dry_run, "started_at": time.time(), "finished_at": None,
+                             "start_page": start_page, "page": None, "scanned": 0, "by_category": {}}
+            logger.info("Blocked users scan started from page %s (dry_run=%s).", start_page, dry_run)
+
+            pages = self.leader_services.api_client.iter_users(self.page_size, start_page)
+            async with aclosing(pages):
+                async for page, page_users in pages:
+                    # The checkpointed page is read again: the users processed there by the previous run are skipped
+                    users = [user for user in page_users if user["id"] not in done_user_ids]
+                    done_user_ids = set()
+                    async with aclosing(self._process_page(page, users, dry_run)) as results:
+                        async for result in results:
+                            yield result
+                    self.progress.update(page=page, scanned=self.progress["scanned"] + len(users))
+                    if not await self.checkpoint_store.refresh_lock(key, lock_token, self.lock_ttl):
+                        # Stalled past the TTL, another scan may have taken over: its checkpoint must not be touched
+                        logger.error("Blocked users scan lost its lock after page %s, stopped.", page)
+                        return
+                    await self.checkpoint_store.set(key, {"page": page,
+                                                          "user_ids": [user["id"] for user in page_users],
+                                                          "updated_at": time.time()})
+
+            # A full pass is done, the next one starts from the beginning
+            await self.checkpoint_store.delete(key)
+            self.progress["finished_at"] = time.time()
+            logger.info("Blocked users scan finished: %s users scanned, %s.",
+                        self.progress["scanned"], self.progress["by_category"])
+        finally:
+            await self.checkpoint_store.release_lock(key, lock_token)
+
+    async def _process_page(self, page: int, users: list[dict], dry_run: bool) -> AsyncIterator[dict]:
+        """
+        Yields the report rows of the page. If the consumer stops early, the users being reactivated
+        are finished (and counted) before the iterator closes, the page is not checkpointed and is scanned again.
+        """
+        # The list already has the status, the others are loaded only to be sure (and for the birthday)
+        candidates = [user for user in users if user.get("status") is None or user["status"] in BLOCKED_STATUSES]
+
+        async def process(user: dict) -> dict | None:
+            return await self.process_user(page, user["id"], dry_run)
+
+        results = bounded_as_completed(process, candidates, self.concurrency, on_abandoned=self._count_abandoned)
+        async with aclosing(results):
+            async for result in results:
+                if result is not None:
+                    self._count(result)
+                    yield result
+
+    async def process_user(self, page: int, user_id: int, dry_run: bool = False) -> dict | None:
+        """
+        Reactivates the user if they are blocked. Errors are returned in the result, so one user can't break a scan.
+
+        :return: Report row, None if the user isn't blocked.
+        """
+        result = dict.fromkeys(REPORT_FIELDS, None) | {"page": page, "user_id": user_id, "category": UNKNOWN_CATEGORY}
+        try:
+            user_service = self.leader_services.create_user_service()
+            await user_service.load_user(user_id, use_cache=False)
+            if not await user_service.is_user_blocked():
+                return None
+
+            user = user_service.user
+            result.update(email=user.email,
+                          status=user.status,
+                          birthday=user.birthday.date().isoformat() if user.birthday else None,
+                          category=self.get_category(user.birthday))
+            if dry_run:
+                result.update(result="blocked")
+            else:
+                await user_service.unlocking_and_approve()
+                result.update(result="reactivated")
+
+        except Exception as exc:
+            logger.error("Blocked users scan: user %s error: %s", user_id, exc)
+            result.update(result="error", message=str(exc) or exc.__class__.__name__)
+
+        return result
+
+    def get_category(self, birthday) -> str:
+        """
+        :return: Usedesk notification kind the user would get for their age, see UsedeskService.get_notification_kind.
+        """
+        if birthday is None or self.usedesk_service is None:
+            return UNKNOWN_CATEGORY
+        try:
+            return self.usedesk_service.get_notification_kind(birthday)
+        except TemplateNotFoundException:
+            return UNKNOWN_CATEGORY
+
+    def _count_abandoned(self, result: dict | None) -> None:
+        if result is not None:
+            self._count(result)
+            logger.info("Blocked users scan: user %s was processed after the scan had stopped: %s.",
+                        result["user_id"], result["result"])
+
+    def _count(self, result: dict) -> None:
+        by_result = self.progress["by_category"].setdefault(result["category"], {})
+        by_result[result["result"]] = by_result.get(result["result"], 0) + 1
+        BLOCKED_SCAN_USERS.labels(category=result["category"], result=result["result"]).inc()
+
+    def start_schedule(self,
+                       interval: float,
+                       report_dir: str | None = BLOCKED_SCAN_REPORT_DIR,
+                       notify: Callable[[str], Awaitable] | None = None) -> None:
+        """
+        Runs a scan every `interval` seconds, the first one right away. A scan interrupted by a restart
+        is resumed by the next run.
+
+        :param report_dir: The report of every run is written there, one NDJSON file per category.
+        :param notify: Receives the summary of a run which has reactivated someone (e.g. the team chat).
+        """
+        self.schedule_task = asyncio.create_task(self._run_schedule(interval, report_dir, notify),
+                                                 name="blocked-users-scan")
+
+    async def stop_schedule(self) -> None:
+        if self.schedule_task is not None:
+            self.schedule_task.cancel()
+            await asyncio.gather(self.schedule_task, return_exceptions=True)
+            self.schedule_task = None
+
+    async def _run_schedule(self, interval: float, report_dir: str | None, notify) -> None:
+        while True:
+            try:
+                await self._run_scheduled_scan(report_dir, notify)
+            except BlockedScanInProgressException:
+                logger.info("Blocked users scan is already running elsewhere, skipped.")
+            except Exception as e:
+                logger.error("Scheduled blocked users scan failed, it will resume from the checkpoint: %s", e)
+            await asyncio.sleep(interval)
+
+    async def _run_scheduled_scan(self, report_dir: str | None, notify) -> None:
+        results = await self.start_scan()
+        report = CategoryReportWriter(Path(report_dir)) if report_dir else None
+        try:
+            async with aclosing(results):
+                async for result in results:
+                    if report is not None:
+                        report.write(result)
+        finally:
+            if report is not None:
+                report.close()
+
+        reactivated = sum(by_result.get("reactivated", 0) for by_result in self.progress["by_category"].values())
+        if notify is not None and reactivated:
+            lines = [f"🔓 Blocked users scan: {reactivated} reactivated, {self.progress['scanned']} scanned"]
+            lines += [f"{category}: {by_result}" for category, by_result in sorted(self.progress["by_category"].items())]
+            await notify("\n".join(lines))
+
+
+class CategoryReportWriter:
+    def __init__(self, report_dir: Path):
+        """
+        Writes the rows of one scan as they come, to <report_dir>/blocked-users-<time>-<category>.ndjson.
+        """
+        self.report_dir = report_dir
+        self.prefix = time.strftime("blocked-users-%Y%m%d-%H%M%S")
+        self.files: dict[str, io.BufferedWriter] = {}
+
+    def write(self, result: dict) -> None:
+        file = self.files.get(result["category"])
+        if file is None:
+            self.report_dir.mkdir(parents=True, exist_ok=True)
+            file = open(self.report_dir / f"{self.prefix}-{result['category']}.ndjson", "wb")
+            self.files[result["category"]] = file
+        file.write(orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE))
+
+    def close(self) -> None:
+        for file in self.files.values():
+            file.close()
+
+
+async def format_report(results: AsyncIterator[dict], report_format: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    Encodes the scan results as they come: NDJSON (a row per line) or CSV (with a header).
+    """
+    if report_format == "ndjson":
+        async for result in results:
+            yield orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    async for result in results:
+        writer.writerow(result)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # Only the header: no blocked users
+
+
+class BlockedScanInProgressException(Exception):
+    def __init__(self):
+        super().__init__("Blocked users scan is already running.")
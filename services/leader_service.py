@@ -2,21 +2,37 @@ from models.user import User
 
 from utils.api_clients.leader_api_client import LeaderAPIClient
 from utils.logger import get_logger
+from utils.tracing import traced
 
 logger = get_logger(__name__)
 
+# Leader-ID statuses of the users waiting for verification after a block
+BLOCKED_STATUSES = (8, 9)
+
 
 class LeaderServices:
     def __init__(self, api_client: LeaderAPIClient):
         self.api_client: LeaderAPIClient = api_client
-        self.user_service = UserService(self.api_client)
         self.event_service = EventService(self.api_client)
 
+    def create_user_service(self) -> "UserService":
+        """
+        UserService keeps the loaded user in its state, so each request has to get its own instance.
+        The instance is cheap: it only shares the API client (and its limiter) with the others.
+        """
+        return UserService(self.api_client)
+
     async def authenticate(self, email, password) -> None:
         await self.api_client.authenticate(email, password)
 
     async def update_token(self, token: str) -> None:
-        await self.api_client.update_token(token)
+        """
+        Validates the token against Leader-ID and sets it. Used by both the API and the bot handlers.
+
+        :raises InvalidTokenException: Leader-ID rejected the token.
+        """
+        await self.api_client.update_token(token, validate=True)
+        logger.info("Leader-ID token has been updated.")
 
 
 class UserService:
@@ -24,28 +40,33 @@ class UserService:
         self.api_client = api_client
         self.user: User | None = None
 
+    @traced()
     async def reactivate(self) -> tuple[bool, str]:
         if await self.is_user_blocked() or self.user.id == 1127536:
             await self.unlocking_and_approve()
-            logger.info(f'User with ID {self.user.id} and date of birth {self.user.birthday} has been unblocked.')
+            logger.info("User with ID %s and date of birth %s has been unblocked.", self.user.id, self.user.birthday)
             return True, "User reactivated successfully."
         else:
             return False, "User activation is not required."
 
-    async def load_user(self, user: str | int):
+    @traced()
+    async def load_user(self, user: str | int, use_cache: bool = True):
+        """
+        :param use_cache: False before deciding on the user's status, see LeaderAPIClient.get_user.
+        """
         try:
-            user_json = await self.api_client.get_user(user)
+            user_json = await self.api_client.get_user(user, use_cache=use_cache)
         except Exception as e:
-            logger.error(f'User ({user}). "get_user" exception: {e}')
+            logger.error('User (%s). "get_user" exception: %s', user, e)
             raise
         self.user = User.model_validate(obj=user_json).data
         if self.user:
-            logger.info(f'User data with id {self.user.id} has been successfully loaded.')
+            logger.info("User data with id %s has been successfully loaded.", self.user.id)
 
     async def is_user_blocked(self) -> bool:
         if self.user is None:
             raise ValueError("User not loaded. Please call load_user first.")
-        return self.user.status in [8, 9]
+        return self.user.status in BLOCKED_STATUSES
 
     async def unlocking_and_approve(self) -> None:
         if self.user is None:
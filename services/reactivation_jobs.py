@@ -0,0 +1,74 @@
+import uuid
+
+from datetime import datetime
+
+from models.ticket import TicketRequest
+from models.user import UserData
+
+from services.usedesk_service import UsedeskService, UsedeskReplyException
+from services.telegram_service import TelegramService
+
+from utils.job_queue import BaseJobQueue
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+USEDESK_REPLY_JOB = "usedesk_reply"
+TEAM_NOTIFICATION_JOB = "team_notification"
+TEAM_DIGEST_FLUSH_JOB = "team_digest_flush"
+
+
+def register_reactivation_jobs(job_queue: BaseJobQueue,
+                               usedesk_service: UsedeskService,
+                               telegram_service: TelegramService) -> None:
+    async def usedesk_reply(payload: dict) -> None:
+        ticket = TicketRequest.model_validate(payload["ticket"])
+        birthday = datetime.fromisoformat(payload["birthday"])
+        try:
+            await usedesk_service.reply_to_reactivated_user(ticket, birthday, set(payload.get("done_steps", [])))
+        except UsedeskReplyException as exc:
+            # Checkpoint: the retry repeats only the failed calls (the user must not get the comment twice)
+            payload["done_steps"] = sorted(exc.done_steps)
+            raise
+
+    async def team_notification(payload: dict) -> None:
+        digest = telegram_service.digest
+        if digest is None:
+            await telegram_service.user_reactivation_notification(payload["text"])
+            return
+
+        # The notification is acked once it's in the digest buffer and a flush job is queued for it,
+        # the flush job itself is acked only after the digest is sent
+        if "flush_id" not in payload:
+            is_full = await digest.add(payload["text"])
+            # Checkpoint: the retry doesn't buffer the text twice
+            payload["flush_id"] = uuid.uuid4().hex if is_full else None
+        window_id = digest.get_window_id()
+        await job_queue.enqueue(TEAM_DIGEST_FLUSH_JOB, {"claim_id": window_id},
+                                idempotency_key=window_id, delay=digest.window)
+        if payload["flush_id"] is not None:
+            await job_queue.enqueue(TEAM_DIGEST_FLUSH_JOB, {"claim_id": payload["flush_id"]},
+                                    idempotency_key=payload["flush_id"])
+
+    async def team_digest_flush(payload: dict) -> None:
+        await telegram_service.digest.flush(payload["claim_id"])
+
+    job_queue.register(USEDESK_REPLY_JOB, usedesk_reply)
+    job_queue.register(TEAM_NOTIFICATION_JOB, team_notification)
+    job_queue.register(TEAM_DIGEST_FLUSH_JOB, team_digest_flush)
+
+
+async def enqueue_reactivation_side_effects(job_queue: BaseJobQueue, ticket: TicketRequest, user: UserData) -> None:
+    """
+    Queues the reply to the ticket and the team notification after a user has been reactivated.
+    Both jobs are keyed by the ticket id, so a repeated call for the same ticket doesn't reply twice.
+    """
+    notify_text = f'🔓 <a href="https://admin.leader-id.ru/users/{user.id}">{user.id}</a> ({user.birthday.year})'
+
+    await job_queue.enqueue(USEDESK_REPLY_JOB,
+                            {"ticket": ticket.model_dump(), "birthday": user.birthday.isoformat()},
+                            idempotency_key=ticket.id)
+    await job_queue.enqueue(TEAM_NOTIFICATION_JOB,
+                            {"text": notify_text},
+                            idempotency_key=ticket.id)
+    logger.info("Reply and notification for ticket %s are queued.", ticket.id)
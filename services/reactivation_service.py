@@ -0,0 +1,75 @@
+import os
+
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from models.ticket import TicketRequest
+
+from services.leader_service import LeaderServices
+from services.reactivation_jobs import enqueue_reactivation_side_effects
+
+from utils.api_clients.leader_api_client import UserNotFoundException
+from utils.concurrency import bounded_as_completed
+from utils.job_queue import BaseJobQueue
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tickets in one /user/reactivate-and-notify/batch request, a bigger batch is rejected with 422
+REACTIVATION_BATCH_MAX_SIZE = int(os.getenv("REACTIVATION_BATCH_MAX_SIZE", 500))
+
+
+class ReactivationService:
+    def __init__(self,
+                 leader_services: LeaderServices,
+                 job_queue: BaseJobQueue,
+                 concurrency: int = 10):
+        """
+        :param concurrency: Maximum number of tickets processed at the same time in one batch.
+                            Leader-ID calls are additionally throttled by the shared LeaderAPIClient limiter.
+        """
+        self.leader_services = leader_services
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+
+    async def process_ticket(self, ticket: TicketRequest) -> dict:
+        """
+        Loads the ticket's user, reactivates them and queues the reply and notification.
+        Errors are returned in the result instead of being raised, so one ticket can't break a batch.
+        """
+        result = {"ticket_id": ticket.id, "client_email": ticket.client_email}
+        try:
+            user_service = self.leader_services.create_user_service()
+            await user_service.load_user(ticket.client_email, use_cache=False)
+
+            is_reactivate, reactivate_message = await user_service.reactivate()
+            if is_reactivate:
+                await enqueue_reactivation_side_effects(self.job_queue, ticket, user_service.user)
+
+            result.update(status="reactivated" if is_reactivate else "skipped", message=reactivate_message)
+
+        except UserNotFoundException as exc:
+            result.update(status="not_found", message=str(exc))
+        except Exception as exc:
+            logger.error("Ticket %s: reactivation error: %s", ticket.id, exc)
+            result.update(status="error", message=str(exc) or exc.__class__.__name__)
+
+        return result
+
+    async def process_batch(self, tickets: list[TicketRequest]) -> AsyncIterator[dict]:
+        """
+        Processes tickets concurrently and yields the results in the order they complete.
+
+        If the consumer stops early (e.g. the client has disconnected), the tickets not started yet are dropped,
+        the started ones are finished: a user is never left unlocked but not approved, or without the reply queued.
+        """
+        results = bounded_as_completed(self.process_ticket, tickets, self.concurrency,
+                                       on_abandoned=self._log_abandoned)
+        async with aclosing(results):
+            async for result in results:
+                yield result
+
+    @staticmethod
+    def _log_abandoned(result: dict) -> None:
+        logger.info("Ticket %s was processed after the batch consumer had gone: %s, %s",
+                    result["ticket_id"], result["status"], result["message"])
@@ -1,22 +1,63 @@
+import os
+import uuid
+
 from utils.api_clients.telegram_api_client import TelegramAPIClient
 from utils.logger import get_logger
+from utils.message_digest import MessageDigest, MemoryDigestBuffer, RedisDigestBuffer, create_digest_buffer
+from utils.tracing import traced
 
 logger = get_logger(__name__)
 
+# Team notifications are coalesced for the window (seconds) or up to the number of items, 0 disables the digest
+TELEGRAM_DIGEST_WINDOW = float(os.getenv("TELEGRAM_DIGEST_WINDOW", 10))
+TELEGRAM_DIGEST_MAX_ITEMS = int(os.getenv("TELEGRAM_DIGEST_MAX_ITEMS", 50))
+
 
 class TelegramService:
     def __init__(self,
                  api_client: TelegramAPIClient,
-                 chat_id):
+                 chat_id,
+                 digest_window: float = TELEGRAM_DIGEST_WINDOW,
+                 digest_max_items: int = TELEGRAM_DIGEST_MAX_ITEMS,
+                 digest_buffer: MemoryDigestBuffer | RedisDigestBuffer | None = None):
+        """
+        :param digest_buffer: Storage of the team notifications waiting for the digest,
+                              by default as durable as the job queue flushing it.
+        """
         self.api_client = api_client
         self.chat_id = chat_id
+        self.digest = None
+        if digest_window > 0:
+            self.digest = MessageDigest(self.send_team_message,
+                                        digest_buffer or create_digest_buffer("team"),
+                                        window=digest_window,
+                                        max_items=digest_max_items)
 
     async def authenticate(self, token) -> None:
         await self.api_client.authenticate(token)
 
+    @traced()
     async def user_reactivation_notification(self, notify_text=None, **kwargs):
+        """
+        Sends the notification right away. Use the digest (see reactivation_jobs) for the notifications
+        which can wait: the chat limit is 20 messages a minute.
+        """
         if not notify_text:
             notify_text = "The user is unblocked."
 
         await self.api_client.send_message(notify_text, chat_id=self.chat_id, **kwargs)
-        logger.info(f"{notify_text}")
+        logger.info("%s", notify_text)
+
+    async def send_team_message(self, text: str) -> None:
+        await self.api_client.send_message(text, chat_id=self.chat_id)
+
+    async def close(self) -> None:
+        """
+        Sends the buffered notifications, not to keep them waiting for the next start. Called on shutdown,
+        after the job queue has stopped and before the API client is closed. What fails stays in the buffer.
+        """
+        if self.digest is not None:
+            try:
+                await self.digest.flush(f"shutdown:{uuid.uuid4().hex}")
+            except Exception as e:
+                logger.error("Team digest wasn't sent on shutdown: %s", e)
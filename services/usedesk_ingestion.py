@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import asyncio
+
+from contextlib import aclosing
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from models.ticket import TicketRequest
+
+from services.reactivation_service import ReactivationService
+from services.usedesk_service import UsedeskService, USEDESK_AGENTS_TIMEZONE
+
+from utils.checkpoint import MemoryCheckpointStore, RedisCheckpointStore
+from utils.logger import get_logger
+from utils.metrics import USEDESK_INGEST_LAG_SECONDS, USEDESK_INGEST_TICKETS
+
+logger = get_logger(__name__)
+
+# Only the tickets matching the filters are reactivated, they should mirror the Usedesk trigger calling the API
+USEDESK_INGEST_SUBJECT_PATTERN = os.getenv("USEDESK_INGEST_SUBJECT_PATTERN")  # Regex, searched in the subject
+USEDESK_INGEST_SEARCH = os.getenv("USEDESK_INGEST_SEARCH")  # Full-text filter applied by Usedesk itself
+USEDESK_INGEST_STATUSES = os.getenv("USEDESK_INGEST_STATUSES", "")  # Comma-separated status ids, empty for all
+USEDESK_INGEST_START_ID = os.getenv("USEDESK_INGEST_START_ID")  # Without a cursor: ingest the tickets above this id
+USEDESK_INGEST_BATCH_SIZE = int(os.getenv("USEDESK_INGEST_BATCH_SIZE", 50))
+USEDESK_INGEST_MAX_PAGES = int(os.getenv("USEDESK_INGEST_MAX_PAGES", 10))
+USEDESK_INGEST_MAX_ATTEMPTS = int(os.getenv("USEDESK_INGEST_MAX_ATTEMPTS", 5))
+USEDESK_INGEST_SEEN_TTL = float(os.getenv("USEDESK_INGEST_SEEN_TTL", 7 * 24 * 60 * 60))
+USEDESK_INGEST_LOCK_TTL = float(os.getenv("USEDESK_INGEST_LOCK_TTL", 300))  # Refreshed after every batch
+
+USEDESK_INGEST_KEY = "usedesk_ingestion"
+
+
+class UsedeskIngestionService:
+    def __init__(self,
+                 usedesk_service: UsedeskService,
+                 reactivation_service: ReactivationService,
+                 checkpoint_store: MemoryCheckpointStore | RedisCheckpointStore,
+                 subject_pattern: str | None = USEDESK_INGEST_SUBJECT_PATTERN,
+                 search: str | None = USEDESK_INGEST_SEARCH,
+                 statuses: str = USEDESK_INGEST_STATUSES,
+                 start_id: str | None = USEDESK_INGEST_START_ID,
+                 batch_size: int = USEDESK_INGEST_BATCH_SIZE,
+                 max_pages: int = USEDESK_INGEST_MAX_PAGES,
+                 max_attempts: int = USEDESK_INGEST_MAX_ATTEMPTS,
+                 seen_ttl: float = USEDESK_INGEST_SEEN_TTL,
+                 lock_ttl: float = USEDESK_INGEST_LOCK_TTL):
+        """
+        Polls Usedesk for new tickets and feeds them into the reactivation flow in batches,
+        so a ticket isn't lost when the trigger calling /user/reactivate-and-notify misses it.
+
+        The cursor (the newest ingested ticket id) is kept in the checkpoint store. Processed tickets are
+        marked as seen, a ticket fetched again (after a crash or a retry) isn't reactivated twice.
+        A ticket with an error holds the cursor, so it's fetched and retried on the next polls.
+
+        :param max_pages: Maximum number of ticket pages read in one poll. If there are more new tickets
+                          (e.g. after a long downtime), the next polls continue the scan from where it stopped,
+                          the cursor isn't moved past the tickets not fetched yet.
+        :param max_attempts: A ticket failing this many polls is given up.
+        :param seen_ttl: How long (in seconds) a processed ticket id is remembered.
+        """
+        self.usedesk_service = usedesk_service
+        self.reactivation_service = reactivation_service
+        self.checkpoint_store = checkpoint_store
+        self.subject_pattern = re.compile(subject_pattern, re.IGNORECASE) if subject_pattern else None
+        self.search = search
+        self.statuses = {status.strip() for status in statuses.split(",") if status.strip()}
+        self.start_id = int(start_id) if start_id else None
+        self.batch_size = batch_size
+        self.max_pages = max_pages
+        self.max_attempts = max_attempts
+        self.seen_ttl = seen_ttl
+        self.lock_ttl = lock_ttl
+        self.timezone = ZoneInfo(USEDESK_AGENTS_TIMEZONE)  # Usedesk dates are in the account time zone
+
+        self.task: asyncio.Task | None = None
+        self.stopping = asyncio.Event()
+        self.last_poll_at: float | None = None
+        self.last_id: int | None = None
+        self.ingested = 0
+        self.pending_retries = 0
+
+    async def start(self, interval: float) -> None:
+        self.stopping.clear()
+        self.task = asyncio.create_task(self._run(interval), name="usedesk-ingestion")
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """
+        Stops taking new batches and waits (up to timeout) for the current one, then the cursor is saved
+        before the unprocessed tickets and the lock is released.
+        After the timeout the poll is cancelled: the tickets being reactivated still finish, the cursor isn't saved.
+        """
+        self.stopping.set()
+        if self.task is not None:
+            done, pending = await asyncio.wait([self.task], timeout=timeout)
+            for task in pending:
+                logger.warning("Usedesk ingestion: the batch isn't done after %ss, the poll is cancelled.", timeout)
+                task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self, interval: float) -> None:
+        while not self.stopping.is_set():
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error("Usedesk ingestion: poll failed: %s", e)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> bool:
+        """
+        Ingests the tickets created since the last poll.
+
+        :return: False if another replica is polling right now.
+        """
+        lock_token = await self.checkpoint_store.acquire_lock(USEDESK_INGEST_KEY, self.lock_ttl)
+        if lock_token is None:
+            return False
+        try:
+            cursor = await self.checkpoint_store.get(USEDESK_INGEST_KEY) or {}
+            last_id = cursor.get("last_id", self.start_id)
+            if last_id is None:
+                await self._init_cursor()
+            else:
+                await self._ingest(last_id, cursor.get("retries", {}), cursor.get("scan"), lock_token)
+            self.last_poll_at = time.time()
+            return True
+        finally:
+            await self.checkpoint_store.release_lock(USEDESK_INGEST_KEY, lock_token)
+
+    async def _init_cursor(self) -> None:
+        # First start: the older tickets have been handled by the trigger, only the new ones are ingested
+        tickets = await self.usedesk_service.api_client.get_tickets(0, search=self.search)
+        self.last_id = max((int(ticket["id"]) for ticket in tickets), default=0)
+        await self._save_cursor(self.last_id, {})
+        logger.info("Usedesk ingestion: cursor initialized at ticket %s.", self.last_id)
+
+    async def _ingest(self, last_id: int, retries: dict[str, int], scan: dict | None, lock_token: str) -> None:
+        """
+        :param scan: Unfinished scan of the previous polls: the page to continue from, the oldest ticket id
+                     fetched ("below") and the newest one ("top"), the cursor is moved to it when the scan is done.
+        """
+        scan = scan or {}
+        tickets, next_page = await self.usedesk_service.get_new_tickets(last_id, self.search, self.max_pages,
+                                                                        page=scan.get("page", 0),
+                                                                        below=scan.get("below"))
+        top = scan.get("top") or max((int(ticket["id"]) for ticket in tickets), default=last_id)
+        if next_page is not None:
+            logger.warning("Usedesk ingestion: more than %s pages of new tickets, the next poll continues from page %s.",
+                           self.max_pages, next_page)
+        if not tickets and next_page is None:
+            self.last_id = top
+            if scan:
+                await self._save_cursor(self.last_id, retries)
+            return
+
+        published_at = {str(ticket["id"]): ticket.get("published_at") for ticket in tickets}
+        ticket_requests = [ticket_request for ticket in tickets if (ticket_request := self.to_ticket_request(ticket))]
+        unseen = set(await self.checkpoint_store.get_unseen(USEDESK_INGEST_KEY,
+                                                            [ticket.id for ticket in ticket_requests]))
+        ticket_requests = [ticket for ticket in ticket_requests if ticket.id in unseen]
+
+        failed: dict[str, int] = {}
+        unprocessed: list[TicketRequest] = []
+        for i in range(0, len(ticket_requests), self.batch_size):
+            if self.stopping.is_set():
+                unprocessed = ticket_requests[i:]
+                break
+            results = self.reactivation_service.process_batch(ticket_requests[i:i + self.batch_size])
+            async with aclosing(results):
+                async for result in results:
+                    ticket_id = result["ticket_id"]
+                    USEDESK_INGEST_TICKETS.labels(result["status"]).inc()
+                    if result["status"] == "error":
+                        attempts = retries.get(ticket_id, 0) + 1
+                        if attempts < self.max_attempts:
+                            failed[ticket_id] = attempts
+                            continue
+                        logger.error("Usedesk ingestion: ticket %s failed %s times, given up.", ticket_id, attempts)
+
+                    await self.checkpoint_store.mark_seen(USEDESK_INGEST_KEY, [ticket_id], self.seen_ttl)
+                    self.ingested += 1
+                    if lag := self._get_lag(published_at.get(ticket_id)):
+                        USEDESK_INGEST_LAG_SECONDS.observe(lag)
+            if not await self.checkpoint_store.refresh_lock(USEDESK_INGEST_KEY, lock_token, self.lock_ttl):
+                # Another replica has taken over after the TTL, it fetches these tickets again from the old cursor
+                logger.error("Usedesk ingestion lost its lock, the poll is stopped without moving the cursor.")
+                return
+
+        # The failed and the unprocessed tickets are fetched again on the next poll,
+        # the processed ones around them are seen
+        held = [int(ticket_id) for ticket_id in failed] + [int(ticket.id) for ticket in unprocessed]
+        if next_page is None:
+            self.last_id = min(held) - 1 if held else top
+            scan = {}
+        else:
+            # The scan hasn't reached the cursor: it stays where it is until the older tickets are fetched
+            self.last_id = last_id
+            if not held:
+                scan = {"page": next_page,
+                        "below": min((int(ticket["id"]) for ticket in tickets), default=scan.get("below")),
+                        "top": top}
+        self.pending_retries = len(failed)
+        await self._save_cursor(self.last_id, failed | {ticket.id: retries[ticket.id]
+                                                        for ticket in unprocessed if ticket.id in retries}, scan)
+        logger.info("Usedesk ingestion: %s new tickets, %s matching, %s processed, %s to retry, %s left for later.",
+                    len(tickets), len(ticket_requests), len(ticket_requests) - len(failed) - len(unprocessed),
+                    len(failed), len(unprocessed))
+
+    async def _save_cursor(self, last_id: int, retries: dict[str, int], scan: dict | None = None) -> None:
+        cursor = {"last_id": last_id, "retries": retries, "updated_at": time.time()}
+        if scan:
+            cursor["scan"] = scan
+        await self.checkpoint_store.set(USEDESK_INGEST_KEY, cursor)
+
+    def to_ticket_request(self, ticket: dict) -> TicketRequest | None:
+        """
+        :return: None if the ticket doesn't match the filters or has no client email.
+        """
+        subject = ticket.get("subject") or ""
+        status = str(ticket.get("status_id", ticket.get("status", "")))
+        email = ticket.get("client_email") or ticket.get("email")
+        if self.subject_pattern is not None and not self.subject_pattern.search(subject):
+            return None
+        if self.statuses and status not in self.statuses:
+            return None
+        if not email:
+            return None
+        return TicketRequest(id=str(ticket["id"]), subject=subject, client_email=email, status=status)
+
+    def _get_lag(self, published_at: str | None) -> float | None:
+        """
+        :return: Seconds from the ticket creation till now.
+        """
+        try:
+            published = datetime.fromisoformat(published_at)
+        except (TypeError, ValueError):
+            return None
+        if published.tzinfo is None:
+            published = published.replace(tzinfo=self.timezone)
+        return max(time.time() - published.timestamp(), 0)
+
+    def stats(self) -> dict:
+        return {
+            "last_poll_at": self.last_poll_at,
+            "last_id": self.last_id,
+            "ingested": self.ingested,
+            "pending_retries": self.pending_retries,
+        }
@@ -1,17 +1,21 @@
 import os
+import json
+import math
 
 import httpx
-import pytz
 
 from pathlib import Path
 
-from datetime import datetime, time
+from datetime import datetime, date, time
 
 from models.ticket import TicketRequest
 from models.agents import Agent, Schedule
 
+from utils.agent_schedule import AgentScheduleIndex
 from utils.api_clients.usedesk_api_client import UsedeskAPIClient
 from utils.logger import get_logger
+from utils.templates import TemplateRegistry, TemplateNotFoundException
+from utils.tracing import traced
 
 logger = get_logger(__name__)
 
@@ -19,144 +23,232 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 PERS_DATA_AGREE_PATH = PROJECT_ROOT / "statics/files/Согласие на обработку персональных данных.docx"
 PERS_DATA_AGREE_AND_DIST_PATH = PROJECT_ROOT / "statics/files/Согласие на распространение персональных данных.docx"
 
-USEDESK_PAVEL_ID = int(os.getenv("USEDESK_PAVEL_ID"))
-USEDESK_DENIS_ID = int(os.getenv("USEDESK_DENIS_ID"))
-USEDESK_NIKA_ID = int(os.getenv("USEDESK_NIKA_ID"))
+USEDESK_TEMPLATES_DIR = Path(os.getenv("USEDESK_TEMPLATES_DIR", PROJECT_ROOT / "templates/usedesk"))
+TEMPLATES_BYTECODE_CACHE_DIR = os.getenv("TEMPLATES_BYTECODE_CACHE_DIR")
+
+TEENAGER_NOTIFICATION = "teenager"
+INCORRECT_BIRTH_YEAR_NOTIFICATION = "incorrect_birth_year"
+ADULT_NOTIFICATION = "adult"
+
+NOTIFICATION_ATTACHMENTS = {
+    TEENAGER_NOTIFICATION: [PERS_DATA_AGREE_PATH, PERS_DATA_AGREE_AND_DIST_PATH],
+}
+
+# Agent roster: JSON list of models.agents.Agent, from a file or from the variable itself
+USEDESK_AGENTS_FILE = os.getenv("USEDESK_AGENTS_FILE")
+USEDESK_AGENTS = os.getenv("USEDESK_AGENTS")
+USEDESK_AGENTS_TIMEZONE = os.getenv("USEDESK_AGENTS_TIMEZONE", "Europe/Moscow")
+
+# Steps of the reply to a reactivated user, in this order
+REPLY_COMMENT_STEP = "comment"
+REPLY_TICKET_UPDATE_STEP = "ticket_update"
+
+USEDESK_PAVEL_ID = os.getenv("USEDESK_PAVEL_ID")
+USEDESK_DENIS_ID = os.getenv("USEDESK_DENIS_ID")
+USEDESK_NIKA_ID = os.getenv("USEDESK_NIKA_ID")
+
+
+def get_age(birthday: date, today: date | None = None) -> int:
+    """
+    :return: Full years, a person born on February 29 turns a year older on March 1 in non-leap years.
+    """
+    today = today or datetime.now().date()
+    return today.year - birthday.year - ((today.month, today.day) < (birthday.month, birthday.day))
+
+
+def load_agents() -> list[Agent]:
+    if USEDESK_AGENTS_FILE:
+        with open(USEDESK_AGENTS_FILE, encoding="utf-8") as f:
+            return [Agent.model_validate(agent) for agent in json.load(f)]
+    if USEDESK_AGENTS:
+        return [Agent.model_validate(agent) for agent in json.loads(USEDESK_AGENTS)]
+
+    # Default roster
+    agents = []
+    if USEDESK_PAVEL_ID:
+        agents.append(Agent(usedesk_id=int(USEDESK_PAVEL_ID),
+                            name="Pavel",
+                            schedule=[Schedule(weekdays=[5, 6],
+                                               start_time=time(9, 0),
+                                               end_time=time(23, 0))]))
+    if USEDESK_DENIS_ID:
+        agents.append(Agent(usedesk_id=int(USEDESK_DENIS_ID),
+                            name="Denis",
+                            schedule=[Schedule(weekdays=list(range(0, 5)),
+                                               start_time=time(18, 0),
+                                               end_time=time(23, 0))]))
+    if USEDESK_NIKA_ID:
+        agents.append(Agent(usedesk_id=int(USEDESK_NIKA_ID),
+                            name="Nika",
+                            schedule=[Schedule(weekdays=list(range(0, 5)),
+                                               start_time=time(10, 0),
+                                               end_time=time(18, 0))]))
+    return agents
 
 
 class UsedeskService:
-    def __init__(self, api_client: UsedeskAPIClient):
+    def __init__(self,
+                 api_client: UsedeskAPIClient,
+                 agent_index: AgentScheduleIndex | None = None,
+                 templates: TemplateRegistry | None = None):
         self.api_client = api_client
         self.ticket: TicketRequest | None = None
         self.current_agent_id: int | None = None
+        self.agent_index = agent_index or AgentScheduleIndex(load_agents(), USEDESK_AGENTS_TIMEZONE)
+        if templates is None:
+            templates = TemplateRegistry(USEDESK_TEMPLATES_DIR, bytecode_cache_dir=TEMPLATES_BYTECODE_CACHE_DIR)
+            templates.load()
+        self.templates = templates
 
     async def authenticate(self, token) -> None:
         await self.api_client.authenticate(token)
 
+    async def preload_attachments(self) -> None:
+        await self.api_client.attachments.preload([path for paths in NOTIFICATION_ATTACHMENTS.values() for path in paths])
+
     async def load_ticket(self, ticket_data):
         self.ticket = ticket_data
 
-    async def reply_to_reactivated_user(self, ticket_data, birthday) -> None:
-        await self.load_ticket(ticket_data)
-
-        text, file_paths = await self.get_notification_by_age(birthday)
-
-        await self.send_message(message=text, ticket_id=self.ticket.id, file_paths=file_paths)
-        await self.update_ticket(ticket_id=self.ticket.id, category_lid="Редактирование профиля")
-
-        logger.info(f"The user with email {self.ticket.client_email} will receive a response ({self.ticket.id=}).")
-
-    async def get_notification_by_age(self, birthday) -> (str, list):
-        current_time = datetime.now()
-        birthday_plus_12_years = birthday.replace(year=birthday.year + 12)
-        birthday_plus_18_years = birthday.replace(year=birthday.year + 18)
-        is_mistake_in_age = current_time < birthday_plus_12_years
-        is_adult = current_time >= birthday_plus_18_years
-
-        if is_mistake_in_age:
-            return await self.get_incorrect_birth_year_notification()
-        elif is_adult:
-            return await self.get_adult_notification()
-        else:
-            return await self.get_teenager_notification()
-
-    @staticmethod
-    async def get_teenager_notification() -> tuple[str, list[Path]]:
-        text = """
-            <p>Здравствуйте!</p>
-            <p>Ваш профиль был деактивирован по причине того, что вы не загрузили сканы согласий родителей на обработку ваших персональных данных в свой профиль.<br/>
-            Временно активировали ваш профиль и продлили срок для загрузки согласий на 30 дней.<br/>
-            Пожалуйста, загрузите сканы согласий в разделе — <a href="https://leader-id.ru/settings?tab=privacy">https://leader-id.ru/settings?tab=privacy</a>, иначе ваш профиль будет вновь деактивирован.</p>
-            <p>Подробности можно прочитать в статье:<br/>
-            <a href="http://leader-id.usedocs.com/article/42745">Где заполнить согласие несовершеннолетнего на обработку персональных данных?</a></p>
-            <p>Если у вас остались вопросы, мы с радостью на них ответим.<br/>
-            Служба поддержки Leader-ID.<br/>
-            <a href="mailto:support@leader-id.ru">support@leader-id.ru</a></p>
-            <hr/>
-            <p>Основные вопросы и ответы в разделе «<a href="http://leader-id.usedocs.com/">Частые вопросы</a>»</p>
-            <hr/>
-            <p>Вы можете написать в наш чат-бот <a href="https://t.me/leaderid_bot" target="_blank">Telegram</a></p>
-        """.strip()
-
-        files = [PERS_DATA_AGREE_PATH, PERS_DATA_AGREE_AND_DIST_PATH]
-        return text, files
-
-    @staticmethod
-    async def get_incorrect_birth_year_notification() -> tuple[str, None]:
-        text = """
-            <p>Здравствуйте!</p>
-            <p>Ваш профиль был деактивирован, так как в настройках указан некорректный год рождения.<br/>
-            Мы активировали профиль, пожалуйста, измените дату рождения, перейдя по ссылке: <a href="https://leader-id.ru/settings?tab=main">https://leader-id.ru/settings?tab=main</a>.</p>
-            <br/>
-            <p>Просим вас пройти небольшой <a href="https://pnp.leader-id.ru/polls/p/67645e46-f179-45f1-8caf-50ec0bcd99c8/" target="_blank">опрос удовлетворенности поддержкой</a>. Это позволит нам улучшить ее качество.</p>
-            <br/>
-            <p>Если у вас остались вопросы, мы с радостью на них ответим.<br/>
-            Служба поддержки Leader-ID.<br/>
-            <a href="mailto:support@leader-id.ru">support@leader-id.ru</a></p>
-            <hr/>
-            <p>Основные вопросы и ответы в разделе «<a href="http://leader-id.usedocs.com/">Частые вопросы</a>»</p>
-            <hr/>
-            <p>Вы можете написать в наш чат-бот <a href="https://t.me/leaderid_bot" target="_blank">Telegram</a></p>
-        """.strip()
-        return text, None
-
-    @staticmethod
-    async def get_adult_notification() -> tuple[str, None]:
-        text = """
-                    <p>Здравствуйте!</p>
-                    <p>Восстановили ваш профиль. Пожалуйста, повторите вход в аккаунт.</p>
-                    <br/>
-                    <p>Просим вас пройти небольшой <a href="https://pnp.leader-id.ru/polls/p/67645e46-f179-45f1-8caf-50ec0bcd99c8/" target="_blank">опрос удовлетворенности поддержкой</a>. Это позволит нам улучшить ее качество.</p>
-                    <br/>
-                    <p>Если у вас остались вопросы, мы с радостью на них ответим.<br/>
-                    Служба поддержки Leader-ID.<br/>
-                    <a href="mailto:support@leader-id.ru">support@leader-id.ru</a></p>
-                    <hr/>
-                    <p>Основные вопросы и ответы в разделе «<a href="http://leader-id.usedocs.com/">Частые вопросы</a>»</p>
-                    <hr/>
-                    <p>Вы можете написать в наш чат-бот <a href="https://t.me/leaderid_bot" target="_blank">Telegram</a></p>
-                """.strip()
-        return text, None
+    async def get_new_tickets(self,
+                              last_id: int,
+                              search: str | None = None,
+                              max_pages: int = 10,
+                              page: int = 0,
+                              below: int | None = None) -> tuple[list[dict], int | None]:
+        """
+        Pages through the tickets above `last_id`, newest first. A scan that runs out of `max_pages`
+        is continued by the next call from the returned page.
+
+        :param last_id: Newest ticket id seen before, only the tickets above it are returned.
+        :param page: Page to continue a scan from, the last page read by the previous call.
+        :param below: Oldest ticket id fetched by the scan so far, only the tickets below it are returned.
+        :return: The new tickets, oldest first, and the page to continue from, or None if the scan reached `last_id`.
+        """
+        tickets = []
+        pages_read = 0
+        is_aligned = below is None
+        while pages_read < max_pages:
+            items = await self.api_client.get_tickets(page, search=search)
+            ids = [int(item["id"]) for item in items]
+            if not is_aligned:
+                # The page read last time should still hold a ticket fetched before. If it doesn't, tickets deleted
+                # since then have moved the rest of the scan to the earlier pages.
+                if page > 0 and (not ids or max(ids) < below):
+                    page -= 1
+                    continue
+                is_aligned = True
+            else:
+                pages_read += 1
+            tickets.extend(item for item, item_id in zip(items, ids)
+                           if item_id > last_id and (below is None or item_id < below))
+            if not ids or min(ids) <= last_id:
+                return sorted(tickets, key=lambda item: int(item["id"])), None
+            page += 1
+        return sorted(tickets, key=lambda item: int(item["id"])), page - 1
+
+    @traced()
+    async def reply_to_reactivated_user(self,
+                                        ticket_data: TicketRequest,
+                                        birthday,
+                                        done_steps: set[str] | None = None) -> set[str]:
+        """
+        Posts the reply comment, then updates the ticket category and status.
+        The order matters: the update closes the ticket, the comment must be on it before.
+
+        :param done_steps: Steps completed by a previous attempt, they are not repeated.
+        :return: All the completed steps.
+        :raises UsedeskReplyException: A step failed, the steps before it are done, the ones after it are not.
+        """
+        # The service is shared by concurrent jobs, so the ticket is not kept in self.ticket here
+        ticket = ticket_data
+        done_steps = set(done_steps or ())
+
+        if REPLY_COMMENT_STEP not in done_steps:
+            try:
+                text, file_paths = await self.get_notification_by_age(birthday, ticket=ticket)
+                await self.send_message(message=text, ticket_id=ticket.id, file_paths=file_paths)
+            except Exception as exc:
+                raise UsedeskReplyException(ticket.id, {REPLY_COMMENT_STEP: exc}, done_steps) from exc
+            done_steps.add(REPLY_COMMENT_STEP)
+
+        if REPLY_TICKET_UPDATE_STEP not in done_steps:
+            try:
+                await self.update_ticket(ticket_id=ticket.id, category_lid="Редактирование профиля")
+            except Exception as exc:
+                raise UsedeskReplyException(ticket.id, {REPLY_TICKET_UPDATE_STEP: exc}, done_steps) from exc
+            done_steps.add(REPLY_TICKET_UPDATE_STEP)
+
+        logger.info("The user with email %s will receive a response (ticket.id=%r).", ticket.client_email, ticket.id)
+        return done_steps
+
+    def get_notification_kind(self, birthday: datetime, locale: str | None = None) -> str:
+        """
+        :return: Reply template kind for the user's age: the template with min_age <= age < max_age
+                 (set in the template, a missing bound is open).
+        :raises TemplateNotFoundException: No template covers the age.
+        """
+        age = get_age(birthday)
+        for kind in self.templates.kinds():
+            meta = self.templates.get_meta(kind, locale)
+            if "min_age" not in meta and "max_age" not in meta:
+                continue  # Not an age notification
+            if meta.get("min_age", -math.inf) <= age < meta.get("max_age", math.inf):
+                return kind
+        raise TemplateNotFoundException(f"age {age}", locale or self.templates.default_locale)
+
+    async def get_notification_by_age(self, birthday, **context) -> tuple[str, list[Path] | None]:
+        kind = self.get_notification_kind(birthday)
+        return await self.get_notification(kind, birthday=birthday, **context)
+
+    async def get_notification(self, kind: str, locale: str | None = None, **context) -> tuple[str, list[Path] | None]:
+        """
+        :param kind: Template kind (file name in templates/usedesk/<locale>/).
+        :param context: Template variables.
+        :return: Reply text and the files to attach.
+        """
+        text = self.templates.render(kind, locale, **context)
+        return text, NOTIFICATION_ATTACHMENTS.get(kind)
+
+    async def get_teenager_notification(self) -> tuple[str, list[Path]]:
+        return await self.get_notification(TEENAGER_NOTIFICATION)
+
+    async def get_incorrect_birth_year_notification(self) -> tuple[str, None]:
+        return await self.get_notification(INCORRECT_BIRTH_YEAR_NOTIFICATION)
+
+    async def get_adult_notification(self) -> tuple[str, None]:
+        return await self.get_notification(ADULT_NOTIFICATION)
 
     async def set_current_agent_id(self, agent_id=None) -> None:
         if agent_id:
             self.current_agent_id = agent_id
             return None
 
-        agents = [
-            Agent(usedesk_id=USEDESK_PAVEL_ID,
-                  name="Pavel",
-                  schedule=[Schedule(weekdays=[5, 6],
-                                     start_time=time(9, 0),
-                                     end_time=time(23, 0))]),
-            Agent(usedesk_id=USEDESK_DENIS_ID,
-                  name="Denis",
-                  schedule=[Schedule(weekdays=list(range(0, 5)),
-                                     start_time=time(18, 0),
-                                     end_time=time(23, 0))]),
-            Agent(usedesk_id=USEDESK_NIKA_ID,
-                  name="Nika",
-                  schedule=[Schedule(weekdays=list(range(0, 5)),
-                                     start_time=time(10, 0),
-                                     end_time=time(18, 0))]),
-        ]
-        tz = pytz.timezone('Europe/Moscow')
-        now = datetime.now(tz)
-        weekday = now.weekday()
-        current_time = now.time()
-
-        for agent in agents:
-            for schedule in agent.schedule:
-                if weekday in schedule.weekdays and schedule.start_time <= current_time <= schedule.end_time:
-                    self.current_agent_id = agent.usedesk_id
-                    return None
+        # Nobody on duty: the reply goes from the last assigned agent
+        self.current_agent_id = self.agent_index.get_current_agent_id() or self.current_agent_id
 
+    @traced()
     async def send_message(self, message, ticket_id, file_paths: list[Path] | None = None) -> httpx.Response:
         await self.set_current_agent_id()
+        agent_id = self.current_agent_id  # Read before any await, the service is shared by concurrent jobs
         return await self.api_client.send_message(message=message,
                                                   ticket_id=ticket_id,
                                                   file_paths=file_paths,
-                                                  agent_id=self.current_agent_id)
+                                                  agent_id=agent_id)
 
+    @traced()
     async def update_ticket(self, ticket_id, category_lid) -> httpx.Response:
         return await self.api_client.update_ticket(ticket_id, category_lid)
+
+
+class UsedeskReplyException(Exception):
+    def __init__(self, ticket_id, failed: dict[str, Exception], done_steps: set[str]):
+        """
+        :param failed: Failed step and its error.
+        :param done_steps: Steps completed before it.
+        """
+        self.ticket_id = ticket_id
+        self.failed = failed
+        self.done_steps = done_steps
+        errors = ", ".join(f"{step}: {exc!r}" for step, exc in failed.items())
+        done = ", ".join(sorted(done_steps)) or "-"
+        super().__init__(f"Ticket {ticket_id}: reply failed at {errors} (done: {done}).")
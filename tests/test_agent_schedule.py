@@ -0,0 +1,96 @@
+from datetime import datetime, time
+from types import SimpleNamespace
+
+import pytest
+import pytz
+
+from models.agents import Agent, Schedule
+from utils import agent_schedule
+from utils.agent_schedule import AgentScheduleIndex
+
+TZ = pytz.timezone("Europe/Moscow")
+WORKDAYS = [0, 1, 2, 3, 4]
+
+AGENTS = [
+    Agent(usedesk_id=1, name="day", schedule=[Schedule(weekdays=WORKDAYS, start_time=time(9), end_time=time(18))]),
+    Agent(usedesk_id=2, name="evening", schedule=[Schedule(weekdays=WORKDAYS, start_time=time(14), end_time=time(22))]),
+    # Crosses midnight and the week end: Sunday 22:00 - Monday 06:00
+    Agent(usedesk_id=3, name="sunday night", schedule=[Schedule(weekdays=[6], start_time=time(22), end_time=time(6))]),
+    Agent(usedesk_id=4, name="friday night", schedule=[Schedule(weekdays=[4], start_time=time(20), end_time=time(2))]),
+]
+
+
+def at(weekday: int, hour: int, minute: int = 0) -> datetime:
+    return TZ.localize(datetime(2026, 1, 5 + weekday, hour, minute))  # 2026-01-05 is a Monday
+
+
+@pytest.fixture
+def index() -> AgentScheduleIndex:
+    return AgentScheduleIndex(AGENTS, "Europe/Moscow")
+
+
+@pytest.mark.parametrize("now, on_duty", [
+    (at(0, 0), (3,)),
+    (at(0, 5, 59), (3,)),
+    (at(0, 6), ()),  # Shifts are half-open: nobody at the end minute
+    (at(0, 8, 59), ()),
+    (at(0, 9), (1,)),
+    (at(0, 13, 59), (1,)),
+    (at(0, 14), (1, 2)),
+    (at(0, 17, 59), (1, 2)),
+    (at(0, 18), (2,)),
+    (at(0, 22), ()),
+    (at(4, 20), (2, 4)),
+    (at(4, 22), (4,)),
+    (at(5, 1, 59), (4,)),
+    (at(5, 2), ()),
+    (at(5, 12), ()),
+    (at(6, 21, 59), ()),
+    (at(6, 22), (3,)),
+    (at(6, 23, 59), (3,)),
+    (pytz.utc.localize(datetime(2026, 1, 5, 6)), (1,)),  # 09:00 in Moscow
+])
+def test_on_duty(index, now, on_duty):
+    assert index.get_on_duty(now)[0] == on_duty
+
+
+@pytest.mark.parametrize("now, until", [
+    (at(0, 10, 30), at(0, 14)),
+    (at(0, 6), at(0, 9)),
+    (at(4, 23, 15), at(5, 2)),
+    (at(6, 23), TZ.localize(datetime(2026, 1, 12))),  # Segments are also split at the week start
+])
+def test_on_duty_until(index, now, until):
+    assert index.get_on_duty(now)[1] == until
+
+
+def test_overlapping_shifts_are_taken_round_robin(index):
+    assert [index.get_current_agent_id(at(0, 15)) for _ in range(5)] == [1, 2, 1, 2, 1]
+    # Every segment keeps its own position
+    assert index.get_current_agent_id(at(0, 10)) == 1
+    assert index.get_current_agent_id(at(0, 16)) == 2
+    assert index.get_current_agent_id(at(0, 7)) is None
+
+
+def test_no_agents():
+    index = AgentScheduleIndex([])
+
+    assert index.get_on_duty(at(2, 12))[0] == ()
+    assert index.get_current_agent_id(at(2, 12)) is None
+
+
+def test_current_segment_is_cached_until_it_ends(index, monkeypatch):
+    now = at(0, 10).timestamp()
+    monkeypatch.setattr(agent_schedule, "time", SimpleNamespace(time=lambda: now))
+    lookups = []
+    find_segment = index._find_segment
+    monkeypatch.setattr(index, "_find_segment", lambda now: lookups.append(now) or find_segment(now))
+
+    assert index.get_on_duty()[0] == (1,)
+    now += 3 * 60 * 60
+    assert index.get_on_duty() == ((1,), at(0, 14))
+    assert len(lookups) == 1
+
+    now = at(0, 14).timestamp()  # The cached segment has ended
+    assert index.get_on_duty()[0] == (1, 2)
+    assert len(lookups) == 2
@@ -0,0 +1,103 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.blocked_users_scan import BlockedUsersScanService, BlockedScanInProgressException, BLOCKED_SCAN_KEY
+
+from utils.checkpoint import MemoryCheckpointStore
+
+pytestmark = pytest.mark.anyio
+
+PAGE_SIZE = 4
+
+
+async def iter_users(page_size: int, start_page: int):
+    for page in range(start_page, 4):
+        yield page, [{"id": page * 10 + i, "status": None} for i in range(page_size)]
+
+
+class SlowScanService(BlockedUsersScanService):
+    def __init__(self):
+        super().__init__(leader_services=SimpleNamespace(api_client=SimpleNamespace(iter_users=iter_users)),
+                         checkpoint_store=MemoryCheckpointStore(),
+                         concurrency=2,
+                         page_size=PAGE_SIZE)
+        self.started: list[int] = []
+        self.finished: list[int] = []
+
+    async def process_user(self, page: int, user_id: int, dry_run: bool = False) -> dict | None:
+        self.started.append(user_id)
+        await asyncio.sleep(0.01 if user_id % 10 == 0 else 0.1)  # Unlock and approve, must not be cut
+        self.finished.append(user_id)
+        return {"page": page, "user_id": user_id, "category": "adult", "result": "reactivated"}
+
+
+async def test_full_scan_deletes_checkpoint():
+    service = SlowScanService()
+    rows = [row async for row in await service.start_scan()]
+
+    assert len(rows) == 3 * PAGE_SIZE
+    assert await service.checkpoint_store.get(BLOCKED_SCAN_KEY) is None
+
+
+async def test_stopped_scan_finishes_started_users_and_checkpoints_finished_pages():
+    service = SlowScanService()
+    rows = await service.start_scan()
+    async for row in rows:
+        if row["page"] == 2:
+            break
+    await rows.aclose()  # The report client has disconnected in the middle of page 2
+
+    # Only the finished page 1 is checkpointed, page 2 is scanned again by the next run
+    assert (await service.checkpoint_store.get(BLOCKED_SCAN_KEY))["page"] == 1
+    assert sorted(service.finished) == sorted(service.started)
+    assert len([user_id for user_id in service.started if user_id // 10 == 2]) < PAGE_SIZE
+    assert service.progress["by_category"]["adult"]["reactivated"] == len(service.finished)
+
+    # The lock is released
+    assert await service.checkpoint_store.acquire_lock(BLOCKED_SCAN_KEY, ttl=10) is not None
+
+
+async def test_scan_never_started_holds_no_lock():
+    service = SlowScanService()
+    await service.start_scan()  # The report client is gone before the first chunk
+
+    assert not await service.checkpoint_store.is_locked(BLOCKED_SCAN_KEY)
+    assert len([row async for row in await service.start_scan()]) == 3 * PAGE_SIZE
+
+
+async def test_running_scan_rejects_another():
+    service = SlowScanService()
+    rows = await service.start_scan()
+    await anext(rows)
+
+    with pytest.raises(BlockedScanInProgressException):
+        await service.start_scan()
+    await rows.aclose()
+
+
+async def test_resume_rereads_checkpointed_page_after_deletions():
+    users = [{"id": i, "status": None} for i in range(1, 13)]
+
+    async def iter_users(page_size: int, start_page: int):
+        for page in range(start_page, len(users) // page_size + 2):
+            if page_users := users[(page - 1) * page_size:page * page_size]:
+                yield page, page_users
+
+    service = SlowScanService()
+    service.leader_services.api_client.iter_users = iter_users
+    rows = await service.start_scan()
+    async for row in rows:
+        if row["user_id"] > PAGE_SIZE:  # In the middle of page 2
+            break
+    await rows.aclose()
+    assert (await service.checkpoint_store.get(BLOCKED_SCAN_KEY))["page"] == 1
+
+    # Two users of page 1 are deleted: users 5 and 6 move to page 1, the resumed scan must not skip them
+    del users[0:2]
+    service.started.clear()
+    rows = [row async for row in await service.start_scan()]
+
+    assert sorted(service.started) == sorted(row["user_id"] for row in rows) == list(range(5, 13))
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from bot.bot import auth_command
+
+from utils.circuit_breaker import CircuitOpenException
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeMessage:
+    def __init__(self):
+        self.answers: list[str] = []
+        self.is_deleted = False
+
+    async def answer(self, text: str, **kwargs) -> None:
+        self.answers.append(text)
+
+    async def delete(self) -> None:
+        self.is_deleted = True
+
+
+def make_leader_services(exc: Exception):
+    async def update_token(token: str) -> None:
+        raise exc
+
+    return SimpleNamespace(update_token=update_token)
+
+
+async def test_error_text_is_escaped():
+    message = FakeMessage()
+    exc = httpx.HTTPStatusError("<b>Bad gateway</b>", request=httpx.Request("GET", "http://x"), response=None)
+
+    await auth_command(message, SimpleNamespace(args="token"), make_leader_services(exc))
+
+    assert message.answers == ["Не удалось проверить токен: &lt;b&gt;Bad gateway&lt;/b&gt;"]
+    assert message.is_deleted
+
+
+async def test_token_message_is_deleted_on_unexpected_error():
+    message = FakeMessage()
+    leader_services = make_leader_services(CircuitOpenException("leader", retry_after=30))
+
+    with pytest.raises(CircuitOpenException):
+        await auth_command(message, SimpleNamespace(args="token"), leader_services)
+
+    assert message.is_deleted
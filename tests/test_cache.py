@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from utils import cache as cache_module
+from utils.cache import AsyncTTLCache, RedisTTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_memory_add_only_sets_absent_key():
+    cache = AsyncTTLCache("test", ttl=60)
+
+    assert await cache.add("key", "first")
+    assert not await cache.add("key", "second")
+    assert await cache.get("key") == "first"
+
+
+async def test_redis_add_is_shared_between_replicas():
+    server = FakeServer()
+    replicas = [RedisTTLCache(FakeRedis(server=server), "test", ttl=60) for _ in range(2)]
+
+    assert await replicas[0].add("key", "first")
+    assert not await replicas[1].add("key", "second")
+    assert await replicas[1].get("key") == "first"
+
+    await replicas[0].delete("key")
+    assert await replicas[0].add("key", "third")
+
+
+async def test_redis_add_uses_entry_ttl():
+    redis = FakeRedis()
+    cache = RedisTTLCache(redis, "test", ttl=60)
+
+    await cache.add("key", "value", ttl=2)
+
+    assert 0 < await redis.pttl("cache:test:key") <= 2000
+
+
+async def test_memory_entry_expires_after_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: now))
+    cache = AsyncTTLCache("test", ttl=60)
+
+    await cache.set("key", "value")
+    now += 60
+    assert await cache.get("key") == "value"
+    now += 1
+    assert await cache.get("key") is None
+    assert "key" not in cache.entries
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_memory_evicts_least_recently_used():
+    cache = AsyncTTLCache("test", maxsize=2, ttl=60)
+
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    assert await cache.get("a") == 1  # "b" is now the least recently used
+    await cache.set("c", 3)
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == 1
+    assert await cache.get("c") == 3
+    assert len(cache.entries) == 2
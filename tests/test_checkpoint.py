@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from fakeredis.aioredis import FakeRedis
+
+from utils.checkpoint import MemoryCheckpointStore, RedisCheckpointStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        return MemoryCheckpointStore()
+    return RedisCheckpointStore(FakeRedis())
+
+
+async def test_lock_is_exclusive(store):
+    token = await store.acquire_lock("job", ttl=10)
+
+    assert token is not None
+    assert await store.acquire_lock("job", ttl=10) is None
+    assert await store.refresh_lock("job", token, ttl=10)
+
+    await store.release_lock("job", token)
+    assert await store.acquire_lock("job", ttl=10) is not None
+
+
+async def test_stale_holder_cant_touch_the_next_lock(store):
+    stale_token = await store.acquire_lock("job", ttl=0.05)
+    await asyncio.sleep(0.1)  # The holder stalls past the TTL
+    token = await store.acquire_lock("job", ttl=10)
+    assert token is not None
+
+    assert not await store.refresh_lock("job", stale_token, ttl=10)
+    await store.release_lock("job", stale_token)
+
+    assert await store.acquire_lock("job", ttl=10) is None  # Still held by the new owner
+    assert await store.refresh_lock("job", token, ttl=10)
+
+
+async def test_expired_lock_cant_be_refreshed(store):
+    token = await store.acquire_lock("job", ttl=0.05)
+    await asyncio.sleep(0.1)
+
+    assert not await store.refresh_lock("job", token, ttl=10)
@@ -0,0 +1,118 @@
+import asyncio
+
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from utils.api_clients.base_api_client import BaseAPIClient
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenException
+from utils.limiters import AsyncReservationLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock, **kwargs) -> CircuitBreaker:
+    kwargs = {"failure_rate_threshold": 0.5, "window_size": 4, "min_calls": 4, "open_timeout": 30} | kwargs
+    return CircuitBreaker("test", clock=clock, **kwargs)
+
+
+def call(breaker: CircuitBreaker, failed: bool) -> None:
+    breaker.before_call()
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+@pytest.mark.parametrize("outcomes, state", [
+    ([True, True, True], CircuitBreaker.CLOSED),  # Fewer than min_calls
+    ([False, False, True, True], CircuitBreaker.OPEN),  # 50% of the window
+    ([True, False, False, False], CircuitBreaker.CLOSED),
+    ([True, True, False, False, False, False], CircuitBreaker.CLOSED),  # The old failures left the window
+    ([False, False, True, False, True], CircuitBreaker.OPEN),  # Last 4: F, T, F, T
+])
+def test_failure_rate_in_window(outcomes, state):
+    breaker = make_breaker(FakeClock())
+    for failed in outcomes:
+        call(breaker, failed)
+
+    assert breaker.state == state
+
+
+def test_open_circuit_fails_fast_until_timeout():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, True)
+
+    clock.now += 29.5
+    with pytest.raises(CircuitOpenException) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after == pytest.approx(0.5)
+    assert breaker.state_info() == {"state": "open", "failure_rate": 1.0, "calls_in_window": 4, "retry_after": 0.5}
+
+    clock.now += 0.5
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.mark.parametrize("trial_failed, state", [(False, CircuitBreaker.CLOSED), (True, CircuitBreaker.OPEN)])
+def test_half_open_lets_one_trial_through(trial_failed, state):
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, True)
+    clock.now += 30
+
+    breaker.before_call()  # The trial call
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call()  # A concurrent caller while the trial is in flight
+    if trial_failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    assert breaker.state == state
+    if state == CircuitBreaker.CLOSED:
+        assert breaker.failure_rate == 0  # A fresh window after recovery
+        breaker.before_call()
+    else:
+        assert breaker.opened_at == clock.now  # Open for another full timeout
+        with pytest.raises(CircuitOpenException):
+            breaker.before_call()
+
+
+async def test_cancelled_trial_call_releases_its_slot():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, True)
+    clock.now += 30
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    client = BaseAPIClient(base_url="http://upstream", name="test", circuit_breaker=breaker,
+                           limiter=AsyncReservationLimiter(rate=1000, period=timedelta(seconds=1)))
+    client.client = httpx.AsyncClient(base_url="http://upstream", transport=httpx.MockTransport(handler))
+
+    trial = asyncio.create_task(client.make_request("GET", "/"))
+    await asyncio.sleep(0.01)
+    assert breaker.half_open_calls == 1
+    trial.cancel()
+    await asyncio.gather(trial, return_exceptions=True)
+
+    # Without release() the circuit would stay half-open with no slot for a new trial
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.half_open_calls == 0
+    breaker.before_call()
@@ -0,0 +1,143 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import RedisError
+
+from utils import job_queue
+from utils.job_queue import BaseJobQueue, MemoryJobQueue, RedisJobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+def test_base_queue_is_abstract():
+    with pytest.raises(TypeError):
+        BaseJobQueue("test")
+
+
+async def test_memory_queue_runs_job_once():
+    queue = MemoryJobQueue("test", workers=1)
+    payloads = []
+
+    async def handler(payload: dict) -> None:
+        payloads.append(payload)
+
+    queue.register("kind", handler)
+    assert await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert not await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+
+    await queue.start()
+    await asyncio.sleep(0.05)
+    await queue.stop()
+
+    assert payloads == [{"n": 1}]
+
+
+async def test_redis_enqueue_is_deduplicated():
+    queue = RedisJobQueue(FakeRedis(), "test")
+
+    assert await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert not await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert (await queue.stats())["ready"] == 1
+
+
+async def test_redis_failed_enqueue_leaves_no_key():
+    server = FakeServer()
+    redis = FakeRedis(server=server)
+    queue = RedisJobQueue(redis, "test")
+
+    server.connected = False
+    with pytest.raises(RedisError):
+        await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    server.connected = True
+
+    # The ready list can't be pushed to: the key must not be reserved without the job
+    await redis.set(queue.ready_key, "not a list")
+    with pytest.raises(RedisError):
+        await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert not await redis.exists(queue._idempotency_key("kind:1"))
+
+    await redis.delete(queue.ready_key)
+    assert await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert (await queue.stats())["ready"] == 1
+
+
+async def test_delayed_job_runs_after_delay():
+    queue = MemoryJobQueue("test", workers=1)
+    ran_at = []
+
+    async def handler(payload: dict) -> None:
+        ran_at.append(asyncio.get_running_loop().time())
+
+    queue.register("kind", handler)
+    await queue.start()
+    enqueued_at = asyncio.get_running_loop().time()
+    assert await queue.enqueue("kind", {}, idempotency_key="1", delay=0.1)
+    await asyncio.sleep(0.2)
+    await queue.stop()
+
+    assert len(ran_at) == 1 and ran_at[0] - enqueued_at >= 0.1
+
+
+async def test_redis_delayed_job_waits_in_delayed_set():
+    queue = RedisJobQueue(FakeRedis(), "test")
+
+    assert await queue.enqueue("kind", {}, idempotency_key="1", delay=60)
+    assert await queue.stats() == {"backend": "redis", "ready": 0, "delayed": 1, "dead": 0}
+
+
+async def test_memory_queue_prunes_expired_keys(monkeypatch):
+    queue = MemoryJobQueue("test", idempotency_ttl=10)
+    now = 1000.0
+    monkeypatch.setattr(job_queue, "time", SimpleNamespace(monotonic=lambda: now))
+
+    assert await queue.enqueue("kind", {}, idempotency_key="1")
+    assert await queue.enqueue("kind", {}, idempotency_key="2")
+    now += 11
+    assert await queue.enqueue("kind", {}, idempotency_key="3")
+
+    assert list(queue.keys) == ["kind:3"]
+    assert await queue.enqueue("kind", {}, idempotency_key="1")
+
+
+async def test_redis_ack_failure_keeps_worker_alive():
+    server = FakeServer()
+    redis = FakeRedis(server=server)
+    queue = RedisJobQueue(redis, "test", workers=1)
+    queue.SETTLE_RETRY_DELAY = 0.01
+    payloads = []
+
+    async def handler(payload: dict) -> None:
+        payloads.append(payload)
+
+    ack = queue._ack
+    ack_failures = []
+
+    async def failing_ack(job) -> None:
+        if not ack_failures:
+            ack_failures.append(job)
+            server.connected = False
+            try:
+                await ack(job)
+            finally:
+                server.connected = True
+        await ack(job)
+
+    queue._ack = failing_ack
+    queue.register("kind", handler)
+    assert await queue.enqueue("kind", {"n": 1}, idempotency_key="1")
+    assert await queue.enqueue("kind", {"n": 2}, idempotency_key="2")
+    await queue.start()
+    await asyncio.sleep(0.2)
+
+    # The first ack failed, was retried, and the same worker went on to the next job
+    assert len(ack_failures) == 1
+    assert payloads == [{"n": 1}, {"n": 2}]
+    assert not any(task.done() for task in queue.tasks)
+    assert await redis.llen(queue.processing_key) == 0
+    assert await redis.get(queue._idempotency_key("kind:1")) == b"done"
+    await queue.stop()
@@ -0,0 +1,107 @@
+import json
+import time
+import base64
+import asyncio
+
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from utils.api_clients.leader_api_client import LeaderAPIClient, CaptchaNotSetException
+from utils.limiters import AsyncReservationLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+def make_client(handler) -> LeaderAPIClient:
+    client = LeaderAPIClient(limiter=AsyncReservationLimiter(rate=1000, period=timedelta(seconds=1)))
+    client.client = httpx.AsyncClient(base_url="http://leader", transport=httpx.MockTransport(handler))
+    return client
+
+
+async def test_get_user_without_cache_reads_current_status():
+    statuses = iter([3, 8])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"data": {"id": 1, "status": next(statuses)}})
+
+    client = make_client(handler)
+    assert (await client.get_user(1))["data"]["status"] == 3
+
+    # Blocked since the first lookup: the cached user says otherwise, a fresh read doesn't
+    assert (await client.get_user(1))["data"]["status"] == 3
+    assert (await client.get_user(1, use_cache=False))["data"]["status"] == 8
+    assert (await client.get_user(1))["data"]["status"] == 8
+
+
+def make_jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def make_auth_handler(login_response, token: str = "fresh"):
+    logins = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth/login":
+            logins.append(request)
+            return login_response()
+        await asyncio.sleep(0.01)  # All requests are in flight with the old token at once
+        if request.headers["Authorization"] != f"Bearer {token}":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"data": {"id": 1}})
+
+    return handler, logins
+
+
+def make_authenticated_client(handler, token: str = "stale") -> LeaderAPIClient:
+    client = make_client(handler)
+    client.email, client.password = "admin@example.com", "password"
+    client._set_token(token)
+    return client
+
+
+async def test_concurrent_401s_log_in_once():
+    handler, logins = make_auth_handler(lambda: httpx.Response(200, json={"data": {"access_token": "fresh"}}))
+    client = make_authenticated_client(handler)
+
+    users = await asyncio.gather(*(client.get_user(1, use_cache=False) for _ in range(10)))
+
+    assert all(user["data"]["id"] == 1 for user in users)
+    assert len(logins) == 1
+    assert client.token_version == 2
+
+
+async def test_expiring_token_is_refreshed_before_the_request():
+    fresh_token = make_jwt(time.time() + 3600)
+    handler, logins = make_auth_handler(lambda: httpx.Response(200, json={"data": {"access_token": fresh_token}}),
+                                        token=fresh_token)
+    client = make_authenticated_client(handler, token=make_jwt(time.time() + 10))  # Within the refresh margin
+
+    await asyncio.gather(*(client.get_user(1, use_cache=False) for _ in range(10)))
+
+    assert len(logins) == 1
+    assert client.token_expires_at == pytest.approx(time.time() + 3600, abs=5)
+
+
+async def test_failed_proactive_refresh_falls_back_to_current_token():
+    expiring_token = make_jwt(time.time() + 10)
+    handler, logins = make_auth_handler(lambda: httpx.Response(422, text="captcha"), token=expiring_token)
+    client = make_authenticated_client(handler, token=expiring_token)
+
+    assert (await client.get_user(1, use_cache=False))["data"]["id"] == 1
+    assert (await client.get_user(1, use_cache=False))["data"]["id"] == 1
+
+    # The login needs a captcha: it's not retried on every request until the next 401
+    assert len(logins) == 1
+    assert client.token_expires_at is None
+
+
+async def test_401_with_captcha_required_raises():
+    handler, logins = make_auth_handler(lambda: httpx.Response(422, text="captcha"))
+    client = make_authenticated_client(handler)
+
+    with pytest.raises(CaptchaNotSetException):
+        await client.get_user(1, use_cache=False)
+    assert len(logins) == 1
@@ -0,0 +1,143 @@
+import time
+import uuid
+import random
+import asyncio
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from utils import limiters
+from utils.limiters import AsyncReservationLimiter, RedisSlidingWindowLimiter
+
+pytestmark = pytest.mark.anyio
+
+# Event loop timers fire a bit late
+TIMER_LATENESS = 0.02
+
+
+class RecordingLimiter(RedisSlidingWindowLimiter):
+    """
+    Records the slot each call has got in the shared window (Redis time). The slots don't depend on
+    how late the event loop wakes the callers, unlike the time acquire() returns at.
+    """
+
+    def __init__(self, *args, slots: list[float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = slots
+
+    async def reserve(self) -> float:
+        member = uuid.uuid4().hex
+        delay = await self.script(keys=[self.key], args=[self.rate, self.period, member])
+        self.slots.append(await self.redis.zscore(self.key, member))
+        return float(delay)
+
+
+def max_in_window(timestamps: list[float], period: float) -> int:
+    timestamps = sorted(timestamps)
+    worst, left = 0, 0
+    for right, ts in enumerate(timestamps):
+        while ts - timestamps[left] >= period:
+            left += 1
+        worst = max(worst, right - left + 1)
+    return worst
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(limiters, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_reservation_serves_callers_in_order(clock):
+    limiter = AsyncReservationLimiter(rate=2, period=timedelta(seconds=1))
+
+    # Each caller gets the next slot at once: 2 per window, never before an earlier caller
+    assert [limiter.reserve() for _ in range(6)] == [0, 0, 1, 1, 2, 2]
+    clock.now += 0.5
+    assert limiter.reserve() == 2.5
+    clock.now += 10
+    assert limiter.reserve() == 0  # The window is free again
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reservation_never_overshoots_the_window(clock, seed):
+    rng = random.Random(seed)
+    rate, period = 3, 1.0
+    limiter = AsyncReservationLimiter(rate=rate, period=timedelta(seconds=period))
+    slots = []
+    for _ in range(200):
+        clock.now += rng.choice([0, 0, 0.05, 0.3, 1.5])  # Bursts and gaps
+        slots.append(clock.now + limiter.reserve())
+
+    assert slots == sorted(slots)
+    assert max_in_window(slots, period) <= rate
+
+
+async def test_reservation_wakes_waiters_in_order():
+    limiter = AsyncReservationLimiter(rate=1, period=timedelta(seconds=0.02))
+    order = []
+
+    async def call(i: int) -> None:
+        await limiter.acquire()
+        order.append(i)
+
+    tasks = [asyncio.create_task(call(i)) for i in range(5)]
+    await asyncio.sleep(0)  # Every caller has reserved its slot
+    tasks[1].cancel()  # A cancelled waiter keeps its slot, the others don't move into it
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert order == [0, 2, 3, 4]
+    assert len(limiter.timestamps) == 5
+
+
+async def test_window_is_shared_between_instances():
+    server = FakeServer()
+    rate, period = 5, 0.2
+    slots: list[float] = []
+    limiters = [RecordingLimiter(FakeRedis(server=server), key="test", rate=rate,
+                                 period=timedelta(seconds=period), slots=slots)
+                for _ in range(3)]
+
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire() for limiter in limiters for _ in range(10)))
+    elapsed = time.monotonic() - started
+
+    assert len(slots) == 30
+    assert max_in_window(slots, period - 1e-6) <= rate  # Float rounding of slot + period
+    # 30 calls at 5 per window: the first 5 at once, then 5 more every window
+    assert elapsed >= (30 // rate - 1) * period - TIMER_LATENESS
+    assert not any(limiter.is_degraded for limiter in limiters)
+
+
+async def test_falls_back_to_memory_limiter_on_redis_error():
+    server = FakeServer()
+    limiter = RedisSlidingWindowLimiter(FakeRedis(server=server), key="test", rate=2,
+                                        period=timedelta(seconds=0.2))
+    server.connected = False
+
+    started = time.monotonic()
+    for _ in range(3):
+        await limiter.acquire()  # Doesn't raise
+    elapsed = time.monotonic() - started
+
+    assert limiter.is_degraded
+    assert elapsed >= 0.2 - TIMER_LATENESS  # The third call waited for the local window
+    assert len(limiter.fallback.timestamps) == 3
+
+    server.connected = True
+    await limiter.acquire()
+    assert not limiter.is_degraded
@@ -0,0 +1,33 @@
+import httpx
+import pytest
+
+from utils.logger import CorrelationIdMiddleware, REQUEST_ID_HEADER, request_id_var
+
+pytestmark = pytest.mark.anyio
+
+
+async def echo_request_id(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": request_id_var.get().encode()})
+
+
+async def get_request_id(request_id: str | bytes | None) -> tuple[str, str]:
+    transport = httpx.ASGITransport(app=CorrelationIdMiddleware(echo_request_id))
+    headers = {REQUEST_ID_HEADER: request_id} if request_id is not None else {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/", headers=headers)
+    return response.text, response.headers[REQUEST_ID_HEADER]
+
+
+@pytest.mark.parametrize("request_id", ["abc-123", "3f2c9a1e.b7:1", "a" * 128])
+async def test_valid_request_id_is_kept(request_id):
+    assert await get_request_id(request_id) == (request_id, request_id)
+
+
+@pytest.mark.parametrize("request_id", [None, "", "a" * 129, "abc 123", "abc\tdef", "<script>",
+                                        "idé".encode("latin-1")])
+async def test_invalid_request_id_is_replaced(request_id):
+    logged, returned = await get_request_id(request_id)
+
+    assert logged == returned != request_id
+    assert len(logged) == 32
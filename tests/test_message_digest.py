@@ -0,0 +1,71 @@
+import pytest
+
+from fakeredis.aioredis import FakeRedis
+
+from utils.message_digest import MessageDigest, MemoryDigestBuffer, RedisDigestBuffer, split_message
+
+pytestmark = pytest.mark.anyio
+
+
+class Chat:
+    def __init__(self, fail_from: int | None = None):
+        self.messages: list[str] = []
+        self.fail_from = fail_from
+
+    async def send(self, message: str) -> None:
+        if self.fail_from is not None and len(self.messages) >= self.fail_from:
+            raise ConnectionError("Telegram is unreachable")
+        self.messages.append(message)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def buffer(request):
+    if request.param == "memory":
+        return MemoryDigestBuffer()
+    return RedisDigestBuffer(FakeRedis(), "test")
+
+
+def test_split_message_keeps_limit():
+    messages = split_message(["a" * 6, "b" * 3, "c" * 12], limit=10)
+
+    assert messages == ["aaaaaa\nbbb", "c" * 10, "c" * 2]
+
+
+async def test_flush_sends_combined_message(buffer):
+    chat = Chat()
+    digest = MessageDigest(chat.send, buffer, max_items=3)
+
+    assert [await digest.add(text) for text in ("1", "2", "3")] == [False, False, True]
+    await digest.flush("a")
+
+    assert chat.messages == ["1\n2\n3"]
+    assert await buffer.size() == 0
+
+
+async def test_failed_flush_keeps_unsent_notifications(buffer):
+    chat = Chat(fail_from=1)
+    digest = MessageDigest(chat.send, buffer, limit=3)
+    for text in ("1", "2", "3", "4"):
+        await digest.add(text)
+
+    with pytest.raises(ConnectionError):
+        await digest.flush("a")
+    await digest.add("5")
+
+    assert chat.messages == ["1\n2"]
+    chat.fail_from = None
+    await digest.flush("a")  # The retry of the same flush
+    assert chat.messages == ["1\n2", "3\n4", "5"]
+
+
+async def test_crashed_flush_is_resent_by_its_retry(buffer):
+    chat = Chat()
+    digest = MessageDigest(chat.send, buffer)
+    await digest.add("1")
+    await buffer.claim("a")  # The process dies before sending
+    await digest.add("2")
+
+    await digest.flush("b")
+    await digest.flush("a")
+
+    assert sorted(chat.messages) == ["1", "2"]
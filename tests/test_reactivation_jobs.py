@@ -0,0 +1,66 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.reactivation_jobs import register_reactivation_jobs, TEAM_NOTIFICATION_JOB
+from services.telegram_service import TelegramService
+
+from utils.job_queue import MemoryJobQueue
+from utils.message_digest import MemoryDigestBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakyTelegramAPIClient:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.messages: list[str] = []
+
+    async def send_message(self, text: str, chat_id) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Telegram is unreachable")
+        self.messages.append(text)
+
+
+async def test_team_notifications_are_kept_until_digest_is_sent():
+    api_client = FlakyTelegramAPIClient(failures=2)
+    telegram_service = TelegramService(api_client, chat_id=1, digest_window=0.1, digest_max_items=50,
+                                       digest_buffer=MemoryDigestBuffer())
+    queue = MemoryJobQueue("test", workers=2, retry_delay=0.05)
+    register_reactivation_jobs(queue, SimpleNamespace(), telegram_service)
+
+    for ticket_id in ("1", "2", "3"):
+        await queue.enqueue(TEAM_NOTIFICATION_JOB, {"text": f"user {ticket_id}"}, idempotency_key=ticket_id)
+    await queue.start()
+    await asyncio.sleep(0.6)
+    await queue.stop()
+
+    # The flush job failed twice and was retried, nothing is lost or dead-lettered
+    assert api_client.messages == ["user 1\nuser 2\nuser 3"]
+    assert await telegram_service.digest.buffer.size() == 0
+    assert queue.dead == []
+
+
+async def test_full_digest_is_sent_without_waiting_for_window():
+    api_client = FlakyTelegramAPIClient(failures=0)
+    telegram_service = TelegramService(api_client, chat_id=1, digest_window=60, digest_max_items=2,
+                                       digest_buffer=MemoryDigestBuffer())
+    queue = MemoryJobQueue("test", workers=1)
+    register_reactivation_jobs(queue, SimpleNamespace(), telegram_service)
+
+    for ticket_id in ("1", "2", "3", "4", "5"):
+        await queue.enqueue(TEAM_NOTIFICATION_JOB, {"text": f"user {ticket_id}"}, idempotency_key=ticket_id)
+    await queue.start()
+    await asyncio.sleep(0.1)
+    await queue.stop()
+
+    # The flush queued by the second notification runs after the ones queued before it
+    assert api_client.messages == ["user 1\nuser 2\nuser 3\nuser 4\nuser 5"]
+
+    await queue.enqueue(TEAM_NOTIFICATION_JOB, {"text": "user 6"}, idempotency_key="6")
+    await queue._run(await queue._pop())
+    await telegram_service.close()  # The window flush won't run: the rest is sent on shutdown
+    assert api_client.messages[1:] == ["user 6"]
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from models.ticket import TicketRequest
+from services.reactivation_service import ReactivationService
+
+pytestmark = pytest.mark.anyio
+
+
+def make_tickets(count: int) -> list[TicketRequest]:
+    return [TicketRequest(id=str(i), subject="s", client_email=f"user{i}@example.com", status="1")
+            for i in range(count)]
+
+
+class SlowReactivationService(ReactivationService):
+    def __init__(self, concurrency: int):
+        super().__init__(leader_services=None, job_queue=None, concurrency=concurrency)
+        self.started: list[str] = []
+        self.finished: list[str] = []
+
+    async def process_ticket(self, ticket: TicketRequest) -> dict:
+        self.started.append(ticket.id)
+        await asyncio.sleep(0.05 if ticket.id == "0" else 0.2)  # Unlock and approve, must not be cut
+        self.finished.append(ticket.id)
+        return {"ticket_id": ticket.id, "status": "reactivated", "message": ""}
+
+
+async def test_batch_yields_every_result():
+    service = SlowReactivationService(concurrency=3)
+    results = [result async for result in service.process_batch(make_tickets(5))]
+
+    assert sorted(result["ticket_id"] for result in results) == ["0", "1", "2", "3", "4"]
+
+
+async def test_started_tickets_finish_when_consumer_stops():
+    service = SlowReactivationService(concurrency=3)
+    results = service.process_batch(make_tickets(10))
+
+    first = await anext(results)
+    await results.aclose()  # The NDJSON client has disconnected
+
+    assert first["ticket_id"] == "0"
+    # Ticket 3 took the slot of ticket 0, the rest were never started
+    assert sorted(service.started) == ["0", "1", "2", "3"]
+    assert sorted(service.finished) == ["0", "1", "2", "3"]
+
+
+async def test_started_tickets_finish_when_consumer_is_cancelled():
+    service = SlowReactivationService(concurrency=2)
+
+    async def consume():
+        async for _ in service.process_batch(make_tickets(10)):
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await asyncio.sleep(0.3)
+
+    assert service.started and sorted(service.finished) == sorted(service.started)
+    assert len(service.started) < 10
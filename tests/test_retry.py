@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils import retry
+from utils.api_clients.base_api_client import BaseAPIClient
+from utils.limiters import AsyncReservationLimiter
+from utils.retry import RetryPolicy
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def status_error(status: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "http://upstream/")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(str(status), request=request, response=response)
+
+
+@pytest.mark.parametrize("exc, retryable", [
+    (status_error(500), True),
+    (status_error(503), True),
+    (status_error(429), True),
+    (status_error(408), True),
+    (status_error(400), False),
+    (status_error(401), False),
+    (status_error(404), False),
+    (status_error(422), False),
+    (httpx.ConnectError("refused"), True),
+    (httpx.ReadTimeout("timeout"), True),
+    (ValueError("bug"), False),
+])
+def test_status_classification(exc, retryable):
+    assert RetryPolicy().is_retryable(exc) is retryable
+
+
+@pytest.mark.parametrize("attempt, upper_bound", [(1, 1), (2, 2), (3, 4), (5, 16), (6, 30), (20, 30)])
+def test_full_jitter_bounds(monkeypatch, attempt, upper_bound):
+    policy = RetryPolicy(base_delay=1, max_delay=30)
+    bounds = []
+    monkeypatch.setattr(retry, "random", SimpleNamespace(uniform=lambda low, high: bounds.append((low, high)) or high))
+
+    assert policy.get_delay(attempt, httpx.ConnectError("refused")) == upper_bound
+    assert bounds == [(0, upper_bound)]
+
+
+@pytest.mark.parametrize("value, delay", [
+    ("5", 5),
+    ("0.5", 0.5),
+    ("-3", 0),
+    (format_datetime(NOW + timedelta(seconds=20), usegmt=True), 20),
+    (format_datetime(NOW - timedelta(seconds=20), usegmt=True), 0),
+    ("soon", None),
+])
+def test_retry_after_parsing(monkeypatch, value, delay):
+    monkeypatch.setattr(retry, "time", SimpleNamespace(time=NOW.timestamp))
+
+    assert RetryPolicy().get_retry_after(httpx.Response(503, headers={"Retry-After": value})) == delay
+
+
+def test_retry_after_is_capped_and_falls_back_to_backoff(monkeypatch):
+    policy = RetryPolicy(base_delay=1, max_retry_after=60)
+    monkeypatch.setattr(retry, "random", SimpleNamespace(uniform=lambda low, high: high))
+
+    assert policy.get_delay(1, status_error(429, {"Retry-After": "3600"})) == 60
+    assert policy.get_delay(1, status_error(429, {"Retry-After": "soon"})) == 1
+    assert policy.get_delay(2, status_error(503)) == 2
+
+
+@pytest.mark.parametrize("retry_after, calls", [("0", 2), ("5", 1)])
+async def test_retry_that_does_not_fit_deadline_is_skipped(retry_after, calls):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503, headers={"Retry-After": retry_after})
+
+    client = BaseAPIClient(base_url="http://upstream", name="test",
+                           retry_policy=RetryPolicy(attempts=2, deadline=1),
+                           limiter=AsyncReservationLimiter(rate=1000, period=timedelta(seconds=1)))
+    client.client = httpx.AsyncClient(base_url="http://upstream", transport=httpx.MockTransport(handler))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.make_request("GET", "/")
+    assert len(requests) == calls
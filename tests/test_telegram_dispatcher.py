@@ -0,0 +1,130 @@
+import time
+import asyncio
+
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils import limiters, telegram_dispatcher
+from utils.api_clients.telegram_api_client import TelegramAPIClient, TelegramRetryPolicy
+from utils.limiters import AsyncTokenBucketLimiter
+from utils.telegram_dispatcher import TelegramDispatcher
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    fake_time = SimpleNamespace(monotonic=clock.monotonic, perf_counter=time.perf_counter)
+    monkeypatch.setattr(limiters, "time", fake_time)
+    monkeypatch.setattr(telegram_dispatcher, "time", fake_time)
+    return clock
+
+
+def test_token_bucket_reserves_debt_in_order(clock):
+    bucket = AsyncTokenBucketLimiter(add_speed=2, rate=1)
+
+    # Every caller takes its token at once and waits for the debt before it: no overshoot, FIFO
+    assert [bucket.reserve() for _ in range(4)] == [0, 0.5, 1.0, 1.5]
+    clock.now += 1
+    assert bucket.reserve() == 1.0
+    assert not bucket.is_idle()
+
+    clock.now += 10
+    assert bucket.is_idle()
+    assert bucket.tokens == 1  # Refilled up to the bucket size only
+
+
+def test_idle_chat_buckets_are_evicted_least_recently_used_first(clock):
+    dispatcher = TelegramDispatcher(chat_rate=1, max_chats=2)
+
+    dispatcher._get_bucket("1").reserve()
+    dispatcher._get_bucket("2").reserve()
+    clock.now += 1  # Both refilled
+    dispatcher._get_bucket("1").reserve()  # "1" is used again: busy and most recent
+    dispatcher._get_bucket("3").reserve()
+
+    assert list(dispatcher.chat_buckets) == ["1", "3"]
+
+    # A bucket which isn't full yet still holds the chat limit and is kept above max_chats
+    dispatcher._get_bucket("4").reserve()
+    assert list(dispatcher.chat_buckets) == ["1", "3", "4"]
+
+
+def test_group_and_private_chats_have_own_rates():
+    dispatcher = TelegramDispatcher(chat_rate=1, group_rate=20)
+
+    assert dispatcher._get_bucket("-100123").add_speed == pytest.approx(20 / 60)
+    assert dispatcher._get_bucket("@channel").add_speed == pytest.approx(20 / 60)
+    assert dispatcher._get_bucket("123").add_speed == 1
+
+
+def test_retry_policy_reads_retry_after_from_body():
+    policy = TelegramRetryPolicy()
+    body = {"ok": False, "error_code": 429, "parameters": {"retry_after": 7}}
+
+    assert policy.get_retry_after(httpx.Response(429, json=body)) == 7
+    assert policy.get_retry_after(httpx.Response(429, json={"ok": False}, headers={"Retry-After": "3"})) == 3
+    assert policy.get_retry_after(httpx.Response(429, text="Too Many Requests")) is None
+    assert 429 not in policy.retry_statuses
+
+
+def make_client(handler, **dispatcher_kwargs) -> TelegramAPIClient:
+    dispatcher = TelegramDispatcher(global_rate=1000, chat_rate=1000, **dispatcher_kwargs)
+    client = TelegramAPIClient(dispatcher)
+    client.client = httpx.AsyncClient(base_url="http://telegram", transport=httpx.MockTransport(handler))
+    return client
+
+
+def flood_response(retry_after: float) -> httpx.Response:
+    return httpx.Response(429, json={"ok": False, "error_code": 429, "parameters": {"retry_after": retry_after}})
+
+
+async def test_retry_after_pauses_only_that_chat():
+    calls: dict[str, int] = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        chat_id = dict(httpx.QueryParams(request.content.decode()))["chat_id"]
+        calls[chat_id] = calls.get(chat_id, 0) + 1
+        if chat_id == "1" and calls[chat_id] == 1:
+            return flood_response(0.2)
+        return httpx.Response(200, json={"ok": True})
+
+    client = make_client(handler)
+    finished_at = {}
+
+    async def send(chat_id: int) -> None:
+        await client.send_message("text", chat_id)
+        finished_at[chat_id] = time.perf_counter()
+
+    started = time.perf_counter()
+    await asyncio.gather(send(1), send(2))
+
+    assert calls == {"1": 2, "2": 1}  # The 429 is repeated once by the dispatcher, not by the retry policy
+    assert finished_at[2] - started < 0.1
+    assert finished_at[1] - started >= 0.2
+    assert client.dispatcher.stats()["retried"] == 1
+
+
+async def test_flood_control_gives_up_after_max_attempts():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return flood_response(0.01)
+
+    client = make_client(handler, max_attempts=3)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.send_message("text", 1)
+    assert len(calls) == 3
@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+
+from services.usedesk_service import UsedeskService, USEDESK_TEMPLATES_DIR, get_age
+from utils.agent_schedule import AgentScheduleIndex
+from utils.templates import TemplateRegistry, TemplateNotFoundException
+
+# The reply texts as they were hardcoded in UsedeskService before the templates, without the indentation
+SNAPSHOTS_DIR = Path(__file__).parent / "snapshots/usedesk"
+
+
+@pytest.fixture
+def registry() -> TemplateRegistry:
+    registry = TemplateRegistry(USEDESK_TEMPLATES_DIR)
+    registry.load()
+    return registry
+
+
+def make_service(registry: TemplateRegistry) -> UsedeskService:
+    return UsedeskService(api_client=None, agent_index=AgentScheduleIndex([]), templates=registry)
+
+
+def born_years_ago(years: int) -> datetime:
+    today = date.today()
+    return datetime(today.year - years, today.month, min(today.day, 28))
+
+
+def test_every_kind_has_snapshot(registry):
+    assert registry.kinds() == sorted(path.stem for path in (SNAPSHOTS_DIR / "ru").glob("*.html"))
+
+
+@pytest.mark.parametrize("kind", ["adult", "teenager", "incorrect_birth_year"])
+def test_render_matches_snapshot(registry, kind):
+    assert registry.render(kind) == (SNAPSHOTS_DIR / "ru" / f"{kind}.html").read_text(encoding="utf-8").strip()
+
+
+@pytest.mark.parametrize("age, kind", [
+    (-1, "incorrect_birth_year"),  # Birthday in the future
+    (0, "incorrect_birth_year"),
+    (11, "incorrect_birth_year"),
+    (12, "teenager"),
+    (17, "teenager"),
+    (18, "adult"),
+    (90, "adult"),
+])
+def test_notification_kind_by_age(registry, age, kind):
+    assert make_service(registry).get_notification_kind(born_years_ago(age)) == kind
+
+
+@pytest.mark.parametrize("today, age", [
+    (date(2025, 2, 28), 16),
+    (date(2025, 3, 1), 17),
+    (date(2028, 2, 28), 19),
+    (date(2028, 2, 29), 20),
+])
+def test_age_of_leap_day_birthday(today, age):
+    assert get_age(date(2008, 2, 29), today) == age
+
+
+def test_notification_kinds_come_from_templates(tmp_path):
+    (tmp_path / "ru").mkdir()
+    for kind, meta in [("adult", "{% set min_age = 18 %}{% set max_age = 65 %}"),
+                       ("senior", "{% set min_age = 65 %}"),
+                       ("footer", "")]:  # Not an age notification
+        (tmp_path / "ru" / f"{kind}.html").write_text(f"{meta}{kind}", encoding="utf-8")
+    registry = TemplateRegistry(tmp_path)
+    registry.load()
+    service = make_service(registry)
+
+    assert registry.get_meta("senior") == {"min_age": 65}
+    assert service.get_notification_kind(born_years_ago(70)) == "senior"
+    assert service.get_notification_kind(born_years_ago(30)) == "adult"
+    with pytest.raises(TemplateNotFoundException):
+        service.get_notification_kind(born_years_ago(10))
+
+
+def test_missing_locale_falls_back_to_default(registry):
+    assert registry.render("adult", "en") == registry.render("adult")
+    assert registry.get_meta("adult", "en") == {"min_age": 18}
+    with pytest.raises(TemplateNotFoundException):
+        registry.render("missing")
@@ -0,0 +1,16 @@
+import sys
+
+from utils import tracing
+
+
+def test_otlp_without_exporter_falls_back_to_off(monkeypatch):
+    monkeypatch.setattr(tracing, "OTEL_TRACING", "otlp")
+    monkeypatch.setattr(tracing, "_tracer", None)
+    # A None entry makes the import raise ImportError, as if the package were not installed
+    monkeypatch.setitem(sys.modules, "opentelemetry.exporter.otlp.proto.http.trace_exporter", None)
+
+    tracing.setup_tracing()
+
+    assert tracing._tracer is None
+    with tracing.start_span("span"):
+        pass
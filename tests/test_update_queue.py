@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from aiogram import types
+
+from bot.update_queue import UpdateQueue, UpdateQueueFullException
+
+pytestmark = pytest.mark.anyio
+
+
+async def make_full_queue() -> UpdateQueue:
+    update_queue = UpdateQueue(dp=None, bot=None, maxsize=1, put_timeout=0.1)
+    update_queue.is_accepting = True  # No workers: the queue stays full
+    assert await update_queue.put(types.Update(update_id=1))
+    return update_queue
+
+
+async def test_redelivery_during_blocked_put_is_not_queued_twice():
+    update_queue = await make_full_queue()
+
+    first = asyncio.create_task(update_queue.put(types.Update(update_id=2)))
+    await asyncio.sleep(0.01)
+    with pytest.raises(UpdateQueueFullException):
+        await update_queue.put(types.Update(update_id=2))  # Asked to come back, not accepted nor dropped
+    update_queue.queue.get_nowait()  # A worker takes update 1
+
+    assert await first
+    assert not await update_queue.put(types.Update(update_id=2))
+    assert update_queue.queue.qsize() == 1
+
+
+async def test_rejected_update_is_accepted_on_redelivery():
+    update_queue = await make_full_queue()
+
+    with pytest.raises(UpdateQueueFullException):
+        await update_queue.put(types.Update(update_id=2))
+    update_queue.queue.get_nowait()
+
+    assert await update_queue.put(types.Update(update_id=2))
@@ -0,0 +1,129 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from models.ticket import TicketRequest
+from services.reactivation_service import ReactivationService
+from services.usedesk_service import UsedeskService
+from services.usedesk_ingestion import UsedeskIngestionService, USEDESK_INGEST_KEY
+
+from utils.checkpoint import MemoryCheckpointStore
+
+pytestmark = pytest.mark.anyio
+
+TICKETS = [{"id": i, "subject": "s", "email": f"user{i}@example.com", "status_id": 1} for i in range(101, 107)]
+
+
+async def get_new_tickets(last_id: int, search: str | None = None, max_pages: int = 10,
+                          page: int = 0, below: int | None = None) -> tuple[list[dict], int | None]:
+    return [ticket for ticket in TICKETS if ticket["id"] > last_id], None
+
+
+class SlowReactivationService(ReactivationService):
+    def __init__(self):
+        super().__init__(leader_services=None, job_queue=None, concurrency=2)
+        self.started: list[str] = []
+        self.finished: list[str] = []
+
+    async def process_ticket(self, ticket: TicketRequest) -> dict:
+        self.started.append(ticket.id)
+        await asyncio.sleep(0.2)  # Unlock and approve, must not be cut
+        self.finished.append(ticket.id)
+        return {"ticket_id": ticket.id, "status": "reactivated", "message": ""}
+
+
+def make_ingestion() -> UsedeskIngestionService:
+    store = MemoryCheckpointStore()
+    store.values[USEDESK_INGEST_KEY] = {"last_id": 100, "retries": {}}
+    return UsedeskIngestionService(SimpleNamespace(get_new_tickets=get_new_tickets),
+                                   SlowReactivationService(),
+                                   store,
+                                   batch_size=2)
+
+
+async def test_stop_finishes_current_batch_and_saves_cursor():
+    ingestion = make_ingestion()
+    await ingestion.start(interval=60)
+    await asyncio.sleep(0.1)  # In the middle of the first batch
+
+    await ingestion.stop()
+
+    reactivation_service = ingestion.reactivation_service
+    assert reactivation_service.started == ["101", "102"]
+    assert sorted(reactivation_service.finished) == ["101", "102"]
+    # The next poll starts from the first ticket nobody has taken
+    assert (await ingestion.checkpoint_store.get(USEDESK_INGEST_KEY))["last_id"] == 102
+    assert await ingestion.checkpoint_store.acquire_lock(USEDESK_INGEST_KEY, ttl=10) is not None
+
+
+async def test_stop_timeout_cancels_poll_but_not_started_tickets():
+    ingestion = make_ingestion()
+    await ingestion.start(interval=60)
+    await asyncio.sleep(0.1)
+
+    await ingestion.stop(timeout=0.01)
+    await asyncio.sleep(0.2)
+
+    reactivation_service = ingestion.reactivation_service
+    assert sorted(reactivation_service.finished) == sorted(reactivation_service.started) == ["101", "102"]
+    # The cursor isn't moved, the processed tickets are skipped by the next poll as seen
+    assert (await ingestion.checkpoint_store.get(USEDESK_INGEST_KEY))["last_id"] == 100
+    assert await ingestion.checkpoint_store.acquire_lock(USEDESK_INGEST_KEY, ttl=10) is not None
+
+
+class PagedTicketsClient:
+    """
+    Usedesk ticket list, newest first, two tickets per page.
+    """
+
+    def __init__(self, ids: list[int]):
+        self.ids = ids
+
+    async def get_tickets(self, page: int = 0, search: str | None = None) -> list[dict]:
+        ids = sorted(self.ids, reverse=True)[page * 2:page * 2 + 2]
+        return [{"id": i, "subject": "s", "email": f"user{i}@example.com", "status_id": 1} for i in ids]
+
+
+class RecordingReactivationService(ReactivationService):
+    def __init__(self):
+        super().__init__(leader_services=None, job_queue=None, concurrency=2)
+        self.processed: list[str] = []
+
+    async def process_ticket(self, ticket: TicketRequest) -> dict:
+        self.processed.append(ticket.id)
+        return {"ticket_id": ticket.id, "status": "reactivated", "message": ""}
+
+
+async def test_backlog_longer_than_max_pages_is_continued_by_next_polls():
+    client = PagedTicketsClient(list(range(101, 111)))
+    store = MemoryCheckpointStore()
+    store.values[USEDESK_INGEST_KEY] = {"last_id": 100, "retries": {}}
+    ingestion = UsedeskIngestionService(UsedeskService(client, agent_index=object(), templates=object()),
+                                        RecordingReactivationService(),
+                                        store,
+                                        max_pages=2)
+
+    # 10 new tickets, 4 per poll: the newest are processed, the cursor stays before the ones not fetched
+    await ingestion.poll()
+    assert sorted(ingestion.reactivation_service.processed) == ["107", "108", "109", "110"]
+    assert store.values[USEDESK_INGEST_KEY]["last_id"] == 100
+
+    # New tickets shift the pages forward, deleted ones shift them back: nothing is skipped or repeated
+    client.ids += [111, 112]
+    await ingestion.poll()
+    client.ids.remove(110)
+    client.ids.remove(109)
+    client.ids.remove(108)
+    for _ in range(5):
+        await ingestion.poll()
+        if "scan" not in store.values[USEDESK_INGEST_KEY]:
+            break
+    assert sorted(ingestion.reactivation_service.processed) == [str(i) for i in range(101, 111)]
+    assert store.values[USEDESK_INGEST_KEY]["last_id"] == 110
+
+    # The tickets that came during the scan are taken by the next one
+    await ingestion.poll()
+    assert sorted(ingestion.reactivation_service.processed) == [str(i) for i in range(101, 113)]
+    assert store.values[USEDESK_INGEST_KEY]["last_id"] == 112
@@ -0,0 +1,80 @@
+import asyncio
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from models.ticket import TicketRequest
+from services.reactivation_jobs import register_reactivation_jobs, USEDESK_REPLY_JOB
+from services.usedesk_service import UsedeskService, UsedeskReplyException, REPLY_COMMENT_STEP
+
+from utils.agent_schedule import AgentScheduleIndex
+from utils.job_queue import MemoryJobQueue
+
+pytestmark = pytest.mark.anyio
+
+TICKET = TicketRequest(id="1", subject="s", client_email="user@example.com", status="1")
+BIRTHDAY = datetime(1990, 1, 1)
+
+
+class FlakyUsedeskAPIClient:
+    def __init__(self, comment_failures: int = 0, update_failures: int = 0):
+        self.comment_failures = comment_failures
+        self.update_failures = update_failures
+        self.calls: list[str] = []
+
+    async def send_message(self, message, ticket_id, file_paths=None, agent_id=None) -> None:
+        self.calls.append("comment")
+        if self.comment_failures > 0:
+            self.comment_failures -= 1
+            raise ConnectionError("Usedesk is unreachable")
+
+    async def update_ticket(self, ticket_id, category_lid) -> None:
+        self.calls.append("update")
+        if self.update_failures > 0:
+            self.update_failures -= 1
+            raise ConnectionError("Usedesk is unreachable")
+
+
+def make_service(api_client: FlakyUsedeskAPIClient) -> UsedeskService:
+    return UsedeskService(api_client, agent_index=AgentScheduleIndex([]))
+
+
+async def test_failed_comment_does_not_close_ticket():
+    api_client = FlakyUsedeskAPIClient(comment_failures=1)
+
+    with pytest.raises(UsedeskReplyException) as exc_info:
+        await make_service(api_client).reply_to_reactivated_user(TICKET, BIRTHDAY)
+
+    assert api_client.calls == ["comment"]
+    assert exc_info.value.done_steps == set()
+
+
+@pytest.mark.parametrize("comment_failures, update_failures, calls", [
+    (1, 0, ["comment", "comment", "update"]),
+    (0, 1, ["comment", "update", "update"]),
+])
+async def test_reply_job_retries_only_failed_step_in_order(comment_failures, update_failures, calls):
+    api_client = FlakyUsedeskAPIClient(comment_failures, update_failures)
+    queue = MemoryJobQueue("test", workers=1, retry_delay=0.01)
+    register_reactivation_jobs(queue, make_service(api_client), SimpleNamespace())
+
+    await queue.enqueue(USEDESK_REPLY_JOB, {"ticket": TICKET.model_dump(), "birthday": BIRTHDAY.isoformat()},
+                        idempotency_key=TICKET.id)
+    await queue.start()
+    await asyncio.sleep(0.1)
+    await queue.stop()
+
+    # The comment is posted once and always before the ticket is closed
+    assert api_client.calls == calls
+    assert queue.dead == []
+
+
+async def test_done_comment_is_not_repeated():
+    api_client = FlakyUsedeskAPIClient()
+
+    done_steps = await make_service(api_client).reply_to_reactivated_user(TICKET, BIRTHDAY, {REPLY_COMMENT_STEP})
+
+    assert api_client.calls == ["update"]
+    assert len(done_steps) == 2
@@ -0,0 +1,58 @@
+import httpx
+import orjson
+import pytest
+
+from fastapi import FastAPI
+
+from dependencies import reactivation_service_dependency
+from models.ticket import TicketRequest
+from routers.leader import user_router
+from services.reactivation_service import ReactivationService
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeReactivationService(ReactivationService):
+    def __init__(self):
+        super().__init__(leader_services=None, job_queue=None)
+        self.processed: list[str] = []
+
+    async def process_ticket(self, ticket: TicketRequest) -> dict:
+        self.processed.append(ticket.id)
+        return {"ticket_id": ticket.id, "status": "reactivated", "message": ""}
+
+
+@pytest.fixture
+def service() -> FakeReactivationService:
+    return FakeReactivationService()
+
+
+@pytest.fixture
+async def client(service):
+    app = FastAPI()
+    app.include_router(user_router.router)
+    app.dependency_overrides[reactivation_service_dependency] = lambda: service
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+def make_tickets(count: int) -> list[dict]:
+    return [{"id": str(i), "subject": "s", "client_email": f"user{i}@example.com", "status": "1"}
+            for i in range(count)]
+
+
+async def test_batch_streams_a_result_per_ticket(client, service):
+    max_size = user_router.REACTIVATION_BATCH_MAX_SIZE
+    response = await client.post("/user/reactivate-and-notify/batch", json=make_tickets(max_size))
+
+    assert response.status_code == 200
+    assert len([orjson.loads(line) for line in response.text.splitlines()]) == max_size
+
+
+async def test_batch_over_the_cap_is_rejected_before_processing(client, service):
+    max_size = user_router.REACTIVATION_BATCH_MAX_SIZE
+    response = await client.post("/user/reactivate-and-notify/batch", json=make_tickets(max_size + 1))
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "too_long"
+    assert service.processed == []
@@ -0,0 +1,96 @@
+import time
+import bisect
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from models.agents import Agent
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+
+class AgentScheduleIndex:
+    def __init__(self, agents: list[Agent], timezone: str = "Europe/Moscow"):
+        """
+        Agent schedules compiled into sorted week-minute segments, each with the tuple of agents on duty.
+        Shifts are half-open [start_time, end_time) with minute precision, a shift with end_time <= start_time
+        ends on the next day. Overlapping shifts are allowed: the agents of a segment are taken round-robin.
+
+        :param agents: Agent roster.
+        :param timezone: Timezone of the schedule times.
+        """
+        self.tz = pytz.timezone(timezone)
+
+        intervals = []  # (start, end) in week minutes, end may exceed WEEK_MINUTES
+        for agent in agents:
+            for schedule in agent.schedule:
+                start_minute = schedule.start_time.hour * 60 + schedule.start_time.minute
+                end_minute = schedule.end_time.hour * 60 + schedule.end_time.minute
+                if end_minute <= start_minute:
+                    end_minute += DAY_MINUTES
+                for weekday in schedule.weekdays:
+                    start = weekday * DAY_MINUTES + start_minute
+                    intervals.append((start, weekday * DAY_MINUTES + end_minute, agent.usedesk_id))
+
+        boundaries = {0}
+        for start, end, _ in intervals:
+            boundaries.add(start % WEEK_MINUTES)
+            boundaries.add(end % WEEK_MINUTES)
+        self.starts = sorted(boundaries)
+
+        self.on_duty: list[tuple[int, ...]] = []
+        for segment_start in self.starts:
+            agent_ids = []
+            for start, end, agent_id in intervals:
+                # The segment start may be covered by the interval itself or by its part wrapped over the week end
+                if (start <= segment_start < end or start <= segment_start + WEEK_MINUTES < end) \
+                        and agent_id not in agent_ids:
+                    agent_ids.append(agent_id)
+            self.on_duty.append(tuple(agent_ids))
+
+        self.round_robin = [0] * len(self.starts)
+        self.cached_segment: tuple[float, float, int] | None = None  # (valid from, valid until, segment index)
+
+    def _find_segment(self, now: datetime) -> tuple[int, datetime]:
+        """
+        :return: Segment index and the moment the segment ends.
+        """
+        week_minute = now.weekday() * DAY_MINUTES + now.hour * 60 + now.minute
+        index = bisect.bisect_right(self.starts, week_minute) - 1
+        segment_end = self.starts[index + 1] if index + 1 < len(self.starts) else WEEK_MINUTES
+        until = now.replace(second=0, microsecond=0) + timedelta(minutes=segment_end - week_minute)
+        return index, until
+
+    def _get_segment(self, now: datetime | None = None) -> tuple[int, float]:
+        if now is None:
+            timestamp = time.time()
+            if self.cached_segment is not None and self.cached_segment[0] <= timestamp < self.cached_segment[1]:
+                return self.cached_segment[2], self.cached_segment[1]
+            now = datetime.fromtimestamp(timestamp, self.tz)
+            index, until = self._find_segment(now)
+            self.cached_segment = (timestamp, until.timestamp(), index)
+            return index, until.timestamp()
+
+        index, until = self._find_segment(now.astimezone(self.tz))
+        return index, until.timestamp()
+
+    def get_on_duty(self, now: datetime | None = None) -> tuple[tuple[int, ...], datetime]:
+        """
+        :return: Agents on duty and the moment this shift composition ends.
+        """
+        index, until = self._get_segment(now)
+        return self.on_duty[index], datetime.fromtimestamp(until, self.tz)
+
+    def get_current_agent_id(self, now: datetime | None = None) -> int | None:
+        """
+        :return: Usedesk id of an agent on duty (round-robin among them), None if nobody is on duty.
+        """
+        index, _ = self._get_segment(now)
+        agent_ids = self.on_duty[index]
+        if not agent_ids:
+            return None
+        position = self.round_robin[index]
+        self.round_robin[index] = (position + 1) % len(agent_ids)
+        return agent_ids[position]
@@ -1,7 +1,15 @@
+import os
+import time
 import httpx
 import asyncio
 
-from utils.limiters import AsyncSlidingWindowLimiter
+from utils.api_clients.http_pool import HTTPPoolConfig, get_pool_stats
+from utils.circuit_breaker import CircuitBreaker
+from utils.limiters import create_limiter
+from utils.metrics import (UPSTREAM_REQUEST_SECONDS, UPSTREAM_RETRIES, UPSTREAM_IN_FLIGHT,
+                           LIMITER_WAIT_SECONDS, LIMITER_QUEUE_DEPTH, normalize_endpoint)
+from utils.retry import RetryPolicy
+from utils.tracing import inject_context, start_span
 
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -14,58 +22,131 @@ class BaseAPIClient:
     def __init__(
             self,
             base_url="",
+            name="default",
             retry_attempts=3,
             retry_delay=1.0,
             limiter_rate: int | None = None,
-            limiter_period: timedelta | None = None):
+            limiter_period: timedelta | None = None,
+            limiter=None,
+            retry_policy: RetryPolicy | None = None,
+            circuit_breaker: CircuitBreaker | None = None,
+            pool_config: HTTPPoolConfig | None = None):
         """
             :param base_url: API base url.
+            :param name: Upstream API name. Clients with the same name share the limiter window in Redis.
 
             :param retry_attempts: Number of repeated calls. Default 3.
-            :param retry_delay: Delay between repeated calls in seconds. Default 1.
+            :param retry_delay: Backoff base delay between repeated calls in seconds. Default 1.
+            :param retry_policy: Full retry policy, overrides retry_attempts and retry_delay.
 
-            :param limiter_rate: Maximum number of transactions per period.
-            :param limiter_period: Duration of the period.
+            :param limiter_rate: Maximum number of transactions per period. Overridden by <NAME>_RATE_LIMIT.
+            :param limiter_period: Duration of the period. Overridden by <NAME>_RATE_PERIOD (seconds).
+            :param limiter: Ready limiter instance. By default, one is created for RATE_LIMITER_BACKEND.
+
+            :param circuit_breaker: Circuit breaker of the upstream. By default, one is created per client.
+
+            :param pool_config: Connection pool and timeouts. By default, read from <NAME>_HTTP_* variables.
         """
         self.base_url = base_url
-        self.client = httpx.AsyncClient(base_url=base_url)
-        self.retry_attempts = retry_attempts
-        self.retry_delay = retry_delay
-        self.limiter = AsyncSlidingWindowLimiter(
+        self.name = name
+        self.pool_config = pool_config or HTTPPoolConfig.from_env(name)
+        self.client = self.pool_config.create_client(base_url)
+        self.in_flight = 0  # Requests currently waiting for a response
+        self.retry_policy = retry_policy or RetryPolicy(attempts=retry_attempts, base_delay=retry_delay)
+
+        # Upstream quotas differ between accounts and environments (e.g. local mocks in benchmarks/loadtest)
+        rate_limit = os.getenv(f"{name.upper()}_RATE_LIMIT")
+        rate_period = os.getenv(f"{name.upper()}_RATE_PERIOD")
+        if rate_limit:
+            limiter_rate = int(rate_limit)
+        if rate_period:
+            limiter_period = timedelta(seconds=float(rate_period))
+        self.limiter = limiter or create_limiter(
+            name=name,
             rate=limiter_rate if limiter_rate is not None else 5,
             period=limiter_period if limiter_period is not None else timedelta(seconds=1)
         )
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(name)
 
     async def make_request(self,
                            method: str,
                            endpoint: str,
                            should_retry: bool = True,
                            attempts: int = None,
-                           delay: int = None,
+                           delay: float = None,
                            **kwargs) -> httpx.Response:
-        # Use default values
-        if attempts is None:
-            attempts = self.retry_attempts
-        if delay is None:
-            delay = self.retry_delay
-
-        while attempts > 0:
-            attempts -= 1
+        policy = self.retry_policy
+        if attempts is not None:
+            policy = policy.replace(attempts=attempts)
+        if delay is not None:
+            policy = policy.replace(base_delay=delay)
+        deadline = time.monotonic() + policy.deadline if policy.deadline is not None else None
+        endpoint_label = normalize_endpoint(endpoint)
+
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                await self.limiter.acquire()  # Obtaining permission from the limiter
-                response = await self.client.request(method, endpoint, **kwargs)
+                # Fail fast while the upstream is unhealthy (CircuitOpenException is never retried)
+                self.circuit_breaker.before_call()
+                try:
+                    with start_span(f"{self.name} limiter"):
+                        await self._acquire_limiter()  # Obtaining permission from the limiter
+                    self.in_flight += 1
+                    UPSTREAM_IN_FLIGHT.labels(self.name).inc()
+                    started = time.perf_counter()
+                    try:
+                        with start_span(f"{self.name} {method} {endpoint_label}", attempt=attempt):
+                            # Propagate traceparent to the upstream (kwargs are reused by the next attempts)
+                            request_kwargs = {**kwargs, "headers": inject_context(kwargs.get("headers"))}
+                            response = await self.client.request(method, endpoint, **request_kwargs)
+                    finally:
+                        self.in_flight -= 1
+                        UPSTREAM_IN_FLIGHT.labels(self.name).dec()
+                except httpx.TransportError as exc:
+                    UPSTREAM_REQUEST_SECONDS.labels(self.name, method, endpoint_label, exc.__class__.__name__) \
+                        .observe(time.perf_counter() - started)
+                    self.circuit_breaker.record_failure()
+                    raise
+                except BaseException:
+                    self.circuit_breaker.release()
+                    raise
+
+                UPSTREAM_REQUEST_SECONDS.labels(self.name, method, endpoint_label, response.status_code) \
+                    .observe(time.perf_counter() - started)
+
+                if response.status_code >= 500:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
                 response.raise_for_status()
                 return response
 
             except (httpx.HTTPStatusError, httpx.RequestError) as httpx_error:
-                if not should_retry or attempts <= 0:
-                    raise httpx_error
-            except Exception as e:
-                if attempts <= 0:
-                    raise e
-
-            if attempts != 0:
-                await asyncio.sleep(delay)
+                if not should_retry or attempt >= policy.attempts or not policy.is_retryable(httpx_error):
+                    raise
+                sleep_time = policy.get_delay(attempt, httpx_error)
+                if deadline is not None and time.monotonic() + sleep_time > deadline:
+                    raise
+                reason = httpx_error.response.status_code if isinstance(httpx_error, httpx.HTTPStatusError) \
+                    else httpx_error.__class__.__name__
+                UPSTREAM_RETRIES.labels(self.name, reason).inc()
+
+            await asyncio.sleep(sleep_time)
+
+    async def _acquire_limiter(self) -> None:
+        queue_depth = LIMITER_QUEUE_DEPTH.labels(self.name)
+        queue_depth.inc()
+        started = time.perf_counter()
+        try:
+            await self.limiter.acquire()
+        finally:
+            queue_depth.dec()
+            LIMITER_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+
+    def pool_stats(self) -> dict:
+        return {"in_flight": self.in_flight, **get_pool_stats(self.client)}
 
     async def close(self):
         await self.client.aclose()
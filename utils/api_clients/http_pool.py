@@ -0,0 +1,88 @@
+import os
+import dataclasses
+
+import httpx
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class HTTPPoolConfig:
+    """
+    Connection pool and timeouts of one upstream API.
+
+    :param max_connections: Maximum number of open connections.
+    :param max_keepalive_connections: Maximum number of idle connections kept open.
+    :param keepalive_expiry: Idle connection lifetime in seconds.
+    :param connect_timeout: Connection timeout in seconds.
+    :param read_timeout: Response read timeout in seconds.
+    :param write_timeout: Request write timeout in seconds.
+    :param pool_timeout: Time in seconds to wait for a free connection in the pool.
+    :param http2: Use HTTP/2 if the server supports it (requires the "h2" package).
+    """
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "HTTPPoolConfig":
+        """
+        Reads <PREFIX>_HTTP_<FIELD> variables, e.g. LEADER_HTTP_MAX_CONNECTIONS or USEDESK_HTTP_HTTP2.
+        """
+        values = {}
+        for field in dataclasses.fields(cls):
+            value = os.getenv(f"{prefix.upper()}_HTTP_{field.name.upper()}")
+            if value is None:
+                continue
+            if field.type is bool:
+                values[field.name] = value.lower() in ("1", "true", "yes")
+            else:
+                values[field.name] = field.type(value)
+        return cls(**values)
+
+    def create_client(self, base_url="") -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 is enabled, but the 'h2' package is not installed. Using HTTP/1.1.")
+                http2 = False
+
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_keepalive_connections,
+                                keepalive_expiry=self.keepalive_expiry),
+            timeout=httpx.Timeout(connect=self.connect_timeout,
+                                  read=self.read_timeout,
+                                  write=self.write_timeout,
+                                  pool=self.pool_timeout))
+
+
+def get_pool_stats(client: httpx.AsyncClient) -> dict:
+    """
+    Current state of the client's connection pool. Relies on httpcore internals, so it degrades to an empty dict.
+    """
+    pool = getattr(client._transport, "_pool", None)
+    if pool is None:
+        return {}
+
+    connections = pool.connections
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "max_connections": pool._max_connections,
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle,
+        "http2": sum(1 for connection in connections if getattr(connection, "_connection", None) is not None
+                     and connection._connection.__class__.__name__.startswith("AsyncHTTP2")),
+    }
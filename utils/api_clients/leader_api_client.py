@@ -1,29 +1,104 @@
 import os
+import json
+import time
+import base64
+import asyncio
+
 import httpx
 
 from datetime import timedelta
+from typing import AsyncIterator
 from urllib.parse import urlencode
 
 from utils.api_clients.base_api_client import BaseAPIClient
+from utils.cache import create_cache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 LEADER_ID_API_HOST = os.getenv("LEADER_ID_API_HOST")
 
+# Refresh the token this many seconds before its "exp", so requests don't run into a 401
+TOKEN_REFRESH_MARGIN = int(os.getenv("LEADER_ID_TOKEN_REFRESH_MARGIN", 60))
+
+USER_CACHE_SIZE = int(os.getenv("LEADER_ID_USER_CACHE_SIZE", 4096))
+USER_ID_CACHE_TTL = float(os.getenv("LEADER_ID_USER_ID_CACHE_TTL", 24 * 60 * 60))  # email -> id, rarely changes
+USER_CACHE_TTL = float(os.getenv("LEADER_ID_USER_CACHE_TTL", 60))  # id -> user, status can change any time
+
 
 class LeaderAPIClient(BaseAPIClient):
     def __init__(self, **kwargs):
         super().__init__(
             base_url=LEADER_ID_API_HOST,
+            name="leader",
             limiter_rate=5,
             limiter_period=timedelta(seconds=1),
             **kwargs)
         self.email = None
         self.password = None
 
-    # TODO: Добавить сразу проверку валидности токена
-    async def update_token(self, token: str) -> None:
-        if not token.startswith("Bearer "):
-            token = f"Bearer {token}"
-        self.client.headers.update({"Authorization": token})
+        self.token_expires_at: float | None = None
+        self.token_version = 0  # Incremented on every token change
+        self.auth_lock = asyncio.Lock()
+
+        self.user_id_cache = create_cache("leader_user_id", maxsize=USER_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+        self.user_cache = create_cache("leader_user", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+    async def update_token(self, token: str, validate=True) -> None:
+        token = token.strip().removeprefix("Bearer ").strip()
+        if validate:
+            await self.validate_token(token)
+        self._set_token(token)
+
+    async def validate_token(self, token: str) -> None:
+        """
+        Checks the token with the cheapest admin request before it replaces the current one.
+
+        :raises InvalidTokenException: Leader-ID rejected the token.
+        """
+        params = {"paginationSize": 1, "paginationPage": 1}
+        try:
+            await super().make_request(
+                "GET",
+                f"/admin/users?{urlencode(params)}",
+                should_retry=False,
+                headers={"Authorization": f"Bearer {token}"})
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code in (401, 403):
+                raise InvalidTokenException(exc.response.status_code)
+            raise
+
+    def _set_token(self, token: str) -> None:
+        self.client.headers.update({"Authorization": f"Bearer {token}"})
+        self.token_expires_at = self._get_token_exp(token)
+        self.token_version += 1
+
+    @staticmethod
+    def _get_token_exp(token: str) -> float | None:
+        """
+        Reads the "exp" claim of a JWT without verifying the signature.
+        """
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def _is_token_expiring(self) -> bool:
+        return self.token_expires_at is not None and time.time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN
+
+    async def _refresh_token(self, stale_version: int) -> None:
+        """
+        Single-flight re-authentication: only one login runs at a time, other callers wait for it
+        and reuse the new token instead of logging in again.
+
+        :param stale_version: Token version the caller saw before deciding to refresh.
+        """
+        async with self.auth_lock:
+            if self.token_version != stale_version:
+                return  # Someone has already refreshed the token
+            await self.authenticate(self.email, self.password)
 
     async def authenticate(self, email, password) -> None:
         url = "/auth/login"
@@ -35,17 +110,29 @@ class LeaderAPIClient(BaseAPIClient):
             allow_reauth=False,
             json=data)
         token = response.json()["data"]["access_token"]
-        self.client.headers.update({"Authorization": f"Bearer {token}"})
+        self._set_token(token)
         self.email = email
         self.password = password
 
     async def _make_request(self, method: str, endpoint: str, allow_reauth=True, **kwargs) -> httpx.Response:
+        # Re-login is only possible with the admin credentials (not after a manual /auth token)
+        allow_reauth = allow_reauth and self.email is not None
+
+        if allow_reauth and self._is_token_expiring():
+            try:
+                await self._refresh_token(self.token_version)
+            except CaptchaNotSetException as exc:
+                # Don't retry the login on every request, try the current token until the next 401
+                logger.warning("Proactive token refresh failed: %s", exc)
+                self.token_expires_at = None
+
+        token_version = self.token_version
         try:
             return await super().make_request(method, endpoint, **kwargs)
 
         except httpx.HTTPStatusError as exc:
             if exc.response.status_code == 401 and allow_reauth:
-                await self.authenticate(self.email, self.password)
+                await self._refresh_token(token_version)
                 return await super().make_request(method, endpoint, **kwargs)
             if exc.response.status_code == 422:
                 raise CaptchaNotSetException(server_response=exc.response.text)
@@ -65,18 +152,76 @@ class LeaderAPIClient(BaseAPIClient):
             raise UserNotFoundException(query)
         return users_data
 
-    async def get_user(self, user: str | int) -> dict:
-        if isinstance(user, str):
-            user_data = await self._search_users(user)
+    async def get_users_page(self, page: int, page_size: int = 100, query: str = "") -> list[dict]:
+        """
+        :return: Users of the page of /admin/users, an empty list after the last page.
+        """
+        params = {"query": query,
+                  "paginationSize": page_size,
+                  "paginationPage": page}
+        response = await self._make_request(
+            "GET",
+            f"/admin/users?{urlencode(params)}")
+        return response.json()['data']['_items']
+
+    async def iter_users(self, page_size: int = 100, start_page: int = 1) -> AsyncIterator[tuple[int, list[dict]]]:
+        """
+        Streams all users page by page. The next page is requested while the consumer processes the current one.
+
+        :param start_page: Page to start from (to resume an interrupted pass).
+        :return: Async iterator of (page number, users of the page).
+        """
+        page = start_page
+        next_page = asyncio.create_task(self.get_users_page(page, page_size))
+        try:
+            while users := await next_page:
+                is_last = len(users) < page_size  # A short page is the last one, nothing to prefetch
+                if not is_last:
+                    next_page = asyncio.create_task(self.get_users_page(page + 1, page_size))
+                yield page, users
+                if is_last:
+                    return
+                page += 1
+        finally:
+            # The consumer stopped early or failed
+            next_page.cancel()
+            await asyncio.gather(next_page, return_exceptions=True)
+
+    async def get_user_id(self, email: str) -> int:
+        email = email.lower()
+        user_id = await self.user_id_cache.get(email)
+        if user_id is None:
+            user_data = await self._search_users(email)
             user_id = user_data[0]['id']
+            await self.user_id_cache.set(email, user_id)
+        return user_id
+
+    async def get_user(self, user: str | int, use_cache: bool = True) -> dict:
+        """
+        :param user: Email (its id is cached) or user id.
+        :param use_cache: False to read the user from Leader-ID even if cached, when a decision depends
+                          on the current status (a cached user may have been blocked since).
+        """
+        if isinstance(user, str):
+            user_id = await self.get_user_id(user)
         else:
             user_id = user
 
-        url = f"/admin/users/{user_id}"
-        response = await self._make_request(
-            "GET",
-            url)
-        return response.json()
+        user_json = await self.user_cache.get(str(user_id)) if use_cache else None
+        if user_json is None:
+            url = f"/admin/users/{user_id}"
+            response = await self._make_request(
+                "GET",
+                url)
+            user_json = response.json()
+            await self.user_cache.set(str(user_id), user_json)
+        return user_json
+
+    async def invalidate_user(self, user_id: int) -> None:
+        await self.user_cache.delete(str(user_id))
+
+    def cache_stats(self) -> dict:
+        return {"user_id": self.user_id_cache.stats(), "user": self.user_cache.stats()}
 
     async def _perform_user_action(self, user_id: int, action_path: str, check_existence: bool = False) -> dict:
         if check_existence:
@@ -84,10 +229,14 @@ class LeaderAPIClient(BaseAPIClient):
 
         data = {"userId": user_id}
         url = action_path
-        response = await self._make_request(
-            "POST",
-            url,
-            json=data)
+        try:
+            response = await self._make_request(
+                "POST",
+                url,
+                json=data)
+        finally:
+            # The user status has (or might have) changed
+            await self.invalidate_user(user_id)
         return response.json()
 
     async def unlocking_user(self, user: int, check_existence=False) -> dict:
@@ -103,6 +252,12 @@ class UserNotFoundException(Exception):
         super().__init__(f"404 User with query '{user}' not found.")
 
 
+class InvalidTokenException(Exception):
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        super().__init__(f"{status_code} Leader-ID rejected the token.")
+
+
 class CaptchaNotSetException(Exception):
     def __init__(self, server_response="Captcha is required"):
         self.message = server_response
@@ -1,21 +1,47 @@
 import os
+import dataclasses
 
 import httpx
 
-from datetime import timedelta
-
 from utils.api_clients.base_api_client import BaseAPIClient
+from utils.logger import get_logger
+from utils.retry import RetryPolicy
+from utils.telegram_dispatcher import TelegramDispatcher
+
+logger = get_logger(__name__)
 
 TELEGRAM_API_HOST = os.getenv("TELEGRAM_API_HOST")
 
 
+@dataclasses.dataclass(frozen=True)
+class TelegramRetryPolicy(RetryPolicy):
+    # 429 is rescheduled by TelegramDispatcher, which pauses only the chat that hit the limit
+    retry_statuses: frozenset[int] = RetryPolicy.retry_statuses - {429}
+
+    def get_retry_after(self, response: httpx.Response) -> float | None:
+        # Telegram reports the flood wait in the body: {"ok": false, "parameters": {"retry_after": 5}}
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return super().get_retry_after(response)
+
+
 class TelegramAPIClient(BaseAPIClient):
 
-    def __init__(self, **kwargs):
+    def __init__(self, dispatcher: TelegramDispatcher | None = None, **kwargs):
+        """
+        :param dispatcher: Outbound limits of the bot, shared with the aiogram Bot session.
+            Its global limiter is the limiter of the client, the chat limits are applied in send_message.
+        """
+        self.dispatcher = dispatcher or TelegramDispatcher()
+        if os.getenv("TELEGRAM_RATE_LIMIT") or os.getenv("TELEGRAM_RATE_PERIOD"):
+            logger.warning("TELEGRAM_RATE_LIMIT and TELEGRAM_RATE_PERIOD are ignored, "
+                           "the Telegram limits are set by TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE and TELEGRAM_GROUP_RATE.")
         super().__init__(
             base_url=TELEGRAM_API_HOST,
-            limiter_rate=20,
-            limiter_period=timedelta(minutes=1),
+            name="telegram",
+            limiter=kwargs.pop("limiter", self.dispatcher.global_limiter),
+            retry_policy=kwargs.pop("retry_policy", TelegramRetryPolicy()),
             **kwargs)
         self.token = None
 
@@ -31,7 +57,15 @@ class TelegramAPIClient(BaseAPIClient):
                 "disable_web_page_preview": no_preview,
                 "disable_notification": no_notification,
                 "parse_mode": "HTML"}
-        return await self._make_request("POST", "/sendMessage", data=data)
+        return await self.dispatcher.send(chat_id,
+                                          lambda: self._make_request("POST", "/sendMessage", data=data),
+                                          get_retry_after=self.get_retry_after,
+                                          acquire_global=False)
+
+    def get_retry_after(self, exc: Exception) -> float | None:
+        if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+            return self.retry_policy.get_retry_after(exc.response) or 1.0
+        return None
 
     async def _make_request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
         endpoint = f"/bot{self.token}" + endpoint
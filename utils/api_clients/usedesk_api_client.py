@@ -1,13 +1,12 @@
 import os
 
-import aiofiles
-
 from datetime import timedelta
 from pathlib import Path
 
 from httpx import Response
 
 from utils.api_clients.base_api_client import BaseAPIClient
+from utils.attachments import AttachmentStore
 
 USEDESK_API_HOST = os.getenv("USEDESK_API_HOST")
 
@@ -17,10 +16,12 @@ class UsedeskAPIClient(BaseAPIClient):
     def __init__(self, **kwargs):
         super().__init__(
             base_url=USEDESK_API_HOST,
+            name="usedesk",
             limiter_rate=5,
             limiter_period=timedelta(seconds=1),
             **kwargs)
         self.token = None
+        self.attachments = AttachmentStore()
 
     async def authenticate(self, api_token=None) -> None:
         if api_token:
@@ -41,15 +42,12 @@ class UsedeskAPIClient(BaseAPIClient):
 
         return await super().make_request(method, endpoint, files=files, **kwargs)
 
-    @staticmethod
-    async def prepare_files(file_paths: list[Path] | None) -> list[tuple[str, tuple[str, bytes]]] | None:
+    async def prepare_files(self, file_paths: list[Path] | None) -> list[tuple[str, tuple[str, bytes]]] | None:
         prepared_files = []
 
         for file_path in file_paths:
-            async with aiofiles.open(file_path, 'rb') as f:
-                file_name = file_path.name
-                file_content = await f.read()
-                prepared_files.append(('files[]', (file_name, file_content)))
+            file_content = await self.attachments.get(file_path)  # Cached, not read from disk every time
+            prepared_files.append(('files[]', (file_path.name, file_content)))
 
         return prepared_files if prepared_files else None
 
@@ -70,6 +68,27 @@ class UsedeskAPIClient(BaseAPIClient):
         }
         return await self._make_request("POST", "/create/comment", data=data, file_paths=file_paths)
 
+    async def get_tickets(self,
+                          page: int = 0,
+                          search: str | None = None,
+                          sort: str = "id",
+                          order: str = "desc") -> list[dict]:
+        """
+        Ticket list of the account, one page per call.
+
+        :param page: Page number ("offset"), from 0.
+        :param search: Full-text filter applied by Usedesk.
+        """
+        data = {
+            "offset": page,
+            "sort": sort,
+            "order": order,
+        }
+        if search:
+            data["search"] = search
+        response = await self._make_request("POST", "/tickets", data=data)
+        return response.json()
+
     async def update_ticket(self,
                             ticket_id,
                             category_lid,
@@ -0,0 +1,53 @@
+import time
+
+import aiofiles
+import aiofiles.os
+
+from pathlib import Path
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AttachmentStore:
+    def __init__(self, check_interval: float = 5.0):
+        """
+        Static files kept in memory. The same bytes object is handed out on every get(),
+        so building a multipart body doesn't read or copy the file again.
+
+        :param check_interval: How often (in seconds) a file is checked for changes on disk.
+        """
+        self.check_interval = check_interval
+        self.files: dict[Path, tuple[bytes, float, int]] = {}  # path -> (content, mtime, size)
+        self.checked_at: dict[Path, float] = {}
+
+    async def preload(self, paths: list[Path]) -> None:
+        for path in paths:
+            await self._load(path)
+
+    async def get(self, path: Path) -> bytes:
+        entry = self.files.get(path)
+        if entry is None:
+            return await self._load(path)
+
+        now = time.monotonic()
+        if now - self.checked_at[path] >= self.check_interval:
+            self.checked_at[path] = now
+            stat = await aiofiles.os.stat(path)
+            if (stat.st_mtime, stat.st_size) != entry[1:]:
+                logger.info("Attachment %s has changed, reloading.", path.name)
+                return await self._load(path)
+
+        return entry[0]
+
+    async def _load(self, path: Path) -> bytes:
+        stat = await aiofiles.os.stat(path)
+        async with aiofiles.open(path, 'rb') as f:
+            content = await f.read()
+        self.files[path] = (content, stat.st_mtime, stat.st_size)
+        self.checked_at[path] = time.monotonic()
+        return content
+
+    def stats(self) -> dict:
+        return {"files": len(self.files), "bytes": sum(len(entry[0]) for entry in self.files.values())}
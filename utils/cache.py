@@ -0,0 +1,168 @@
+import os
+import json
+import time
+
+from collections import OrderedDict
+from typing import Any
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from utils.logger import get_logger
+from utils.redis_client import get_redis
+
+logger = get_logger(__name__)
+
+
+class AsyncTTLCache:
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300):
+        """
+        In-memory LRU cache with per-entry TTL.
+
+        :param name: Cache name (for stats and logs).
+        :param maxsize: Maximum number of entries, the least recently used one is evicted first.
+        :param ttl: Entry lifetime in seconds.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """
+        Sets the value only if the key is absent (or expired).
+
+        :param ttl: Lifetime of this entry, the cache TTL by default.
+        :return: False if the key is already set.
+        """
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] >= now:
+            return False
+        self.entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class RedisTTLCache:
+    def __init__(self, redis: Redis, name: str, ttl: float = 300, maxsize: int = 1024):
+        """
+        TTL cache shared between replicas. Values are stored as JSON.
+        Redis errors are treated as misses, so the cache never breaks a request.
+
+        :param maxsize: Size of the local L1 cache in front of Redis.
+        """
+        self.redis = redis
+        self.name = name
+        self.ttl = ttl
+        self.local = AsyncTTLCache(name, maxsize=maxsize, ttl=min(ttl, 5))
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.local.get(key)
+        if value is None:
+            try:
+                raw = await self.redis.get(self._key(key))
+            except RedisError as e:
+                logger.warning("Cache %s: Redis error on get (%s).", self.name, e)
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                await self.local.set(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.local.set(key, value)
+        try:
+            await self.redis.set(self._key(key), json.dumps(value), px=int(self.ttl * 1000))
+        except RedisError as e:
+            logger.warning("Cache %s: Redis error on set (%s).", self.name, e)
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """
+        Sets the value only if the key is absent (or expired), atomically for all replicas.
+        If Redis is unavailable, only this replica is checked.
+
+        :param ttl: Lifetime of this entry, the cache TTL by default.
+        :return: False if the key is already set.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if await self.local.get(key) is not None:
+            return False
+        try:
+            is_added = await self.redis.set(self._key(key), json.dumps(value), px=int(ttl * 1000), nx=True)
+        except RedisError as e:
+            logger.warning("Cache %s: Redis error on add (%s).", self.name, e)
+            return await self.local.add(key, value, min(ttl, self.local.ttl))
+        if is_added:
+            await self.local.add(key, value, min(ttl, self.local.ttl))
+        return bool(is_added)
+
+    async def delete(self, key: str) -> None:
+        await self.local.delete(key)
+        try:
+            await self.redis.delete(self._key(key))
+        except RedisError as e:
+            logger.warning("Cache %s: Redis error on delete (%s).", self.name, e)
+
+    async def clear(self) -> None:
+        await self.local.clear()
+        try:
+            async for key in self.redis.scan_iter(match=self._key("*")):
+                await self.redis.delete(key)
+        except RedisError as e:
+            logger.warning("Cache %s: Redis error on clear (%s).", self.name, e)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "size": len(self.local.entries), "hits": self.hits, "misses": self.misses}
+
+
+def create_cache(name: str, maxsize: int = 1024, ttl: float = 300) -> AsyncTTLCache | RedisTTLCache:
+    """
+    Creates a cache for the backend selected by CACHE_BACKEND ("memory" or "redis").
+    """
+    if os.getenv("CACHE_BACKEND", "memory") == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisTTLCache(redis, name, ttl=ttl, maxsize=maxsize)
+        logger.warning("CACHE_BACKEND=redis, but REDIS_HOST is not set. Cache %s is in-memory.", name)
+    return AsyncTTLCache(name, maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import uuid
+
+from typing import Any
+
+from redis.asyncio import Redis
+
+from utils.logger import get_logger
+from utils.redis_client import get_redis
+
+logger = get_logger(__name__)
+
+
+class MemoryCheckpointStore:
+    """
+    Progress of long-running jobs, kept in the process: lost on restart.
+    """
+
+    def __init__(self):
+        self.values: dict[str, Any] = {}
+        self.locks: dict[str, tuple[str, float]] = {}  # key -> (owner token, expiration)
+        self.seen: dict[str, dict[str, float]] = {}
+
+    async def get(self, key: str) -> Any | None:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        self.values[key] = value
+
+    async def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        """
+        :return: Owner token for refresh_lock and release_lock, None if the lock is held by someone else.
+        """
+        now = time.monotonic()
+        if key in self.locks and self.locks[key][1] > now:
+            return None
+        token = uuid.uuid4().hex
+        self.locks[key] = (token, now + ttl)
+        return token
+
+    async def is_locked(self, key: str) -> bool:
+        return self.locks.get(key, (None, 0))[1] > time.monotonic()
+
+    async def refresh_lock(self, key: str, token: str, ttl: float) -> bool:
+        """
+        :return: False if the lock has expired and has been taken by someone else (or by nobody yet).
+        """
+        now = time.monotonic()
+        owner, expires_at = self.locks.get(key, (None, 0))
+        if owner != token or expires_at <= now:
+            return False
+        self.locks[key] = (token, now + ttl)
+        return True
+
+    async def release_lock(self, key: str, token: str) -> None:
+        if self.locks.get(key, (None, 0))[0] == token:
+            del self.locks[key]
+
+    async def get_unseen(self, key: str, members: list[str]) -> list[str]:
+        """
+        :return: The members not marked as seen (or expired), in the same order.
+        """
+        now = time.monotonic()
+        seen = self.seen.get(key, {})
+        return [member for member in members if seen.get(member, 0) <= now]
+
+    async def mark_seen(self, key: str, members: list[str], ttl: float) -> None:
+        now = time.monotonic()
+        seen = self.seen.setdefault(key, {})
+        for member, expires_at in list(seen.items()):
+            if expires_at <= now:
+                del seen[member]
+        seen.update(dict.fromkeys(members, now + ttl))
+
+
+class RedisCheckpointStore:
+    # The lock is only extended or deleted by its owner: a holder which stalled past the TTL
+    # must not touch the lock taken by someone else meanwhile
+    REFRESH_LOCK_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, redis: Redis):
+        """
+        Progress of long-running jobs in Redis: survives restarts and is shared between replicas.
+        Values are stored as JSON without a TTL, a finished job deletes its checkpoint.
+        """
+        self.redis = redis
+        self.refresh_lock_script = redis.register_script(self.REFRESH_LOCK_SCRIPT)
+        self.release_lock_script = redis.register_script(self.RELEASE_LOCK_SCRIPT)
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f"checkpoint:{key}"
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"checkpoint:{key}:lock"
+
+    @staticmethod
+    def _seen_key(key: str, member: str) -> str:
+        return f"checkpoint:{key}:seen:{member}"
+
+    async def get(self, key: str) -> Any | None:
+        raw = await self.redis.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.redis.set(self._key(key), json.dumps(value))
+
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(self._key(key))
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        """
+        :param ttl: The lock is released after this many seconds if the holder dies.
+        :return: Owner token for refresh_lock and release_lock, None if the lock is held by another process.
+        """
+        token = uuid.uuid4().hex
+        if await self.redis.set(self._lock_key(key), token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    async def is_locked(self, key: str) -> bool:
+        return bool(await self.redis.exists(self._lock_key(key)))
+
+    async def refresh_lock(self, key: str, token: str, ttl: float) -> bool:
+        """
+        :return: False if the lock has expired and has been taken by someone else (or by nobody yet).
+        """
+        return bool(await self.refresh_lock_script(keys=[self._lock_key(key)], args=[token, int(ttl * 1000)]))
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self.release_lock_script(keys=[self._lock_key(key)], args=[token])
+
+    async def get_unseen(self, key: str, members: list[str]) -> list[str]:
+        """
+        :return: The members not marked as seen (or expired), in the same order.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.exists(self._seen_key(key, member))
+            exists = await pipe.execute()
+        return [member for member, is_seen in zip(members, exists) if not is_seen]
+
+    async def mark_seen(self, key: str, members: list[str], ttl: float) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.set(self._seen_key(key, member), 1, px=int(ttl * 1000))
+            await pipe.execute()
+
+
+def create_checkpoint_store() -> MemoryCheckpointStore | RedisCheckpointStore:
+    """
+    Creates a checkpoint store for the backend selected by CHECKPOINT_BACKEND ("redis" by default, or "memory").
+    """
+    if os.getenv("CHECKPOINT_BACKEND", "redis") == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisCheckpointStore(redis)
+        logger.warning("CHECKPOINT_BACKEND=redis, but REDIS_HOST is not set. Checkpoints are not durable.")
+    return MemoryCheckpointStore()
@@ -0,0 +1,113 @@
+import os
+import time
+
+from collections import deque
+from typing import Callable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", 0.5))
+CIRCUIT_BREAKER_WINDOW_SIZE = int(os.getenv("CIRCUIT_BREAKER_WINDOW_SIZE", 20))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", 10))
+CIRCUIT_BREAKER_OPEN_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_OPEN_TIMEOUT", 30))
+
+
+class CircuitOpenException(Exception):
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit breaker '{name}' is open, retry in {retry_after:.0f}s.")
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self,
+                 name: str,
+                 failure_rate_threshold: float = CIRCUIT_BREAKER_FAILURE_RATE,
+                 window_size: int = CIRCUIT_BREAKER_WINDOW_SIZE,
+                 min_calls: int = CIRCUIT_BREAKER_MIN_CALLS,
+                 open_timeout: float = CIRCUIT_BREAKER_OPEN_TIMEOUT,
+                 half_open_max_calls: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param name: Upstream API name.
+        :param failure_rate_threshold: Share of failed calls in the window that opens the circuit.
+        :param window_size: Number of the last calls the failure rate is computed on.
+        :param min_calls: The circuit isn't opened until the window has at least this many calls.
+        :param open_timeout: Time in seconds the circuit stays open before trial calls are let through.
+        :param half_open_max_calls: Number of concurrent trial calls in the half-open state.
+        :param clock: Monotonic time source in seconds.
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.calls: deque[bool] = deque(maxlen=window_size)  # True = failure
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+
+    def before_call(self) -> None:
+        """
+        :raises CircuitOpenException: The call must not be made.
+        """
+        if self.state == self.OPEN:
+            retry_after = self.opened_at + self.open_timeout - self.clock()
+            if retry_after > 0:
+                raise CircuitOpenException(self.name, retry_after)
+            self._set_state(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenException(self.name, 0)
+            self.half_open_calls += 1
+
+    def record_success(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._set_state(self.CLOSED)
+            return
+        self.calls.append(False)
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._set_state(self.OPEN)
+            return
+        self.calls.append(True)
+        if self.state == self.CLOSED and len(self.calls) >= self.min_calls \
+                and self.failure_rate >= self.failure_rate_threshold:
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """
+        The call was allowed but ended without a result (e.g. it was cancelled).
+        """
+        if self.state == self.HALF_OPEN:
+            self.half_open_calls = max(self.half_open_calls - 1, 0)
+
+    @property
+    def failure_rate(self) -> float:
+        return sum(self.calls) / len(self.calls) if self.calls else 0.0
+
+    def _set_state(self, state: str) -> None:
+        logger.warning("Circuit breaker '%s': %s -> %s (failure rate %.0f%%).",
+                       self.name, self.state, state, self.failure_rate * 100)
+        self.state = state
+        self.half_open_calls = 0
+        if state == self.OPEN:
+            self.opened_at = self.clock()
+        if state == self.CLOSED:
+            self.calls.clear()
+
+    def state_info(self) -> dict:
+        info = {"state": self.state, "failure_rate": round(self.failure_rate, 3), "calls_in_window": len(self.calls)}
+        if self.state == self.OPEN:
+            info["retry_after"] = round(max(self.opened_at + self.open_timeout - self.clock(), 0), 1)
+        return info
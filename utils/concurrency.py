@@ -0,0 +1,68 @@
+import asyncio
+
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Tasks left running after their consumer has gone, referenced until they finish
+_detached_tasks: set[asyncio.Task] = set()
+
+
+async def bounded_as_completed(func: Callable[[T], Awaitable[R]],
+                               items: Iterable[T],
+                               concurrency: int,
+                               on_abandoned: Callable[[R], None] | None = None) -> AsyncIterator[R]:
+    """
+    Runs func(item) for the items, at most `concurrency` at the same time, and yields the results as they complete.
+
+    If the consumer stops early (closes the iterator or is cancelled), the items that haven't started are cancelled,
+    but the started ones are never interrupted: a call cut in the middle could, for example, unlock a user without
+    approving them. They are waited for before the iterator closes; if the wait itself is cancelled,
+    they keep running in the background.
+
+    :param on_abandoned: Receives the results of the started items nobody has consumed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    started: set[asyncio.Task] = set()
+    consumed: set[asyncio.Task] = set()
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            started.add(asyncio.current_task())
+            return await func(item)
+
+    tasks = [asyncio.create_task(run(item)) for item in items]
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                consumed.add(task)
+                yield task.result()
+    finally:
+        for task in tasks:
+            if task not in started:
+                task.cancel()
+
+        abandoned = [task for task in tasks if task in started and task not in consumed]
+        for task in abandoned:
+            _detached_tasks.add(task)
+            task.add_done_callback(_detached_tasks.discard)
+            task.add_done_callback(lambda t: _report_abandoned(t, on_abandoned))
+        if abandoned:
+            # asyncio.wait doesn't cancel the tasks if this wait is cancelled
+            await asyncio.wait(abandoned)
+
+
+def _report_abandoned(task: asyncio.Task, on_abandoned: Callable | None) -> None:
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error("Task finished after its consumer had gone, with an error: %s", task.exception())
+    elif on_abandoned is not None:
+        on_abandoned(task.result())
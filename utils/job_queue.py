@@ -0,0 +1,391 @@
+import os
+import abc
+import time
+import random
+import socket
+import asyncio
+
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from models.job import Job
+
+from utils.logger import get_logger, request_id_var
+from utils.redis_client import get_redis
+from utils.tracing import inject_context, start_span, use_context
+
+logger = get_logger(__name__)
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+
+class BaseJobQueue(abc.ABC):
+    # First delay (doubled up to the maximum) before retrying an ack, retry or dead letter that failed in the storage
+    SETTLE_RETRY_DELAY = 1.0
+    MAX_SETTLE_RETRY_DELAY = 30.0
+
+    def __init__(self,
+                 name: str,
+                 workers: int = 4,
+                 max_attempts: int = 8,
+                 retry_delay: float = 2.0,
+                 max_retry_delay: float = 300.0,
+                 idempotency_ttl: int = 7 * 24 * 60 * 60):
+        """
+        Background jobs with retries and idempotency keys, processed by a pool of async workers.
+
+        :param name: Queue name.
+        :param workers: Number of jobs processed concurrently in this process.
+        :param max_attempts: After this many failed attempts the job goes to the dead letter list.
+        :param retry_delay: First retry delay in seconds, doubled on every attempt (with jitter).
+        :param max_retry_delay: Maximum retry delay in seconds.
+        :param idempotency_ttl: How long (in seconds) an idempotency key blocks the same job from being enqueued again.
+        """
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.idempotency_ttl = idempotency_ttl
+        self.handlers: dict[str, JobHandler] = {}
+        self.tasks: list[asyncio.Task] = []
+        self.is_running = False
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        :param handler: Coroutine function receiving the job payload. The payload may be modified in place
+                        to checkpoint progress: the modified payload is what the next attempt receives.
+        """
+        self.handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: dict, idempotency_key: str, delay: float = 0) -> bool:
+        """
+        :param delay: The job is run no earlier than this many seconds from now.
+        :return: False if a job with the same idempotency key is already queued or done.
+        """
+        job = Job(kind=kind, payload=payload, idempotency_key=f"{kind}:{idempotency_key}",
+                  trace_context=inject_context(), request_id=request_id_var.get())
+        if not await self._enqueue(job, delay):
+            logger.info("Job %s is already queued or done, skipped.", job.idempotency_key)
+            return False
+        return True
+
+    async def start(self) -> None:
+        self.is_running = True
+        self.tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+                      for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stops taking new jobs and waits (up to timeout) for the jobs in progress.
+        """
+        self.is_running = False
+        done, pending = await asyncio.wait(self.tasks, timeout=timeout) if self.tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.tasks = []
+
+    def get_retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        return random.uniform(delay / 2, delay)
+
+    async def _worker(self) -> None:
+        while self.is_running:
+            try:
+                job = await self._pop()
+            except Exception as e:
+                logger.error("Job queue %s: error while taking a job: %s", self.name, e)
+                await asyncio.sleep(1)
+                continue
+            if job is None:
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        handler = self.handlers.get(job.kind)
+        request_id_var.set(job.request_id or job.id)  # Workers are long-lived tasks, reset for each job
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            # The job span continues the trace of the request that enqueued it
+            with use_context(job.trace_context), start_span(f"job {job.kind}", job_id=job.id, attempt=job.attempts + 1):
+                await handler(job.payload)
+
+        except Exception as e:
+            job.attempts += 1
+            if job.attempts >= self.max_attempts:
+                logger.error("Job %s failed %s times and was dead-lettered: %s", job.idempotency_key, job.attempts, e)
+                await self._settle(job, lambda: self._dead_letter(job))
+            else:
+                delay = self.get_retry_delay(job.attempts)
+                logger.warning("Job %s failed (attempt %s), retry in %.1fs: %s",
+                               job.idempotency_key, job.attempts, delay, e)
+                await self._settle(job, lambda: self._retry_later(job, delay))
+            return
+
+        await self._settle(job, lambda: self._ack(job))
+
+    async def _settle(self, job: Job, settle: Callable[[], Awaitable[None]]) -> None:
+        """
+        Runs the bookkeeping after the handler (ack, retry or dead letter) until the storage accepts it.
+        An error here must not kill the worker: the job would stay in progress of a live consumer,
+        which is never recovered, and the pool would lose a worker for good.
+        """
+        delay = self.SETTLE_RETRY_DELAY
+        while True:
+            try:
+                await settle()
+                return
+            except Exception as e:
+                if not self.is_running:
+                    logger.error("Job queue %s: job %s was not settled before stop: %s", self.name, job.idempotency_key, e)
+                    return
+                logger.error("Job queue %s: error while settling job %s, retry in %.1fs: %s",
+                             self.name, job.idempotency_key, delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_SETTLE_RETRY_DELAY)
+
+    # Storage backend
+    @abc.abstractmethod
+    async def _enqueue(self, job: Job, delay: float = 0) -> bool:
+        """
+        Reserves the idempotency key and queues the job in one atomic step: a job whose key is taken
+        is always queued (or done), a failure can't leave the key reserved without the job.
+
+        :return: False if the key is already reserved.
+        """
+
+    @abc.abstractmethod
+    async def _pop(self) -> Job | None:
+        ...
+
+    @abc.abstractmethod
+    async def _ack(self, job: Job) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _retry_later(self, job: Job, delay: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _dead_letter(self, job: Job) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def stats(self) -> dict:
+        ...
+
+
+class MemoryJobQueue(BaseJobQueue):
+    """
+    Non-durable queue for development and benchmarks: jobs are lost on restart.
+    """
+
+    def __init__(self, name: str, **kwargs):
+        super().__init__(name, **kwargs)
+        self.ready: asyncio.Queue[Job] = asyncio.Queue()
+        self.keys: dict[str, float] = {}
+        self.dead: list[Job] = []
+        self.delayed: set[asyncio.Task] = set()
+
+    async def _enqueue(self, job: Job, delay: float = 0) -> bool:
+        # No await between the check and the put: atomic for the event loop
+        now = time.monotonic()
+        self._prune_keys(now)
+        if job.idempotency_key in self.keys:
+            return False
+        self.keys[job.idempotency_key] = now + self.idempotency_ttl
+        if delay > 0:
+            self._push_later(job, delay)
+        else:
+            self.ready.put_nowait(job)
+        return True
+
+    def _prune_keys(self, now: float) -> None:
+        # All keys have the same TTL, so the dict (in insertion order) is also ordered by expiry
+        while self.keys:
+            key, expires_at = next(iter(self.keys.items()))
+            if expires_at > now:
+                break
+            del self.keys[key]
+
+    async def _pop(self) -> Job | None:
+        try:
+            return await asyncio.wait_for(self.ready.get(), timeout=1)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _ack(self, job: Job) -> None:
+        pass
+
+    async def _retry_later(self, job: Job, delay: float) -> None:
+        self._push_later(job, delay)
+
+    def _push_later(self, job: Job, delay: float) -> None:
+        async def push_later():
+            await asyncio.sleep(delay)
+            self.ready.put_nowait(job)
+
+        task = asyncio.create_task(push_later())
+        self.delayed.add(task)
+        task.add_done_callback(self.delayed.discard)
+
+    async def _dead_letter(self, job: Job) -> None:
+        self.dead.append(job)
+
+    async def stats(self) -> dict:
+        return {"backend": "memory", "ready": self.ready.qsize(), "delayed": len(self.delayed), "dead": len(self.dead)}
+
+
+class RedisJobQueue(BaseJobQueue):
+    """
+    Durable queue on Redis lists.
+
+    A taken job is atomically moved to the processing list of this consumer and removed from it only after
+    the handler has finished, so the jobs of a crashed pod are returned to the queue by the other consumers
+    (a consumer is considered dead when its heartbeat key expires).
+    """
+
+    # Reserves the idempotency key and queues the job (delayed if ARGV[3] is set), or does nothing if the key is taken
+    # (the key is set last: a script failing in the middle doesn't roll back the writes done before)
+    ENQUEUE_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return 0
+        end
+        if ARGV[3] then
+            redis.call('ZADD', KEYS[3], ARGV[3], ARGV[2])
+        else
+            redis.call('LPUSH', KEYS[2], ARGV[2])
+        end
+        redis.call('SET', KEYS[1], 'queued', 'EX', ARGV[1])
+        return 1
+    """
+
+    # Moves due delayed jobs to the ready list
+    PROMOTE_SCRIPT = """
+        local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+        for _, job in ipairs(jobs) do
+            redis.call('ZREM', KEYS[1], job)
+            redis.call('LPUSH', KEYS[2], job)
+        end
+        return #jobs
+    """
+
+    def __init__(self, redis: Redis, name: str, heartbeat_ttl: int = 30, **kwargs):
+        super().__init__(name, **kwargs)
+        self.redis = redis
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.heartbeat_ttl = heartbeat_ttl
+        self.ready_key = f"jobs:{name}:ready"
+        self.delayed_key = f"jobs:{name}:delayed"
+        self.dead_key = f"jobs:{name}:dead"
+        self.processing_key = self._processing_key(self.consumer_id)
+        self.enqueue_script = redis.register_script(self.ENQUEUE_SCRIPT)
+        self.promote_script = redis.register_script(self.PROMOTE_SCRIPT)
+        self.maintenance_task: asyncio.Task | None = None
+
+    def _processing_key(self, consumer_id: str) -> str:
+        return f"jobs:{self.name}:processing:{consumer_id}"
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f"jobs:{self.name}:consumer:{consumer_id}"
+
+    def _idempotency_key(self, key: str) -> str:
+        return f"jobs:{self.name}:key:{key}"
+
+    async def start(self) -> None:
+        await self._heartbeat()
+        self.maintenance_task = asyncio.create_task(self._maintenance(), name=f"{self.name}-maintenance")
+        await super().start()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        await super().stop(timeout)
+        if self.maintenance_task is not None:
+            self.maintenance_task.cancel()
+            await asyncio.gather(self.maintenance_task, return_exceptions=True)
+        # Whatever is left in progress goes back to the queue
+        await self._requeue_processing(self.consumer_id)
+        await self.redis.delete(self._heartbeat_key(self.consumer_id))
+
+    async def _maintenance(self) -> None:
+        while True:
+            try:
+                await self._heartbeat()
+                await self.promote_script(keys=[self.delayed_key, self.ready_key], args=[time.time()])
+                await self._recover_dead_consumers()
+            except RedisError as e:
+                logger.warning("Job queue %s: maintenance error: %s", self.name, e)
+            await asyncio.sleep(1)
+
+    async def _heartbeat(self) -> None:
+        await self.redis.set(self._heartbeat_key(self.consumer_id), 1, ex=self.heartbeat_ttl)
+
+    async def _recover_dead_consumers(self) -> None:
+        prefix = self._processing_key("")
+        async for key in self.redis.scan_iter(match=f"{prefix}*"):
+            consumer_id = key.decode().removeprefix(prefix)
+            if not await self.redis.exists(self._heartbeat_key(consumer_id)):
+                moved = await self._requeue_processing(consumer_id)
+                logger.warning("Job queue %s: consumer %s is gone, %s jobs requeued.", self.name, consumer_id, moved)
+
+    async def _requeue_processing(self, consumer_id: str) -> int:
+        moved = 0
+        while await self.redis.lmove(self._processing_key(consumer_id), self.ready_key, "RIGHT", "LEFT"):
+            moved += 1
+        return moved
+
+    async def _enqueue(self, job: Job, delay: float = 0) -> bool:
+        args = [self.idempotency_ttl, job.model_dump_json()]
+        if delay > 0:
+            args.append(time.time() + delay)
+        return bool(await self.enqueue_script(
+            keys=[self._idempotency_key(job.idempotency_key), self.ready_key, self.delayed_key], args=args))
+
+    async def _pop(self) -> Job | None:
+        raw = await self.redis.blmove(self.ready_key, self.processing_key, timeout=1, src="RIGHT", dest="LEFT")
+        if raw is None:
+            return None
+        job = Job.model_validate_json(raw)
+        job._raw = raw
+        return job
+
+    async def _ack(self, job: Job) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, job._raw)
+            pipe.set(self._idempotency_key(job.idempotency_key), "done", ex=self.idempotency_ttl)
+            await pipe.execute()
+
+    async def _retry_later(self, job: Job, delay: float) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, job._raw)
+            pipe.zadd(self.delayed_key, {job.model_dump_json(): time.time() + delay})
+            await pipe.execute()
+
+    async def _dead_letter(self, job: Job) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, job._raw)
+            pipe.lpush(self.dead_key, job.model_dump_json())
+            await pipe.execute()
+
+    async def stats(self) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.ready_key)
+            pipe.zcard(self.delayed_key)
+            pipe.llen(self.dead_key)
+            ready, delayed, dead = await pipe.execute()
+        return {"backend": "redis", "ready": ready, "delayed": delayed, "dead": dead}
+
+
+def create_job_queue(name: str, **kwargs) -> MemoryJobQueue | RedisJobQueue:
+    """
+    Creates a job queue for the backend selected by JOB_QUEUE_BACKEND ("redis" by default, or "memory").
+    """
+    if os.getenv("JOB_QUEUE_BACKEND", "redis") == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisJobQueue(redis, name, **kwargs)
+        logger.warning("JOB_QUEUE_BACKEND=redis, but REDIS_HOST is not set. Job queue %s is not durable.", name)
+    return MemoryJobQueue(name, **kwargs)
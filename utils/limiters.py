@@ -1,33 +1,59 @@
+import os
 import time
+import uuid
 import asyncio
 
 from collections import deque
 from datetime import timedelta
 
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from utils.logger import get_logger
+from utils.redis_client import get_redis
+
+logger = get_logger(__name__)
+
 
 class AsyncTokenBucketLimiter:
     def __init__(self, add_speed: float, rate: float):
         """
+        Tokens are reserved without a lock: a caller takes its token at once, possibly going into debt,
+        and sleeps until the debt is repaid. So the waiters are served in FIFO order and never overshoot.
+
         :param rate: Maximum number of tokens in a bucket.
         :param add_speed: Speed of adding tokens to the bucket in tokens per second.
         """
         self.rate = rate
         self.add_speed = add_speed
         self.tokens = rate
-        self.updated_at = asyncio.get_event_loop().time()
+        self.updated_at = time.monotonic()
 
-    async def wait_for_token(self, amount: int = 1):
-        while self.tokens < amount:
-            await self._add_tokens()
-            if self.tokens < amount:
-                sleep_time = (amount - self.tokens) / self.add_speed
-                await asyncio.sleep(sleep_time)
-            else:
-                break
+    def reserve(self, amount: int = 1) -> float:
+        """
+        :return: Time to wait before using the reserved tokens, in seconds.
+        """
+        self._add_tokens()
         self.tokens -= amount
+        return -self.tokens / self.add_speed if self.tokens < 0 else 0.0
+
+    async def wait_for_token(self, amount: int = 1):
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def acquire(self):
+        await self.wait_for_token()
+
+    def is_idle(self) -> bool:
+        """
+        :return: The bucket is full again, it can be dropped and recreated without changing the limit.
+        """
+        self._add_tokens()
+        return self.tokens >= self.rate
 
-    async def _add_tokens(self):
-        now = asyncio.get_event_loop().time()
+    def _add_tokens(self):
+        now = time.monotonic()
         elapsed = now - self.updated_at
         self.updated_at = now
         self.tokens = min(self.tokens + elapsed * self.add_speed, self.rate)
@@ -61,3 +87,132 @@ class AsyncSlidingWindowLimiter:
                 now = time.monotonic()  # After waiting, update the current time and continue the loop
 
             self.timestamps.append(now)  # Add a timestamp for the current operation
+
+
+class AsyncReservationLimiter:
+    def __init__(self,
+                 rate: int = 5,
+                 period: timedelta = timedelta(seconds=1)):
+        """
+        Sliding window limiter that reserves a slot for every caller instead of sleeping under a lock.
+
+        The slot is computed synchronously (no awaits between reading and updating the window), so callers
+        are served in FIFO order and every waiter sleeps concurrently until its own slot.
+        A cancelled waiter keeps its slot, which can only make the limiter stricter, never looser.
+
+        :param rate: Maximum number of transactions per period. Default 5.
+        :param period: Duration of the period in seconds. Default 1.
+        """
+        self.rate = rate
+        self.period = period.total_seconds()
+        self.timestamps = deque()  # Reserved slots, ascending (may be in the future)
+
+    def reserve(self) -> float:
+        """
+        Reserves the next free slot.
+
+        :return: Delay in seconds until the reserved slot.
+        """
+        now = time.monotonic()
+
+        # Slots that left the window no longer affect anyone
+        while self.timestamps and now - self.timestamps[0] >= self.period:
+            self.timestamps.popleft()
+
+        slot = now
+        if self.timestamps:
+            slot = max(slot, self.timestamps[-1])  # Keep FIFO order
+        if len(self.timestamps) >= self.rate:
+            slot = max(slot, self.timestamps[-self.rate] + self.period)
+
+        self.timestamps.append(slot)
+        return slot - now
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RedisSlidingWindowLimiter:
+    # Same slot reservation as AsyncReservationLimiter, but the window lives in a Redis sorted set,
+    # so all replicas share it. Time is taken from Redis to avoid clock skew between pods.
+    SCRIPT = """
+        local now_parts = redis.call('TIME')
+        local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+        local rate = tonumber(ARGV[1])
+        local period = tonumber(ARGV[2])
+
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - period)
+
+        local slot = now
+        local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+        if last[2] then
+            slot = math.max(slot, tonumber(last[2]))
+        end
+        if redis.call('ZCARD', KEYS[1]) >= rate then
+            local oldest = redis.call('ZRANGE', KEYS[1], -rate, -rate, 'WITHSCORES')
+            slot = math.max(slot, tonumber(oldest[2]) + period)
+        end
+
+        redis.call('ZADD', KEYS[1], slot, ARGV[3])
+        redis.call('PEXPIRE', KEYS[1], math.ceil((slot - now + period) * 1000))
+        return tostring(slot - now)
+    """
+
+    def __init__(self,
+                 redis: Redis,
+                 key: str,
+                 rate: int = 5,
+                 period: timedelta = timedelta(seconds=1)):
+        """
+        :param redis: Redis client.
+        :param key: Name of the shared window (one per upstream API).
+        :param rate: Maximum number of transactions per period. Default 5.
+        :param period: Duration of the period in seconds. Default 1.
+        """
+        self.redis = redis
+        self.key = f"limiter:{key}"
+        self.rate = rate
+        self.period = period.total_seconds()
+        self.script = redis.register_script(self.SCRIPT)
+        self.fallback = AsyncReservationLimiter(rate=rate, period=period)
+        self.is_degraded = False
+
+    async def reserve(self) -> float:
+        delay = await self.script(keys=[self.key], args=[self.rate, self.period, uuid.uuid4().hex])
+        return float(delay)
+
+    async def acquire(self):
+        try:
+            delay = await self.reserve()
+        except RedisError as e:
+            # Redis is unavailable: keep limiting locally instead of failing the request
+            if not self.is_degraded:
+                logger.warning("Limiter %s: Redis error (%s), falling back to the in-memory limiter.", self.key, e)
+                self.is_degraded = True
+            await self.fallback.acquire()
+            return
+
+        if self.is_degraded:
+            logger.info("Limiter %s: Redis is available again.", self.key)
+            self.is_degraded = False
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def create_limiter(name: str,
+                   rate: int = 5,
+                   period: timedelta = timedelta(seconds=1)) -> AsyncReservationLimiter | RedisSlidingWindowLimiter:
+    """
+    Creates a limiter for the backend selected by RATE_LIMITER_BACKEND ("memory" or "redis").
+
+    :param name: Name of the upstream API, used as the shared window key.
+    """
+    if os.getenv("RATE_LIMITER_BACKEND", "memory") == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisSlidingWindowLimiter(redis, key=name, rate=rate, period=period)
+        logger.warning("RATE_LIMITER_BACKEND=redis, but REDIS_HOST is not set. Limiter %s is in-memory.", name)
+    return AsyncReservationLimiter(rate=rate, period=period)
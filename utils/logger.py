@@ -1,18 +1,171 @@
+import os
+import re
+import sys
+import copy
+import json
+import uuid
+import atexit
+import random
 import logging
+import contextvars
+
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))  # Share of DEBUG records kept
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# An incoming id is trusted only in this form: it goes into every log line and back into the response header
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+# Correlation id of the current request, update or job. Copied into every task spawned while it's set.
+request_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+_listener: QueueListener | None = None
+
+
+class ContextFilter(logging.Filter):
+    """
+    Adds the correlation id (and the trace id, if tracing is on) to the record.
+    Runs in the logging task, not in the listener thread, so it sees the caller's context.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.trace_id = _get_trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a share of DEBUG records, the other levels always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Hands records over to the listener thread, so the event loop never blocks on stdout.
+    Only the message is merged here, the formatting itself happens in the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            # Tracebacks hold frames, which must not cross the thread boundary
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"[{request_id}] {line}" if request_id else line
+
+
+def setup_logging() -> None:
+    """
+    Routes all records through one queue to a single stdout handler in a background thread.
+    Called by get_logger, so it's enough to import any module of the app.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    queue_handler = AsyncQueueHandler(SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    _listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flushes the records still in the queue
 
 
 def get_logger(name: str):
+    setup_logging()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
+    return logger
 
-    # Обработчик, который выводит сообщения в stdout
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
-    )
-    handler.setFormatter(formatter)
 
-    if not logger.handlers:
-        logger.addHandler(handler)
+def new_request_id() -> str:
+    return uuid.uuid4().hex
 
-    return logger
+
+class CorrelationIdMiddleware:
+    """
+    ASGI middleware setting the request correlation id: the incoming X-Request-ID or a new one,
+    if the header is missing or doesn't match REQUEST_ID_PATTERN (too long, spaces, control characters).
+    The id is returned in the response header and added to every log record of the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = REQUEST_ID_HEADER.lower().encode("latin-1")
+        request_id = next((value.decode("latin-1") for key, value in scope["headers"] if key == header), None)
+        if request_id is None or not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((header, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
+def _get_trace_id() -> str | None:
+    # Looked up lazily: utils.tracing itself logs through this module
+    tracing = sys.modules.get("utils.tracing")
+    get_trace_id = getattr(tracing, "get_trace_id", None)
+    return get_trace_id() if get_trace_id is not None else None
@@ -0,0 +1,244 @@
+import os
+import time
+
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from utils.logger import get_logger
+from utils.redis_client import get_redis
+
+logger = get_logger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def split_message(lines: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT, separator: str = "\n") -> list[str]:
+    """
+    Joins the lines into as few messages as possible, none longer than the limit.
+    A line longer than the limit is cut into pieces.
+    """
+    messages, current = [], ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + len(separator) + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}{separator}{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class MemoryDigestBuffer:
+    """
+    Notifications waiting for their digest, kept in the process: lost on restart.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        """
+        :param max_size: Oldest notifications are dropped above this size (e.g. while the chat is unreachable).
+        """
+        self.max_size = max_size
+        self.items: list[str] = []
+        self.claims: dict[str, list[str]] = {}
+
+    async def push(self, text: str) -> tuple[int, int]:
+        """
+        :return: Buffer size after the push and the number of the oldest notifications dropped.
+        """
+        self.items.append(text)
+        dropped = max(len(self.items) - self.max_size, 0)
+        del self.items[:dropped]
+        return len(self.items), dropped
+
+    async def claim(self, claim_id: str) -> list[str]:
+        """
+        Takes all the buffered notifications for sending. A claim which hasn't been released
+        (its flush has crashed) is returned again as is.
+        """
+        if claim_id not in self.claims and self.items:
+            self.claims[claim_id], self.items = self.items, []
+        return self.claims.get(claim_id, [])
+
+    async def release(self, claim_id: str, unsent: list[str]) -> None:
+        """
+        Ends the claim, the unsent notifications go back in front of the ones pushed meanwhile.
+        """
+        self.claims.pop(claim_id, None)
+        self.items[:0] = unsent
+
+    async def size(self) -> int:
+        return len(self.items)
+
+
+class RedisDigestBuffer:
+    # Moves the buffer to the claim list, unless the claim is still there after a crashed flush
+    CLAIM_SCRIPT = """
+        local items = redis.call('LRANGE', KEYS[2], 0, -1)
+        if #items > 0 then
+            return items
+        end
+        items = redis.call('LRANGE', KEYS[1], 0, -1)
+        if #items > 0 then
+            redis.call('RENAME', KEYS[1], KEYS[2])
+        end
+        return items
+    """
+    RELEASE_SCRIPT = """
+        for i = #ARGV, 1, -1 do
+            redis.call('LPUSH', KEYS[1], ARGV[i])
+        end
+        redis.call('DEL', KEYS[2])
+        return #ARGV
+    """
+
+    def __init__(self, redis: Redis, name: str, max_size: int = 10_000):
+        """
+        Notifications waiting for their digest in a Redis list: they survive restarts until the flush job sends them.
+        """
+        self.redis = redis
+        self.max_size = max_size
+        self.key = f"digest:{name}"
+        self.claim_script = redis.register_script(self.CLAIM_SCRIPT)
+        self.release_script = redis.register_script(self.RELEASE_SCRIPT)
+
+    def _claim_key(self, claim_id: str) -> str:
+        return f"{self.key}:claim:{claim_id}"
+
+    async def push(self, text: str) -> tuple[int, int]:
+        """
+        :return: Buffer size after the push and the number of the oldest notifications dropped.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(self.key, text)
+            pipe.ltrim(self.key, -self.max_size, -1)
+            size, _ = await pipe.execute()
+        return min(size, self.max_size), max(size - self.max_size, 0)
+
+    async def claim(self, claim_id: str) -> list[str]:
+        """
+        Takes all the buffered notifications for sending. A claim which hasn't been released
+        (its flush has crashed) is returned again as is.
+        """
+        items = await self.claim_script(keys=[self.key, self._claim_key(claim_id)])
+        return [item.decode() for item in items]
+
+    async def release(self, claim_id: str, unsent: list[str]) -> None:
+        """
+        Ends the claim, the unsent notifications go back in front of the ones pushed meanwhile.
+        """
+        await self.release_script(keys=[self.key, self._claim_key(claim_id)], args=unsent)
+
+    async def size(self) -> int:
+        return await self.redis.llen(self.key)
+
+
+class MessageDigest:
+    def __init__(self,
+                 send: Callable[[str], Awaitable],
+                 buffer: MemoryDigestBuffer | RedisDigestBuffer,
+                 window: float = 10.0,
+                 max_items: int = 50,
+                 limit: int = TELEGRAM_MESSAGE_LIMIT):
+        """
+        Coalesces short notifications: they are buffered and sent as few combined messages by the flushes,
+        one per `window` seconds or as soon as `max_items` are collected. The flushes are scheduled
+        by the caller (as jobs), so a notification stays in the buffer until it's sent.
+
+        :param send: Sends one combined message.
+        :param limit: Maximum length of one message.
+        """
+        self.send = send
+        self.buffer = buffer
+        self.window = window
+        self.max_items = max_items
+        self.limit = limit
+
+        self.sent_items = 0
+        self.sent_messages = 0
+        self.dropped_items = 0
+        self.last_flush_at: float | None = None
+
+    async def add(self, text: str) -> bool:
+        """
+        Buffers the notification, doesn't send it.
+
+        :return: True if `max_items` more notifications have been collected and a flush is due now.
+        """
+        size, dropped = await self.buffer.push(text)
+        if dropped:
+            self.dropped_items += dropped
+            logger.warning("Digest buffer is full, %s oldest notifications dropped.", dropped)
+        return size % self.max_items == 0
+
+    def get_window_id(self) -> str:
+        """
+        :return: Id of the current window, for the flush closing it.
+        """
+        return f"window:{int(time.time() // self.window)}"
+
+    async def flush(self, claim_id: str) -> None:
+        """
+        Sends everything buffered.
+
+        :param claim_id: Unique for the flush. A repeated flush with the same id sends the notifications
+                         claimed by the previous one if it has crashed in the middle.
+        :raises Exception: A message failed, its notifications and the following ones are back in the buffer.
+        """
+        items = await self.buffer.claim(claim_id)
+        if not items:
+            return
+
+        messages = split_message(items, self.limit)
+        sent_lines = 0
+        try:
+            for message in messages:
+                await self.send(message)
+                sent_lines += message.count("\n") + 1
+                self.sent_messages += 1
+        except Exception as e:
+            # The unsent notifications go back in front of the ones added meanwhile
+            unsent = self._unsent_items(items, sent_lines)
+            await self.buffer.release(claim_id, unsent)
+            self.sent_items += len(items) - len(unsent)
+            logger.error("Digest flush failed, %s notifications kept for the next one: %s", len(unsent), e)
+            raise
+        else:
+            await self.buffer.release(claim_id, [])
+            self.sent_items += len(items)
+        finally:
+            self.last_flush_at = time.time()
+
+    async def stats(self) -> dict:
+        return {
+            "buffered": await self.buffer.size(),
+            "sent_items": self.sent_items,
+            "sent_messages": self.sent_messages,
+            "dropped_items": self.dropped_items,
+            "last_flush_at": self.last_flush_at,
+        }
+
+    def _unsent_items(self, items: list[str], sent_lines: int) -> list[str]:
+        # Lines of the sent messages map 1:1 to the items, unless an item was cut or contained line breaks.
+        # Otherwise everything is kept: a repeated notification is better than a lost one.
+        if all("\n" not in item and len(item) <= self.limit for item in items):
+            return items[sent_lines:]
+        return items
+
+
+def create_digest_buffer(name: str, max_size: int = 10_000) -> MemoryDigestBuffer | RedisDigestBuffer:
+    """
+    Creates a digest buffer as durable as the flush jobs: in Redis for JOB_QUEUE_BACKEND=redis (the default).
+    """
+    if os.getenv("JOB_QUEUE_BACKEND", "redis") == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisDigestBuffer(redis, name, max_size=max_size)
+        logger.warning("JOB_QUEUE_BACKEND=redis, but REDIS_HOST is not set. Digest %s is not durable.", name)
+    return MemoryDigestBuffer(max_size=max_size)
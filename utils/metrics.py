@@ -0,0 +1,150 @@
+import re
+import time
+
+from urllib.parse import urlsplit
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_seconds",
+    "Duration of requests to upstream APIs (one attempt).",
+    ["upstream", "method", "endpoint", "status"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retried requests to upstream APIs.",
+    ["upstream", "reason"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_in_flight_requests",
+    "Requests to upstream APIs waiting for a response.",
+    ["upstream"],
+)
+LIMITER_WAIT_SECONDS = Histogram(
+    "limiter_wait_seconds",
+    "Time spent waiting for the rate limiter.",
+    ["upstream"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LIMITER_QUEUE_DEPTH = Gauge(
+    "limiter_queue_depth",
+    "Callers currently waiting for the rate limiter.",
+    ["upstream"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Duration of incoming HTTP requests.",
+    ["method", "route", "status"],
+)
+TELEGRAM_UPDATES = Counter(
+    "telegram_updates_total",
+    "Incoming Telegram updates by webhook result.",
+    ["result"],
+)
+TELEGRAM_UPDATE_QUEUE_DEPTH = Gauge(
+    "telegram_update_queue_depth",
+    "Telegram updates waiting for a worker.",
+)
+TELEGRAM_UPDATE_SECONDS = Histogram(
+    "telegram_update_processing_seconds",
+    "Duration of Telegram update handling.",
+)
+TELEGRAM_SEND_WAIT_SECONDS = Histogram(
+    "telegram_send_wait_seconds",
+    "Time an outbound Telegram message waited for the chat and global limits.",
+)
+TELEGRAM_RETRY_AFTER = Counter(
+    "telegram_retry_after_total",
+    "Outbound Telegram messages rescheduled after a 429 with retry_after.",
+)
+BLOCKED_SCAN_USERS = Counter(
+    "blocked_scan_users_total",
+    "Blocked Leader-ID users found by the bulk scan, by notification category and result.",
+    ["category", "result"],
+)
+USEDESK_INGEST_TICKETS = Counter(
+    "usedesk_ingest_tickets_total",
+    "Usedesk tickets ingested by polling, by reactivation result.",
+    ["status"],
+)
+USEDESK_INGEST_LAG_SECONDS = Histogram(
+    "usedesk_ingest_lag_seconds",
+    "Time from the Usedesk ticket creation till it is processed by the ingestion.",
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600),
+)
+USEDESK_INGEST_POLL_AGE_SECONDS = Gauge(
+    "usedesk_ingest_poll_age_seconds",
+    "Seconds since the last successful Usedesk ingestion poll.",
+)
+CIRCUIT_BREAKER_OPEN = Gauge(
+    "circuit_breaker_open",
+    "1 if the upstream circuit breaker is open or half-open.",
+    ["upstream"],
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "http_pool_connections",
+    "Connections in the upstream HTTP pool.",
+    ["upstream", "state"],
+)
+
+_ID_RE = re.compile(r"/\d+(?=/|$)")
+_BOT_TOKEN_RE = re.compile(r"^/bot[^/]+")
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    """
+    Endpoint label with a bounded cardinality: no query string, no ids and no Telegram bot token.
+    """
+    path = urlsplit(endpoint).path or "/"
+    path = _BOT_TOKEN_RE.sub("/bot{token}", path)
+    return _ID_RE.sub("/{id}", path)
+
+
+def collect_app_state(state) -> None:
+    """
+    Refreshes the gauges that are read from the application state rather than updated on every event.
+    """
+    for api_client in getattr(state, "api_clients", []):
+        CIRCUIT_BREAKER_OPEN.labels(api_client.name).set(int(api_client.circuit_breaker.state != "closed"))
+        pool_stats = api_client.pool_stats()
+        for pool_state in ("active", "idle"):
+            HTTP_POOL_CONNECTIONS.labels(api_client.name, pool_state).set(pool_stats.get(pool_state, 0))
+
+    usedesk_ingestion = getattr(state, "usedesk_ingestion", None)
+    if usedesk_ingestion is not None and usedesk_ingestion.last_poll_at is not None:
+        USEDESK_INGEST_POLL_AGE_SECONDS.set(time.time() - usedesk_ingestion.last_poll_at)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task or body buffering) measuring the incoming HTTP requests.
+    The route label is the route template, so path parameters don't create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route_path, status).observe(time.perf_counter() - started)
@@ -0,0 +1,18 @@
+import os
+
+from redis.asyncio import Redis
+
+_redis: Redis | None = None
+
+
+def get_redis() -> Redis | None:
+    """
+    Shared Redis connection pool of the process (FSM storage, limiters, etc.).
+
+    :return: None if REDIS_HOST is not configured.
+    """
+    global _redis
+    redis_host = os.getenv('REDIS_HOST')
+    if _redis is None and redis_host:
+        _redis = Redis(host=redis_host)
+    return _redis
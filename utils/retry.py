@@ -0,0 +1,58 @@
+import time
+import random
+import dataclasses
+
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    """
+    :param attempts: Maximum number of calls, including the first one.
+    :param base_delay: Backoff base in seconds, the delay before retry N is random in [0, base_delay * 2 ** (N - 1)].
+    :param max_delay: Upper bound of the backoff delay in seconds.
+    :param deadline: Overall time budget in seconds for all attempts. A retry that can't start in time isn't made.
+    :param retry_statuses: Response statuses worth retrying. Other 4xx will fail the same way again.
+    :param max_retry_after: Upper bound of a server-provided Retry-After in seconds.
+    """
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    deadline: float | None = 60.0
+    retry_statuses: frozenset[int] = frozenset({408, 425, 429, 500, 502, 503, 504})
+    max_retry_after: float = 60.0
+
+    def replace(self, **changes) -> "RetryPolicy":
+        return dataclasses.replace(self, **changes)
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in self.retry_statuses
+        return isinstance(exc, httpx.TransportError)
+
+    def get_delay(self, attempt: int, exc: Exception) -> float:
+        """
+        :param attempt: Number of the failed attempt (1-based).
+        """
+        if isinstance(exc, httpx.HTTPStatusError):
+            retry_after = self.get_retry_after(exc.response)
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+
+        # Exponential backoff with full jitter, so clients don't retry in sync
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def get_retry_after(self, response: httpx.Response) -> float | None:
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Awaitable, Callable, TypeVar
+
+from utils.limiters import AsyncTokenBucketLimiter, create_limiter
+from utils.logger import get_logger
+from utils.metrics import TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_WAIT_SECONDS
+
+logger = get_logger(__name__)
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_GLOBAL_RATE = int(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # Messages per second, all chats together
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))  # Messages per second to one private chat
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20))  # Messages per minute to one group or channel
+TELEGRAM_SEND_ATTEMPTS = int(os.getenv("TELEGRAM_SEND_ATTEMPTS", 5))
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", 300))
+
+T = TypeVar("T")
+
+
+class TelegramDispatcher:
+    def __init__(self,
+                 global_rate: int = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE,
+                 group_rate: float = TELEGRAM_GROUP_RATE,
+                 max_attempts: int = TELEGRAM_SEND_ATTEMPTS,
+                 max_retry_after: float = TELEGRAM_MAX_RETRY_AFTER,
+                 max_chats: int = 10_000):
+        """
+        Outbound Telegram messages of one bot: shared by TelegramAPIClient and the aiogram Bot session.
+
+        Every message waits for a token of its chat bucket (private chats and groups have different limits)
+        and of the global limiter (shared in Redis with RATE_LIMITER_BACKEND=redis).
+        A 429 with retry_after pauses only that chat, the message is rescheduled after the pause.
+
+        :param chat_rate: Messages per second to a private chat.
+        :param group_rate: Messages per minute to a group or channel.
+        :param max_chats: Idle chat buckets are dropped above this number.
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_attempts = max_attempts
+        self.max_retry_after = max_retry_after
+        self.max_chats = max_chats
+
+        self.global_limiter = create_limiter(name="telegram", rate=global_rate, period=timedelta(seconds=1))
+        self.chat_buckets: OrderedDict[str, AsyncTokenBucketLimiter] = OrderedDict()
+        self.paused_until: dict[str, float] = {}
+
+        self.sent = 0
+        self.retried = 0
+
+    async def acquire(self, chat_id: int | str, acquire_global: bool = True) -> None:
+        """
+        Waits until a message can be sent to the chat.
+
+        :param acquire_global: False if the caller takes the global limiter itself (TelegramAPIClient does).
+        """
+        chat_id = str(chat_id)  # Same chat from the env (str) and from aiogram (int)
+        started = time.perf_counter()
+        while (pause := self.paused_until.get(chat_id, 0) - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        self.paused_until.pop(chat_id, None)
+
+        await self._get_bucket(chat_id).acquire()
+        if acquire_global:
+            await self.global_limiter.acquire()
+        TELEGRAM_SEND_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def pause(self, chat_id: int | str, retry_after: float) -> None:
+        chat_id = str(chat_id)
+        retry_after = min(retry_after, self.max_retry_after)
+        self.paused_until[chat_id] = max(self.paused_until.get(chat_id, 0), time.monotonic() + retry_after)
+
+    async def send(self,
+                   chat_id: int | str,
+                   call: Callable[[], Awaitable[T]],
+                   get_retry_after: Callable[[Exception], float | None],
+                   acquire_global: bool = True) -> T:
+        """
+        Makes the call within the chat limits, repeating it after every 429.
+
+        :param call: Sends the message, called once per attempt.
+        :param get_retry_after: retry_after of a 429 error, None for any other error (it's raised as is).
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            await self.acquire(chat_id, acquire_global)
+            try:
+                result = await call()
+            except Exception as exc:
+                retry_after = get_retry_after(exc)
+                if retry_after is None or attempt >= self.max_attempts:
+                    raise
+                self.pause(chat_id, retry_after)
+                self.retried += 1
+                TELEGRAM_RETRY_AFTER.inc()
+                logger.warning("Telegram flood control in chat %s, retry in %ss (attempt %s).",
+                               chat_id, retry_after, attempt)
+                continue
+            self.sent += 1
+            return result
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "chats": len(self.chat_buckets),
+            "paused_chats": sum(1 for until in self.paused_until.values() if until > now),
+        }
+
+    def _get_bucket(self, chat_id: str) -> AsyncTokenBucketLimiter:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._create_bucket(chat_id)
+            self.chat_buckets[chat_id] = bucket
+            self._evict_idle_buckets()
+        else:
+            self.chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _create_bucket(self, chat_id: str) -> AsyncTokenBucketLimiter:
+        # No bursts: a full bucket of N tokens would let N extra messages into the same minute
+        if self.is_group(chat_id):
+            return AsyncTokenBucketLimiter(add_speed=self.group_rate / 60, rate=1)
+        return AsyncTokenBucketLimiter(add_speed=self.chat_rate, rate=1)
+
+    def _evict_idle_buckets(self) -> None:
+        # Least recently used first; a bucket which isn't full yet still holds the limit and is kept,
+        # so is the bucket just created for the current message
+        for chat_id in list(self.chat_buckets)[:-1]:
+            if len(self.chat_buckets) <= self.max_chats:
+                break
+            if self.chat_buckets[chat_id].is_idle():
+                del self.chat_buckets[chat_id]
+
+    @staticmethod
+    def is_group(chat_id: int | str) -> bool:
+        # Group, supergroup and channel ids are negative, channels can also be addressed by @username
+        if isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit():
+            return True
+        return int(chat_id) < 0
@@ -0,0 +1,91 @@
+import time
+
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, Template, select_autoescape
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TemplateNotFoundException(Exception):
+    def __init__(self, kind: str, locale: str):
+        self.kind = kind
+        self.locale = locale
+        super().__init__(f"Template '{kind}' for locale '{locale}' not found.")
+
+
+class TemplateRegistry:
+    def __init__(self,
+                 path: Path,
+                 default_locale: str = "ru",
+                 bytecode_cache_dir: str | None = None):
+        """
+        Templates laid out as <path>/<locale>/<kind>.html, compiled once on load().
+        Files starting with "_" are partials (layouts, includes) and aren't registered as kinds.
+        Variables a template sets at the top level ({% set min_age = 18 %}) are its metadata, see get_meta().
+
+        :param default_locale: Locale used when a template is missing for the requested one.
+        :param bytecode_cache_dir: Directory for the Jinja2 bytecode cache, speeds up load() after restarts.
+        """
+        self.path = path
+        self.default_locale = default_locale
+        self.env = Environment(
+            loader=FileSystemLoader(path),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,  # Keeps the line break after an included partial
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir) if bytecode_cache_dir else None,
+        )
+        self.templates: dict[tuple[str, str], Template] = {}
+        self.meta: dict[tuple[str, str], dict] = {}
+        self.render_count = 0
+        self.render_seconds = 0.0
+
+    def load(self) -> None:
+        templates, meta = {}, {}
+        for name in self.env.list_templates(extensions=["html"]):
+            locale, _, file_name = name.rpartition("/")
+            if not locale or file_name.startswith("_"):
+                continue
+            key = (file_name.removesuffix(".html"), locale)
+            templates[key] = self.env.get_template(name)
+            meta[key] = {var: value for var, value in vars(templates[key].module).items() if not var.startswith("_")}
+        self.templates = templates
+        self.meta = meta
+        logger.info("%s templates loaded from %s.", len(templates), self.path)
+
+    def _get_key(self, kind: str, locale: str | None) -> tuple[str, str]:
+        locale = locale or self.default_locale
+        for key in ((kind, locale), (kind, self.default_locale)):
+            if key in self.templates:
+                return key
+        raise TemplateNotFoundException(kind, locale)
+
+    def render(self, kind: str, locale: str | None = None, **context) -> str:
+        template = self.templates[self._get_key(kind, locale)]
+
+        started = time.perf_counter()
+        text = template.render(**context).strip()
+        self.render_seconds += time.perf_counter() - started
+        self.render_count += 1
+        return text
+
+    def get_meta(self, kind: str, locale: str | None = None) -> dict:
+        """
+        :return: Top-level variables of the template, with the same locale fallback as render().
+        """
+        return self.meta[self._get_key(kind, locale)]
+
+    def kinds(self) -> list[str]:
+        return sorted({kind for kind, _ in self.templates})
+
+    def stats(self) -> dict:
+        return {
+            "templates": len(self.templates),
+            "renders": self.render_count,
+            "avg_render_ms": round(self.render_seconds / self.render_count * 1000, 3) if self.render_count else 0,
+        }
@@ -0,0 +1,153 @@
+import os
+import functools
+import contextlib
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# off | console | file | otlp
+OTEL_TRACING = os.getenv("OTEL_TRACING", "off")
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "leader-bot")
+
+try:
+    from opentelemetry import trace, propagate, context
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:
+    trace = None
+
+_tracer = None
+
+
+def setup_tracing() -> None:
+    """
+    Enables tracing according to OTEL_TRACING. Does nothing if it's "off" or OpenTelemetry (or the OTLP exporter
+    for "otlp") isn't installed, all the helpers below are no-ops then.
+    """
+    global _tracer
+    if OTEL_TRACING == "off" or _tracer is not None:
+        return
+    if trace is None:
+        logger.warning("OTEL_TRACING=%s, but opentelemetry-sdk is not installed. Tracing is off.", OTEL_TRACING)
+        return
+
+    if OTEL_TRACING == "otlp":
+        # Configured by the standard OTEL_EXPORTER_OTLP_* variables
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTEL_TRACING=otlp, but opentelemetry-exporter-otlp-proto-http is not installed. "
+                           "Tracing is off.")
+            return
+        exporter = OTLPSpanExporter()
+    elif OTEL_TRACING == "file":
+        exporter = ConsoleSpanExporter(out=open(OTEL_TRACES_FILE, "a", encoding="utf-8"),
+                                       formatter=lambda span: span.to_json(indent=None) + "\n")
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("leader_bot")
+    logger.info("Tracing is on (%s).", OTEL_TRACING)
+
+
+def shutdown_tracing() -> None:
+    if _tracer is not None:
+        trace.get_tracer_provider().shutdown()
+
+
+def start_span(name: str, **attributes):
+    """
+    Context manager of a new span, a child of the current one.
+    """
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attributes.items() if v is not None})
+
+
+def traced(name: str | None = None):
+    """
+    Decorator wrapping a coroutine function into a span.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return await func(*args, **kwargs)
+            with _tracer.start_as_current_span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_trace_id() -> str | None:
+    """
+    :return: Id of the current trace, added to the log records.
+    """
+    if _tracer is None:
+        return None
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.is_valid else None
+
+
+def inject_context(carrier: dict | None = None) -> dict:
+    """
+    Adds the current trace context (W3C traceparent) to outgoing headers or a job payload.
+    """
+    carrier = dict(carrier or {})
+    if _tracer is not None:
+        propagate.inject(carrier)
+    return carrier
+
+
+@contextlib.contextmanager
+def use_context(carrier: dict | None):
+    """
+    Makes the trace context received in headers or a job payload the current one.
+    """
+    if _tracer is None or not carrier:
+        yield
+        return
+    token = context.attach(propagate.extract(carrier))
+    try:
+        yield
+    finally:
+        context.detach(token)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a server span per incoming HTTP request, continuing the caller's trace if any.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        with use_context(headers):
+            with _tracer.start_as_current_span(f"{scope['method']} {scope['path']}",
+                                               kind=trace.SpanKind.SERVER) as span:
+                async def send_wrapper(message):
+                    if message["type"] == "http.response.start":
+                        span.set_attribute("http.status_code", message["status"])
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
+                # The route template is known only after routing, it's a better span name than the raw path
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route.path}")